@@ -16,6 +16,10 @@ import models
 # access to the values within the .ini file in use.
 config = context.config
 
+# Migrate the same database the app is configured for
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
@@ -27,6 +31,18 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Leave out the full-text search tables (search.py), which are created
+    outside the models: changes_fts and its FTS5 shadow tables; and the
+    variant of each keyset index (models.keyset_index) meant for the other
+    kind of database."""
+    if type_ == "index" and not reflected and "postgresql" in obj.info:
+        return obj.info["postgresql"] == (context.get_context().dialect.name == "postgresql")
+    return not (type_ == "table" and reflected and compare_to is None and name.startswith("changes_fts"))
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -53,6 +69,7 @@ def run_migrations_offline() -> None:
         dialect_opts={"paramstyle": "named"},
         compare_type=True,
         compare_server_default=True,
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -82,6 +99,7 @@ def run_migrations_online() -> None:
             compare_type=True,
             compare_server_default=True,
             render_as_batch=render_as_batch,
+            include_object=include_object,
         )
 
         with context.begin_transaction():
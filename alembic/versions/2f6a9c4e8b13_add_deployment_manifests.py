@@ -0,0 +1,52 @@
+"""add deployment manifests
+
+Revision ID: 2f6a9c4e8b13
+Revises: 8d3f1b6a2c57
+Create Date: 2026-10-17 17:21:48.209315
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6a9c4e8b13'
+down_revision: Union[str, Sequence[str], None] = '8d3f1b6a2c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Existing deployments are left with manifest_at NULL; fill their
+    manifests in with ``python manifests.py``.
+    """
+    op.create_table(
+        'deployment_changes',
+        sa.Column('deployment_id', sa.Integer(), nullable=False),
+        sa.Column('change_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['change_id'], ['changes.id'], name='fk_deployment_changes_change_id'),
+        sa.ForeignKeyConstraint(['deployment_id'], ['deployments.id'], name='fk_deployment_changes_deployment_id'),
+        sa.PrimaryKeyConstraint('deployment_id', 'change_id'),
+    )
+    op.create_index('ix_deployment_changes_change_id', 'deployment_changes', ['change_id'], unique=False)
+    with op.batch_alter_table('deployments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('manifest_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_deployments_app_dtt_deploy_id', ['app', 'dtt_deploy', 'id'], unique=False)
+
+    table_versions = sa.table('table_versions', sa.column('name'), sa.column('version'), sa.column('updated_at'))
+    op.bulk_insert(table_versions, [{'name': 'deployment_changes', 'version': 0, 'updated_at': datetime.utcnow()}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM table_versions WHERE name = 'deployment_changes'")
+    with op.batch_alter_table('deployments', schema=None) as batch_op:
+        batch_op.drop_index('ix_deployments_app_dtt_deploy_id')
+        batch_op.drop_column('manifest_at')
+    op.drop_index('ix_deployment_changes_change_id', table_name='deployment_changes')
+    op.drop_table('deployment_changes')
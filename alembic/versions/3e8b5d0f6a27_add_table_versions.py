@@ -0,0 +1,40 @@
+"""add table versions
+
+Revision ID: 3e8b5d0f6a27
+Revises: 9a4f3e7c2b15
+Create Date: 2026-10-17 11:26:03.551904
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e8b5d0f6a27'
+down_revision: Union[str, Sequence[str], None] = '9a4f3e7c2b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    table_versions = op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    now = datetime.utcnow()
+    op.bulk_insert(table_versions, [
+        {'name': name, 'version': 0, 'updated_at': now}
+        for name in ('apps', 'milestones', 'versions', 'deployments', 'changes')
+    ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('table_versions')
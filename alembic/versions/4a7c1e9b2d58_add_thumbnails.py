@@ -0,0 +1,48 @@
+"""add thumbnails
+
+Revision ID: 4a7c1e9b2d58
+Revises: 7b1e4d9c3a68
+Create Date: 2026-10-17 21:06:44.190327
+
+"""
+import os
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a7c1e9b2d58'
+down_revision: Union[str, Sequence[str], None] = '7b1e4d9c3a68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# uploads.THUMB_DIR, relative to the working directory the app runs in
+THUMB_DIR = os.path.join('static', 'images', 'thumbs')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    thumbnails = op.create_table(
+        'thumbnails',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    now = datetime.utcnow()
+    # Thumbnails generated before they were recorded
+    if os.path.isdir(THUMB_DIR):
+        names = [name for name in os.listdir(THUMB_DIR) if not name.startswith('.')]
+        if names:
+            op.bulk_insert(thumbnails, [{'name': name, 'created_at': now} for name in names])
+
+    table_versions = sa.table('table_versions', sa.column('name'), sa.column('version'), sa.column('updated_at'))
+    op.bulk_insert(table_versions, [{'name': 'thumbnails', 'version': 0, 'updated_at': now}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM table_versions WHERE name = 'thumbnails'")
+    op.drop_table('thumbnails')
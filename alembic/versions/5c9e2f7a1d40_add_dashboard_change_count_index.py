@@ -0,0 +1,28 @@
+"""add dashboard change count index
+
+Revision ID: 5c9e2f7a1d40
+Revises: b7d21c4e9f03
+Create Date: 2026-10-17 13:21:40.512093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c9e2f7a1d40'
+down_revision: Union[str, Sequence[str], None] = 'b7d21c4e9f03'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_changes_app_category_archived', 'changes', ['app', 'category', 'archived'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_changes_app_category_archived', table_name='changes')
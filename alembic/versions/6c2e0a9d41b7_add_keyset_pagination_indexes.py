@@ -0,0 +1,40 @@
+"""add keyset pagination indexes
+
+Revision ID: 6c2e0a9d41b7
+Revises: f1fd82b538a1
+Create Date: 2026-10-17 09:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c2e0a9d41b7'
+down_revision: Union[str, Sequence[str], None] = 'f1fd82b538a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def keyset_columns(key):
+    """(key, id), with the key NULLS FIRST on PostgreSQL to match the keyset
+    ORDER BY (see models.keyset_index)."""
+    if op.get_bind().dialect.name == 'postgresql':
+        return [sa.literal_column(key).nulls_first(), 'id']
+    return [key, 'id']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_changes_dtt_change_id', 'changes', keyset_columns('dtt_change'), unique=False)
+    op.create_index('ix_deployments_dtt_deploy_id', 'deployments', keyset_columns('dtt_deploy'), unique=False)
+    op.create_index('ix_versions_dt_started_id', 'versions', keyset_columns('dt_started'), unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_versions_dt_started_id', table_name='versions')
+    op.drop_index('ix_deployments_dtt_deploy_id', table_name='deployments')
+    op.drop_index('ix_changes_dtt_change_id', table_name='changes')
@@ -0,0 +1,56 @@
+"""add jobs
+
+Revision ID: 7b1e4d9c3a68
+Revises: 2f6a9c4e8b13
+Create Date: 2026-10-17 18:42:05.618274
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1e4d9c3a68'
+down_revision: Union[str, Sequence[str], None] = '2f6a9c4e8b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('params', sa.JSON(), nullable=True),
+        sa.Column('status', sa.String(), server_default='queued', nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('max_attempts', sa.Integer(), server_default='3', nullable=False),
+        sa.Column('progress', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('result', sa.JSON(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('locked_by', sa.String(), nullable=True),
+        sa.Column('run_after', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_jobs_id', 'jobs', ['id'], unique=False)
+    op.create_index('ix_jobs_status_run_after_id', 'jobs', ['status', 'run_after', 'id'], unique=False)
+
+    table_versions = sa.table('table_versions', sa.column('name'), sa.column('version'), sa.column('updated_at'))
+    op.bulk_insert(table_versions, [{'name': 'jobs', 'version': 0, 'updated_at': datetime.utcnow()}])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM table_versions WHERE name = 'jobs'")
+    op.drop_index('ix_jobs_status_run_after_id', table_name='jobs')
+    op.drop_index('ix_jobs_id', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,75 @@
+"""add version semver sort columns
+
+Revision ID: 8d3f1b6a2c57
+Revises: 5c9e2f7a1d40
+Create Date: 2026-10-17 16:02:11.734520
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import re
+
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f1b6a2c57'
+down_revision: Union[str, Sequence[str], None] = '5c9e2f7a1d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The version parser as of this revision, copied rather than imported from
+# models so that later changes to the model don't change this migration.
+SEMVER = re.compile(r"^\s*v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?\s*$")
+SEMVER_FIELDS = ('semver_major', 'semver_minor', 'semver_patch', 'semver_release', 'semver_pre')
+
+
+def semver_values(version):
+    match = SEMVER.match(version or '')
+    if not match:
+        return dict.fromkeys(SEMVER_FIELDS)
+    major, minor, patch, pre = match.groups()
+    return dict(zip(SEMVER_FIELDS, (int(major), int(minor or 0), int(patch or 0), 0 if pre else 1, pre or '')))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('versions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('semver_major', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('semver_minor', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('semver_patch', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('semver_release', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('semver_pre', sa.String(), nullable=True))
+        batch_op.create_index(
+            'ix_versions_app_semver',
+            ['app', 'semver_major', 'semver_minor', 'semver_patch', 'semver_release', 'semver_pre'],
+            unique=False,
+        )
+
+    # Backfill from the version strings
+    bind = op.get_bind()
+    versions = sa.table('versions', sa.column('id'), sa.column('version'),
+                        *(sa.column(field) for field in SEMVER_FIELDS))
+    rows = [
+        {'_id': id_, **semver_values(version)}
+        for id_, version in bind.execute(sa.select(versions.c.id, versions.c.version))
+    ]
+    if rows:
+        bind.execute(
+            versions.update()
+            .where(versions.c.id == sa.bindparam('_id'))
+            .values({field: sa.bindparam(field) for field in SEMVER_FIELDS}),
+            rows,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('versions', schema=None) as batch_op:
+        batch_op.drop_index('ix_versions_app_semver')
+        batch_op.drop_column('semver_pre')
+        batch_op.drop_column('semver_release')
+        batch_op.drop_column('semver_patch')
+        batch_op.drop_column('semver_minor')
+        batch_op.drop_column('semver_major')
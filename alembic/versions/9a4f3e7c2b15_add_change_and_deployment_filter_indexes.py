@@ -0,0 +1,49 @@
+"""add change and deployment filter indexes
+
+Revision ID: 9a4f3e7c2b15
+Revises: 6c2e0a9d41b7
+Create Date: 2026-10-17 10:04:55.718230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f3e7c2b15'
+down_revision: Union[str, Sequence[str], None] = '6c2e0a9d41b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+    # NULLS FIRST on PostgreSQL to match the keyset ORDER BY (see models.keyset_index)
+    dtt_change = sa.literal_column('dtt_change').nulls_first() if conn.dialect.name == 'postgresql' else 'dtt_change'
+    op.create_index(
+        'ix_changes_app_version_archived', 'changes', ['app', 'version', 'archived', dtt_change, 'id'], unique=False
+    )
+    op.create_index('ix_versions_app_version_current', 'versions', ['app', 'version', 'current'], unique=False)
+    op.create_index('ix_deployments_milestone_app_version', 'deployments', ['milestone', 'app', 'version'], unique=False)
+
+    # Partial index where the backend supports it, a plain one elsewhere
+    unarchived = sa.column('archived').is_(False)
+    if conn.dialect.name in ('sqlite', 'postgresql'):
+        op.create_index(
+            'ix_changes_unarchived_dtt_change_id', 'changes', [dtt_change, 'id'], unique=False,
+            sqlite_where=unarchived,
+            postgresql_where=unarchived,
+        )
+    else:
+        op.create_index('ix_changes_unarchived_dtt_change_id', 'changes', ['archived', 'dtt_change', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_changes_unarchived_dtt_change_id', table_name='changes')
+    op.drop_index('ix_deployments_milestone_app_version', table_name='deployments')
+    op.drop_index('ix_versions_app_version_current', table_name='versions')
+    op.drop_index('ix_changes_app_version_archived', table_name='changes')
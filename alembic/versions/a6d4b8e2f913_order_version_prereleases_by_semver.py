@@ -0,0 +1,57 @@
+"""order version prereleases by semver
+
+Revision ID: a6d4b8e2f913
+Revises: e3a9c7d5b281
+Create Date: 2026-10-18 00:26:43.118054
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d4b8e2f913'
+down_revision: Union[str, Sequence[str], None] = 'e3a9c7d5b281'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copied from models.semver_key / prerelease_key as of this revision
+SEMVER = re.compile(r"^\s*v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?\s*$")
+
+
+def prerelease_key(pre):
+    return ' '.join(
+        f'0{len(str(int(part))):02d}{int(part)}' if part.isdigit() else f'1{part}'
+        for part in pre.split('.')
+    ) if pre else ''
+
+
+def _rewrite(encode):
+    """Set semver_pre to ``encode(prerelease)`` for every parseable version."""
+    bind = op.get_bind()
+    versions = sa.table('versions', sa.column('id'), sa.column('version'), sa.column('semver_pre'))
+    rows = []
+    for id_, version in bind.execute(sa.select(versions.c.id, versions.c.version)):
+        match = SEMVER.match(version or '')
+        if match:
+            rows.append({'_id': id_, 'semver_pre': encode(match.group(4) or '')})
+    if rows:
+        bind.execute(
+            versions.update().where(versions.c.id == sa.bindparam('_id')).values(semver_pre=sa.bindparam('semver_pre')),
+            rows,
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # semver_pre held the prerelease tag itself, which compares rc.10 before
+    # rc.2; it now holds a key whose string order is SemVer precedence.
+    _rewrite(prerelease_key)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rewrite(lambda pre: pre)
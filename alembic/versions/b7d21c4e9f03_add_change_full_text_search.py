@@ -0,0 +1,32 @@
+"""add change full text search
+
+Revision ID: b7d21c4e9f03
+Revises: 3e8b5d0f6a27
+Create Date: 2026-10-17 12:48:19.084317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+import search
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7d21c4e9f03'
+down_revision: Union[str, Sequence[str], None] = '3e8b5d0f6a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # FTS5 table + sync triggers on SQLite, GIN tsvector index on Postgres;
+    # existing rows are indexed as part of the upgrade.
+    search.install(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    search.uninstall(op.get_bind())
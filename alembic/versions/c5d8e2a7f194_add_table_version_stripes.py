@@ -0,0 +1,41 @@
+"""add table version stripes
+
+Revision ID: c5d8e2a7f194
+Revises: 4a7c1e9b2d58
+Create Date: 2026-10-17 21:58:12.406118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e2a7f194'
+down_revision: Union[str, Sequence[str], None] = '4a7c1e9b2d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The existing counters become stripe 0; the app adds the other stripes
+    # (TABLE_VERSION_STRIPES) at startup.
+    with op.batch_alter_table('table_versions', recreate='always') as batch_op:
+        batch_op.add_column(sa.Column('stripe', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_primary_key('pk_table_versions', ['name', 'stripe'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fold the stripes back into one counter per table
+    op.execute(
+        "UPDATE table_versions SET version = "
+        "(SELECT SUM(t.version) FROM table_versions t WHERE t.name = table_versions.name) "
+        "WHERE stripe = 0"
+    )
+    op.execute("DELETE FROM table_versions WHERE stripe != 0")
+    with op.batch_alter_table('table_versions', recreate='always') as batch_op:
+        batch_op.create_primary_key('pk_table_versions', ['name'])
+        batch_op.drop_column('stripe')
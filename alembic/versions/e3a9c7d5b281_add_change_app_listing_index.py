@@ -0,0 +1,32 @@
+"""add change app listing index
+
+Revision ID: e3a9c7d5b281
+Revises: c5d8e2a7f194
+Create Date: 2026-10-17 23:41:07.529318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a9c7d5b281'
+down_revision: Union[str, Sequence[str], None] = 'c5d8e2a7f194'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NULLS FIRST on PostgreSQL to match the keyset ORDER BY (see models.keyset_index)
+    dtt_change = 'dtt_change'
+    if op.get_bind().dialect.name == 'postgresql':
+        dtt_change = sa.literal_column('dtt_change').nulls_first()
+    op.create_index('ix_changes_app_dtt_change_id', 'changes', ['app', dtt_change, 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_changes_app_dtt_change_id', table_name='changes')
@@ -0,0 +1,94 @@
+"""Static file serving for /static.
+
+On top of Starlette's StaticFiles ETag / If-None-Match / Range handling:
+
+* Content-addressed files (``<sha256>.<ext>``, see uploads.py) never change
+  under their name, so they get ``Cache-Control: immutable`` with a one year
+  max-age and their hash as ETag. Other files must be revalidated.
+* A precompressed ``<file>.br`` or ``<file>.gz`` next to a file is served
+  in its place to clients that accept that encoding.
+* STATIC_ACCEL=x-accel-redirect (nginx) or x-sendfile (Apache, lighttpd)
+  returns only headers and lets the fronting proxy send the bytes;
+  STATIC_ACCEL_PREFIX is the nginx ``internal`` location mapped to the
+  static directory.
+"""
+import mimetypes
+import os
+import re
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from compression import add_vary
+
+STATIC_ACCEL = os.getenv("STATIC_ACCEL", "").lower()
+STATIC_ACCEL_PREFIX = os.getenv("STATIC_ACCEL_PREFIX", "/protected-static").rstrip("/")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+# Preferred first
+PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+
+HASHED_NAME = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+
+
+def _accepted_encodings(headers: Headers) -> set:
+    encodings = set()
+    for part in headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(coding.lower())
+    return encodings
+
+
+class AssetFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = os.fspath(full_path)
+        name = os.path.basename(full_path)
+        hashed = HASHED_NAME.match(name)
+        media_type = mimetypes.guess_type(name)[0] or "text/plain"
+
+        # Range requests are answered from the identity file so offsets stay
+        # meaningful to clients that resume downloads.
+        path, encoding, variants = full_path, None, False
+        accepted = _accepted_encodings(request_headers)
+        for coding, suffix in PRECOMPRESSED:
+            variant = full_path + suffix
+            if not os.path.isfile(variant):
+                continue
+            variants = True
+            if encoding is None and coding in accepted and "range" not in request_headers:
+                path, encoding = variant, coding
+                stat_result = os.stat(variant)
+
+        if STATIC_ACCEL in ("x-accel-redirect", "x-sendfile"):
+            response = self._accel_response(path, media_type)
+        else:
+            response = FileResponse(path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+
+        response.headers["Cache-Control"] = IMMUTABLE if hashed else REVALIDATE
+        if hashed:
+            tag = hashed.group(1) + (f"-{encoding}" if encoding else "")
+            response.headers["ETag"] = f'"{tag}"'
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if variants:
+            add_vary(response.headers, "Accept-Encoding")
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+    def _accel_response(self, path: str, media_type: str) -> Response:
+        response = Response(media_type=media_type)
+        if STATIC_ACCEL == "x-sendfile":
+            response.headers["X-Sendfile"] = os.path.abspath(path)
+        else:
+            relative = os.path.relpath(path, self.directory).replace(os.sep, "/")
+            response.headers["X-Accel-Redirect"] = f"{STATIC_ACCEL_PREFIX}/{relative}"
+        # Let the proxy fill these in from the file it sends
+        del response.headers["content-length"]
+        return response
@@ -0,0 +1,69 @@
+"""Milestone archival: the old per-(app, version) UPDATE loop versus set-based UPDATEs.
+
+Every run archives the same rows and is rolled back, so all variants start
+from identical data.
+"""
+import argparse
+import time
+from datetime import datetime
+
+from sqlalchemy import update
+
+from common import seed, temp_engine
+
+import crud, models
+
+
+def per_pair_loop(db, milestone_name):
+    # The pre-set-based implementation, kept here as the baseline
+    pairs = (
+        db.query(models.Deployment.app, models.Deployment.version)
+        .filter(models.Deployment.milestone == milestone_name)
+        .distinct()
+        .all()
+    )
+    total, archive_time = 0, datetime.utcnow()
+    for app, version in pairs:
+        total += (
+            db.query(models.Change)
+            .filter(models.Change.app == app, models.Change.version == version,
+                    models.Change.archived.is_(False))
+            .update({"archived": True, "archived_at": archive_time}, synchronize_session=False)
+        )
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--apps", type=int, default=50)
+    parser.add_argument("--versions-per-app", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, SessionLocal):
+        pairs = seed(engine, apps=args.apps, versions_per_app=args.versions_per_app, changes=args.changes)
+        with engine.begin() as conn:
+            conn.execute(update(models.Deployment.__table__).values(milestone="m-0"))
+        print(f"{len(pairs)} (app, version) pairs, {args.changes} changes")
+
+        variants = {
+            "per-pair loop": per_pair_loop,
+            "set-based, 1 statement": lambda db, m: crud.archive_changes_for_milestone(db, m, chunk_size=None),
+            f"set-based, chunks of {crud.ARCHIVE_CHUNK_SIZE}": crud.archive_changes_for_milestone,
+            "dry-run preview": lambda db, m: crud.preview_archive_for_milestone(db, m).changes,
+        }
+        for name, run in variants.items():
+            best, count = float("inf"), None
+            for _ in range(args.repeat):
+                db = SessionLocal()
+                t0 = time.perf_counter()
+                count = run(db, "m-0")
+                best = min(best, time.perf_counter() - t0)
+                db.rollback()
+                db.close()
+            print(f"{name:>32}: {best * 1000:8.1f} ms ({count} rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Requests per second for GET /changes/ with DATABASE_MODE=sync versus async.
+
+Each mode runs in its own interpreter (the mode is read when ``database`` is
+imported) against the same seeded SQLite file, driving the ASGI app through
+httpx with ``--concurrency`` requests in flight.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from common import load_app, seed, temp_engine
+
+
+async def drive(requests, concurrency, path):
+    import httpx
+
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(path)
+
+        async def worker():
+            while not queue.empty():
+                response = await client.get(queue.get_nowait())
+                response.raise_for_status()
+
+        await client.get(path)  # warm up
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--changes", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--path", default="/changes/?limit=50&archived=false")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        rps = asyncio.run(drive(args.requests, args.concurrency, args.path))
+        print(json.dumps({"mode": os.environ["DATABASE_MODE"], "rps": rps}))
+        return
+
+    with temp_engine() as (engine, _):
+        seed(engine, changes=args.changes)
+        results = []
+        for mode in ("sync", "async"):
+            env = dict(os.environ, DATABASE_MODE=mode)
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker",
+                 "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+                 "--path", args.path],
+                env=env, check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    for result in results:
+        print(f"{result['mode']:>6}: {result['rps']:.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Ingest time for N changes/deployments: per-row POSTs versus the bulk endpoints."""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+
+from common import CATEGORIES, load_app, temp_engine
+
+
+def change_payloads(n):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "app": "bench", "version": "1.0.0",
+            "dtt_change": (start + timedelta(seconds=i)).isoformat(),
+            "change_title": f"change {i}", "change_desc": f"description {i}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+        }
+        for i in range(n)
+    ]
+
+
+def deployment_payloads(n):
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "app": "bench", "version": "1.0.0", "milestone": "m",
+            "dtt_deploy": (start + timedelta(minutes=i)).isoformat(),
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    with temp_engine() as (engine, _):
+        client = TestClient(load_app())
+        for path, payloads in (("/changes/", change_payloads(args.rows)),
+                               ("/deployments/", deployment_payloads(args.rows))):
+            t0 = time.perf_counter()
+            for payload in payloads:
+                client.post(path, json=payload).raise_for_status()
+            per_row = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            client.post(path + "bulk", json=payloads).raise_for_status()
+            bulk_json = time.perf_counter() - t0
+
+            ndjson = "\n".join(json.dumps(p) for p in payloads)
+            t0 = time.perf_counter()
+            client.post(path + "bulk", content=ndjson,
+                        headers={"content-type": "application/x-ndjson"}).raise_for_status()
+            bulk_ndjson = time.perf_counter() - t0
+
+            print(f"{path} x{args.rows}: per-row {per_row:.2f}s ({args.rows / per_row:.0f}/s), "
+                  f"bulk json {bulk_json:.2f}s ({args.rows / bulk_json:.0f}/s), "
+                  f"bulk ndjson {bulk_ndjson:.2f}s ({args.rows / bulk_ndjson:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""/dashboard/summary at scale: the aggregate queries (cold) and the cached path.
+
+The cold figure is what the first request after any write pays; the warm
+figure is every other request (one table_versions lookup plus a cache hit).
+"""
+import argparse
+
+from common import seed, temp_engine, timed
+
+import crud
+from cache import cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--apps", type=int, default=1000)
+    parser.add_argument("--versions-per-app", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=args.apps, versions_per_app=args.versions_per_app, changes=args.changes)
+        with SessionLocal() as db:
+            crud.init_table_versions(db)
+            summary = crud.get_dashboard_summary(db)
+            print(f"{len(summary.apps)} apps, {args.changes} changes")
+            cold = timed(lambda: crud._load_dashboard_summary(db), args.repeat)
+            warm = timed(lambda: crud.get_dashboard_summary(db), args.repeat)
+        print(f"cold (aggregate queries) {cold:8.1f} ms")
+        print(f"warm (cached)            {warm:8.1f} ms")
+        print(cache.stats()["namespaces"]["dashboard"])
+
+
+if __name__ == "__main__":
+    main()
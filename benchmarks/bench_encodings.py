@@ -0,0 +1,65 @@
+"""Payload size and latency of a 1000-change page in each encoding.
+
+Covers JSON and MessagePack, each uncompressed and with gzip, brotli and
+zstd. Latency is end to end through httpx's ASGI transport, including
+compression on the server and decompression on the client. Codecs whose
+package is not installed are skipped.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common import load_app, seed, temp_engine
+
+import compression, serialize
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+
+async def run(path, repeat):
+    import httpx
+
+    formats = {"json": "application/json"}
+    if serialize.msgpack is not None:
+        formats["msgpack"] = serialize.MSGPACK_TYPE
+    codings = ["identity"] + list(compression.CODINGS)
+
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'':20}{'bytes':>10}{'ratio':>8}{'best ms':>10}")
+        baseline = None
+        for fmt, accept in formats.items():
+            for coding in codings:
+                headers = {"accept": accept, "accept-encoding": coding}
+                best, size = float("inf"), None
+                for _ in range(repeat + 1):
+                    t0 = time.perf_counter()
+                    async with client.stream("GET", path, headers=headers) as response:
+                        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+                        response.raise_for_status()
+                        if coding != "identity":
+                            assert response.headers.get("content-encoding") == coding
+                    # Decode as a client would
+                    httpx.Response(200, headers=response.headers, content=raw).read()
+                    best = min(best, time.perf_counter() - t0)
+                    size = len(raw)
+                baseline = baseline or size
+                print(f"{fmt + ' ' + coding:20}{size:>10}{size / baseline:>8.2f}{best * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--changes", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    with temp_engine() as (engine, _):
+        seed(engine, changes=args.changes, rng=rng, vocabulary=WORDS)
+        asyncio.run(run(f"/changes/?limit={args.limit}", args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""POST /changes/ throughput with and without group commit (coalesce.py).
+
+--clients concurrent clients each create changes in a loop for --duration
+seconds, first with one commit per request, then with the Coalescer for
+each --window (ms). Reports inserts/s, latency percentiles and the mean
+batch size, and checks that every response carried its own new id and
+that the table holds exactly the rows that were acknowledged.
+
+Then a trigger is installed that rejects changes titled "reject ...", and
+one burst of concurrent creates mixes such items in. With the coalescer
+only the rejected requests may fail.
+
+DATABASE_MODE and SQLITE_PRAGMAS are read from the environment as usual;
+SQLITE_PRAGMAS="synchronous=FULL" makes every commit fsync, which is where
+group commit helps most.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from common import load_app, seed, temp_engine
+
+import coalesce, database, models
+
+
+def payload(client, i, title="change"):
+    return {
+        "app": "app-0", "version": "1.0.0", "dtt_change": "2024-01-01T00:00:00",
+        "change_title": f"{title} {client}-{i}", "change_desc": "group commit benchmark",
+        "category": "tweaks", "dev": "bench",
+    }
+
+
+async def hammer(client, n, deadline, ids, latencies, errors):
+    i = 0
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        response = await client.post("/changes/", json=payload(n, i))
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if response.status_code == 200:
+            ids.append(response.json()["id"])
+        else:
+            errors.append(response.status_code)
+        i += 1
+
+
+def count_changes():
+    with database.SessionLocal() as db:
+        return db.query(models.Change).count()
+
+
+async def run(app, main, args, window):
+    import httpx
+
+    main.change_writer = None if window is None else coalesce.Coalescer(main._create_changes, window / 1000, args.max_batch)
+    before = count_changes()
+    ids, latencies, errors = [], [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        t0 = time.perf_counter()
+        deadline = t0 + args.duration
+        await asyncio.gather(*(hammer(client, n, deadline, ids, latencies, errors) for n in range(args.clients)))
+        elapsed = time.perf_counter() - t0
+
+    label = "one commit per request" if window is None else f"coalescer {window:g} ms"
+    latencies.sort()
+    batches = main.change_writer.stats()["mean_batch"] if main.change_writer else 1
+    print(f"{label:24} {len(ids) / elapsed:8.0f} inserts/s  p50 {statistics.median(latencies):6.1f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)]:6.1f} ms  mean batch {batches}")
+    failures = []
+    if len(set(ids)) != len(ids):
+        failures.append(f"{label}: {len(ids) - len(set(ids))} duplicate ids returned")
+    if errors:
+        failures.append(f"{label}: {len(errors)} failed requests")
+    if count_changes() - before != len(ids):
+        failures.append(f"{label}: {count_changes() - before} rows written for {len(ids)} acknowledged")
+    return failures
+
+
+async def isolation(app, main, args):
+    import httpx
+
+    with database.engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TRIGGER bench_reject BEFORE INSERT ON changes WHEN NEW.change_title LIKE 'reject%' "
+            "BEGIN SELECT RAISE(ABORT, 'rejected by benchmark trigger'); END"
+        )
+    main.change_writer = coalesce.Coalescer(main._create_changes, 50 / 1000, args.max_batch)
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        responses = await asyncio.gather(*(
+            client.post("/changes/", json=payload(0, i, "reject" if i % 10 == 3 else "change")) for i in range(50)
+        ))
+    stats = main.change_writer.stats()
+    statuses = [r.status_code for r in responses]
+    print(f"isolation: {statuses.count(200)} created, {statuses.count(500)} rejected, "
+          f"{stats['batches']} batches of up to {stats['largest_batch']}")
+    expected = [500 if i % 10 == 3 else 200 for i in range(50)]
+    return [] if statuses == expected else ["isolation: a rejected item failed other requests"]
+
+
+async def main_async(args):
+    import main
+
+    app = load_app()
+    failures = []
+    for window in [None] + args.window:
+        failures += await run(app, main, args, window)
+    failures += await isolation(app, main, args)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--window", type=float, nargs="+", default=[2, 5])
+    parser.add_argument("--max-batch", type=int, default=coalesce.WRITE_COALESCE_MAX_BATCH)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, _):
+        seed(engine, apps=1, versions_per_app=1, changes=0, milestones=1)
+        return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
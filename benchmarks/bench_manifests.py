@@ -0,0 +1,92 @@
+"""Changes shipped with a deployment: manifest read vs. reconstruction.
+
+Seeds --apps apps with --versions versions each, one deployment per
+version (manifest_at NULL, as for deployments made before manifests), then:
+
+* backfills the manifests with manifests.backfill, interrupting the first
+  run after one batch and resuming it, and checks every deployment got
+  one;
+* for --sample deployments, times the manifest read
+  (crud.get_deployment_changes, one primary-key range of
+  deployment_changes) against reconstructing the same list from the
+  version history the way a client had to: load the deployment, find the
+  app's previous deployment, list the app's versions in between and fetch
+  each version's changes. Both must return the same change ids.
+"""
+import argparse
+import random
+
+from common import seed, temp_engine, timed
+
+import crud, manifests, models
+
+
+class Interrupted(Exception):
+    pass
+
+
+def reconstruct(db, deployment_id):
+    D = models.Deployment
+    dep = db.query(D).filter(D.id == deployment_id).one()
+    earlier = [
+        d for d in db.query(D).filter(D.app == dep.app, D.id != dep.id)
+        if (d.dtt_deploy, d.id) < (dep.dtt_deploy, dep.id) and models.semver_key(d.version)
+    ]
+    hi = models.semver_key(dep.version)
+    lo = models.semver_key(max(earlier, key=lambda d: (d.dtt_deploy, d.id)).version) if earlier else None
+    versions = sorted(
+        (v for v in db.query(models.Version).filter(models.Version.app == dep.app)
+         if v.semver_major is not None and (lo is None or models.semver_key(v.version) > lo)
+         and models.semver_key(v.version) <= hi),
+        key=lambda v: models.semver_key(v.version),
+    )
+    rows = []
+    for v in versions:
+        rows.extend(crud.get_app_changes_by_version(db, dep.app, v.version, limit=10 ** 9, rows=True))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=20)
+    parser.add_argument("--versions", type=int, default=100)
+    parser.add_argument("--changes", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=args.apps, versions_per_app=args.versions, changes=args.changes)
+        total = args.apps * args.versions
+
+        def stop(message):
+            raise Interrupted(message)
+
+        try:
+            manifests.backfill(SessionLocal, args.batch_size, log=stop)
+        except Interrupted as exc:
+            print(f"first run interrupted after: {exc}")
+        ms = timed(lambda: print(f"resumed: {manifests.backfill(SessionLocal, args.batch_size)} more deployments"), 1)
+        print(f"backfill of the remaining deployments: {ms:.0f} ms")
+
+        with SessionLocal() as db:
+            missing = db.query(models.Deployment).filter(models.Deployment.manifest_at.is_(None)).count()
+            rows = db.query(models.DeploymentChange).count()
+            assert missing == 0, f"{missing} deployments without a manifest"
+            assert rows == args.changes, f"{rows} manifest rows for {args.changes} changes"
+            print(f"{total} deployments, {rows} manifest rows")
+
+            ids = random.Random(1).sample(range(1, total + 1), min(args.sample, total))
+            for deployment_id in ids:
+                read = [r.id for r in crud.get_deployment_changes(db, deployment_id, limit=10 ** 9, rows=True)]
+                rebuilt = sorted(r.id for r in reconstruct(db, deployment_id))
+                assert read == rebuilt, f"deployment {deployment_id}: manifest differs from reconstruction"
+
+            read_ms = timed(lambda: [crud.get_deployment_changes(db, i, limit=10 ** 9, rows=True) for i in ids], args.repeat)
+            rebuilt_ms = timed(lambda: [reconstruct(db, i) for i in ids], args.repeat)
+            print(f"{len(ids)} deployments: manifest read {read_ms:8.1f} ms, reconstruction {rebuilt_ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
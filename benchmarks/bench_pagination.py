@@ -0,0 +1,41 @@
+"""Deep-page latency of OFFSET paging versus keyset (cursor) paging on /changes/."""
+import argparse
+
+from common import seed, temp_engine, timed
+
+import crud, pagination
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--changes", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, changes=args.changes)
+        db = SessionLocal()
+
+        # Walk the table once with cursors, remembering the cursor at each depth.
+        depths = [0, args.changes // 10, args.changes // 4, args.changes // 2, args.changes - args.limit]
+        cursors, cursor, offset = {}, None, 0
+        while offset <= depths[-1]:
+            if offset in depths:
+                cursors[offset] = cursor
+            rows = crud.get_changes(db, limit=args.limit, cursor=cursor)
+            cursor = pagination.next_cursor(rows, args.limit, "dtt_change")
+            offset += args.limit
+            if cursor is None:
+                break
+        depths = [d for d in depths if d in cursors]
+
+        print(f"{'offset':>10} {'skip/limit ms':>15} {'cursor ms':>12}")
+        for depth in depths:
+            offset_ms = timed(lambda: crud.get_changes(db, skip=depth, limit=args.limit))
+            cursor_ms = timed(lambda: crud.get_changes(db, limit=args.limit, cursor=cursors[depth]))
+            print(f"{depth:>10} {offset_ms:>15.2f} {cursor_ms:>12.2f}")
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
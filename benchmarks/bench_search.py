@@ -0,0 +1,62 @@
+"""Change search: the FTS index behind /changes/search versus a LIKE scan.
+
+Descriptions are drawn from a Zipf-like vocabulary, so common words match
+many rows and rare words match few; both are measured.
+"""
+import argparse
+import random
+
+from sqlalchemy import or_, select
+
+from common import seed, temp_engine, timed
+
+import crud, models, search
+
+WORDS = [f"w{i}" for i in range(5000)]
+
+
+def like_scan(db, q, limit):
+    pattern = f"%{q}%"
+    stmt = (
+        select(models.Change)
+        .where(or_(models.Change.change_title.ilike(pattern), models.Change.change_desc.ilike(pattern)))
+        .order_by(models.Change.id)
+        .limit(limit)
+    )
+    return db.execute(stmt).scalars().all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--changes", type=int, default=500000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    # Word i is picked with weight 1/(i+1)
+    vocabulary = rng.choices(WORDS, weights=[1 / (i + 1) for i in range(len(WORDS))], k=200000)
+
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=20, versions_per_app=10, changes=args.changes, rng=rng, vocabulary=vocabulary)
+        with engine.begin() as conn:
+            search.install(conn)
+        print(f"{args.changes} changes")
+
+        queries = {
+            "common word": "w1",
+            "rare word": "w4321",
+            "two words": "w3 w17",
+            "no match": "zzzz",
+        }
+        with SessionLocal() as db:
+            for label, q in queries.items():
+                hits = len(crud.search_changes(db, q, limit=args.limit))
+                fts = timed(lambda: crud.search_changes(db, q, limit=args.limit), args.repeat)
+                # LIKE cannot express "both words anywhere", so it gets the first word only
+                like = timed(lambda: like_scan(db, q.split()[0], args.limit), args.repeat)
+                print(f"{label:12} {hits:3} hits  fts {fts:8.1f} ms  like {like:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""List endpoint latency: response_model validation versus the fast JSON path.
+
+Both paths are exercised in one process by flipping ``serialize.FAST`` (and
+``serialize.orjson`` for the stdlib json fallback) between runs, through
+httpx's ASGI transport.
+"""
+import argparse
+import asyncio
+import time
+
+from common import load_app, seed, temp_engine
+
+import serialize
+
+PATHS = {
+    "changes, 1000 rows": "/changes/?limit=1000",
+    "changes, 100 rows": "/changes/?limit=100",
+    "versions, 1000 rows": "/versions/?limit=1000",
+    "deployments, 1000 rows": "/deployments/?limit=1000",
+}
+
+
+async def best_of(client, path, repeat):
+    best = float("inf")
+    await client.get(path)
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        response = await client.get(path)
+        best = min(best, time.perf_counter() - t0)
+        response.raise_for_status()
+    return best * 1000, response.content
+
+
+async def run(repeat):
+    import httpx
+
+    orjson = serialize.orjson
+    variants = {
+        "pydantic": (False, orjson),
+        "fast (json)": (True, None),
+        "fast (orjson)": (True, orjson),
+    }
+    if orjson is None:
+        del variants["fast (orjson)"]
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'':24}" + "".join(f"{name:>16}" for name in variants))
+        for label, path in PATHS.items():
+            timings, bodies = [], set()
+            for fast, encoder in variants.values():
+                serialize.FAST, serialize.orjson = fast, encoder
+                ms, body = await best_of(client, path, repeat)
+                timings.append(ms)
+                bodies.add(body)
+            same = "" if len(bodies) == 1 else "  (bodies differ!)"
+            print(f"{label:24}" + "".join(f"{ms:13.1f} ms" for ms in timings) + same)
+    serialize.orjson = orjson
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--changes", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, _):
+        seed(engine, apps=50, versions_per_app=40, changes=args.changes)
+        asyncio.run(run(args.repeat))
+
+
+if __name__ == "__main__":
+    main()
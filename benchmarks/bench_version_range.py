@@ -0,0 +1,99 @@
+"""Changes between two versions: one range query vs. one query per version.
+
+Seeds a single app with --versions versions (1.0.0 ... 1.<n-1>.0, so lexical
+and semantic order differ) and times, at the crud level and over HTTP:
+
+* range: one /apps/{app}/changes?from=&to= over the whole span (one statement);
+* loop:  what a client had to do before, one
+  /apps/{app}/versions/{version}/changes/ per version in the span.
+
+Both must return the same change ids. The query plan of the range
+statement is printed to show it scans ix_versions_app_semver.
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import event
+
+from common import load_app, seed, temp_engine, timed
+
+import crud, models
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--versions", type=int, default=300)
+    parser.add_argument("--changes", type=int, default=15000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    first, last = "1.0.0", f"1.{args.versions - 1}.0"
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=1, versions_per_app=args.versions, changes=args.changes)
+        with SessionLocal() as db:
+            def by_range():
+                return crud.get_app_changes_between(db, "app-0", first, last, limit=args.changes, rows=True)
+
+            def by_loop():
+                lo, hi = models.semver_key(first), models.semver_key(last)
+                versions = [
+                    v for v in db.query(models.Version).filter(models.Version.app == "app-0")
+                    if v.semver_major is not None and lo <= models.semver_key(v.version) <= hi
+                ]
+                versions.sort(key=lambda v: models.semver_key(v.version))
+                rows = []
+                for v in versions:
+                    rows.extend(crud.get_app_changes_by_version(db, "app-0", v.version, limit=args.changes, rows=True))
+                return rows
+
+            range_ids, loop_ids = [r.id for r in by_range()], [r.id for r in by_loop()]
+            assert sorted(range_ids) == sorted(loop_ids), "range and loop returned different changes"
+            print(f"{args.versions} versions, {len(range_ids)} changes between {first} and {last}")
+
+            range_ms = timed(by_range, args.repeat)
+            loop_ms = timed(by_loop, args.repeat)
+            print(f"range query        {range_ms:8.1f} ms")
+            print(f"per-version loop   {loop_ms:8.1f} ms  ({args.versions} queries + version lookup)")
+
+            statements = []
+            capture = lambda conn, cursor, statement, params, context, many: statements.append((statement, params))
+            event.listen(engine, "before_cursor_execute", capture)
+            by_range()
+            event.remove(engine, "before_cursor_execute", capture)
+            statement, params = statements[-1]
+            plan = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+            print("plan:", " | ".join(row[-1] for row in plan))
+
+            versions = [f"1.{i}.0" for i in range(args.versions)]
+            http_range, http_loop = asyncio.run(http_timings(first, last, versions, args))
+            print(f"HTTP range request {http_range:8.1f} ms")
+            print(f"HTTP per-version   {http_loop:8.1f} ms  ({args.versions} requests)")
+
+
+async def http_timings(first, last, versions, args):
+    import httpx
+
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def by_range():
+            response = await client.get(f"/apps/app-0/changes?from={first}&to={last}&limit={args.changes}")
+            response.raise_for_status()
+
+        async def by_loop():
+            for version in versions:
+                response = await client.get(f"/apps/app-0/versions/{version}/changes/?limit={args.changes}")
+                response.raise_for_status()
+
+        results = []
+        for fn in (by_range, by_loop):
+            best = float("inf")
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                await fn()
+                best = min(best, time.perf_counter() - t0)
+            results.append(best * 1000)
+        return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Check that unchanged polls are answered with 304 without querying the data.
+
+Polls the read endpoints with the ETag from a previous response and counts
+the SQL statements each conditional request executes: only the
+table_versions lookup is allowed. Then writes a row and checks that the old
+ETag no longer matches. Exits non-zero on failure.
+"""
+import sys
+
+from sqlalchemy import event
+
+from common import load_app, seed, temp_engine
+
+import database
+
+PATHS = [
+    "/apps/", "/apps/1", "/versions/", "/versions/1", "/deployments/", "/deployments/1",
+    "/changes/?limit=100", "/changes/?archived=false&current_only=true", "/changes/1",
+    "/changes/filter-options", "/apps/app-1/versions/1.1.0/changes/", "/milestones/", "/milestones/1",
+]
+
+
+def main():
+    from fastapi.testclient import TestClient
+
+    with temp_engine() as (engine, _):
+        seed(engine, changes=5000)
+        client = TestClient(load_app())
+        statements = []
+        event.listen(database.engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        failed = False
+        etags = {}
+        for path in PATHS:
+            etags[path] = client.get(path).headers["ETag"]
+            del statements[:]
+            response = client.get(path, headers={"If-None-Match": etags[path]})
+            ok = (response.status_code == 304 and not response.content
+                  and len(statements) == 1 and "table_versions" in statements[0])
+            failed = failed or not ok
+            print(f"[{'ok' if ok else 'FAIL'}] {path}: {response.status_code}, {len(statements)} statement(s)")
+
+        client.post("/changes/", json={
+            "app": "app-1", "version": "1.1.0", "dtt_change": "2030-01-01T00:00:00",
+            "change_title": "new", "change_desc": "new", "category": "bug",
+        }).raise_for_status()
+        for path in ("/changes/?limit=100", "/changes/1"):
+            status = client.get(path, headers={"If-None-Match": etags[path]}).status_code
+            failed = failed or status != 200
+            print(f"[{'ok' if status == 200 else 'FAIL'}] {path} after write: {status}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
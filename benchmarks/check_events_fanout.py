@@ -0,0 +1,104 @@
+"""Fan-out test for the /events change feed with many simulated subscribers.
+
+Opens ``--subscribers`` SSE streams (1000 by default) on the in-process
+hub, plus a few that never read. Then it creates ``--events`` changes
+through POST /changes/. It checks that:
+
+* every reading subscriber receives every event, in order;
+* subscribers that never read stay capped at their queue size and get a
+  single ``reset`` event instead of an unbounded backlog;
+* after all streams close, no subscriber is left registered.
+
+It reports the time from a write starting until the last subscriber had
+the event. It exits non-zero on any failure, so it can be wired into CI.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from common import load_app, seed, temp_engine
+
+import events
+
+
+async def consume(subscriber, expected, received, arrivals):
+    stream = events.sse_stream(lambda: subscriber, heartbeat=60)
+    try:
+        async for frame in stream:
+            if frame.startswith(b"id: "):
+                received.append(int(frame[4:frame.index(b"\n")]))
+                arrivals[len(received) - 1] = max(arrivals[len(received) - 1], time.perf_counter())
+                if len(received) == expected:
+                    return
+    finally:
+        await stream.aclose()
+
+
+async def run(args):
+    import httpx
+
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        fast = [events.hub.subscribe(["changes"]) for _ in range(args.subscribers)]
+        stalled = [events.hub.subscribe(["changes"], maxsize=args.queue_size) for _ in range(args.stalled)]
+        received = [[] for _ in fast]
+        arrivals = [0.0] * args.events
+        consumers = [
+            asyncio.create_task(consume(sub, args.events, got, arrivals)) for sub, got in zip(fast, received)
+        ]
+
+        started = []
+        t0 = time.perf_counter()
+        for i in range(args.events):
+            started.append(time.perf_counter())
+            response = await client.post("/changes/", json={
+                "app": "app-0", "version": "1.0.0", "dtt_change": "2024-01-01T00:00:00",
+                "change_title": f"event {i}", "change_desc": "fan-out test", "category": "tweaks", "dev": "bench",
+            })
+            response.raise_for_status()
+            # Let the consumers drain between writes, like a live feed
+            await asyncio.sleep(0)
+        await asyncio.wait_for(asyncio.gather(*consumers), 60)
+        elapsed = time.perf_counter() - t0
+
+        failures = []
+        ids = received[0]
+        if len(ids) != args.events or ids != sorted(ids):
+            failures.append(f"first subscriber got {len(ids)} / {args.events} events, ordered={ids == sorted(ids)}")
+        mismatched = sum(got != ids for got in received)
+        if mismatched:
+            failures.append(f"{mismatched} subscribers saw a different event sequence")
+        for sub in stalled:
+            if sub.queue.qsize() > args.queue_size or sub.resets != 1:
+                failures.append(f"stalled subscriber holds {sub.queue.qsize()} items after {sub.resets} resets")
+                break
+            events.hub.unsubscribe(sub)
+        if events.hub.subscribers:
+            failures.append(f"{len(events.hub.subscribers)} subscribers still registered")
+
+    lags = sorted((arrival - start) * 1000 for arrival, start in zip(arrivals, started))
+    print(f"{args.subscribers} subscribers, {args.events} events: {elapsed:.2f}s, "
+          f"{args.subscribers * args.events / elapsed:,.0f} deliveries/s")
+    print(f"write start -> last subscriber: p50 {lags[len(lags) // 2]:.2f} ms, max {lags[-1]:.2f} ms")
+    print(f"stalled subscribers: {args.stalled}, queue cap {args.queue_size}, hub {events.hub.stats()}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=1000)
+    parser.add_argument("--stalled", type=int, default=10)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--queue-size", type=int, default=32)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, _):
+        seed(engine, apps=1, versions_per_app=1, changes=0, milestones=1)
+        return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Fail if ?include= expansion issues more queries as the data grows.
+
+Counts the statements each expanded read emits against a small and a
+larger seeded database; the counts must be identical (one query for the
+page plus one per included relationship). Also checks that an included
+changes list holds the first crud.INCLUDE_LIMIT changes of its app or
+version. Exits non-zero otherwise, so it can be wired into CI.
+"""
+import sys
+
+from sqlalchemy import event
+
+from common import seed, temp_engine
+
+import crud, models
+
+
+def count_queries(engine, fn):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+def measure(size):
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=size, versions_per_app=size, changes=size * 200, milestones=size)
+        db = SessionLocal()
+        cases = {
+            "apps?include=versions,deployments,changes": lambda: crud.get_apps(
+                db, limit=1000, includes=list(crud.INCLUDES[models.App])
+            ),
+            "apps/1?include=versions,deployments,changes": lambda: crud.get_app_by_id(
+                db, 1, list(crud.INCLUDES[models.App])
+            ),
+            "versions?include=deployments,changes": lambda: crud.get_versions(
+                db, limit=1000, includes=list(crud.INCLUDES[models.Version])
+            ),
+            "milestones?include=deployments": lambda: crud.get_milestones(
+                db, limit=1000, includes=list(crud.INCLUDES[models.Milestone])
+            ),
+        }
+        counts = {}
+        for name, run in cases.items():
+            counts[name] = count_queries(engine, run)
+            db.expunge_all()
+        capped = capped_mismatches(db)
+        db.close()
+        return counts, capped
+
+
+def capped_mismatches(db):
+    """Apps and versions whose included changes aren't their first INCLUDE_LIMIT."""
+    C = models.Change
+    bad = []
+    for app in crud.get_apps(db, limit=1000, includes=["changes"]):
+        want = [i for (i,) in db.query(C.id).filter(C.app == app.app).order_by(C.id).limit(crud.INCLUDE_LIMIT)]
+        if [c.id for c in app.changes] != want:
+            bad.append(f"app {app.app}")
+    for version in crud.get_versions(db, limit=1000, includes=["changes"]):
+        want = [i for (i,) in db.query(C.id).filter(C.app == version.app, C.version == version.version)
+                .order_by(C.id).limit(crud.INCLUDE_LIMIT)]
+        if [c.id for c in version.changes] != want:
+            bad.append(f"version {version.app} {version.version}")
+    db.expunge_all()
+    return bad
+
+
+def main():
+    (small, small_capped), (large, large_capped) = measure(3), measure(20)
+    failed = False
+    for name in small:
+        ok = small[name] == large[name]
+        failed = failed or not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: {small[name]} queries (small), {large[name]} queries (large)")
+    for bad in small_capped + large_capped:
+        failed = True
+        print(f"[FAIL] included changes of {bad} are not its first {crud.INCLUDE_LIMIT}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""Check the background job runner (jobs.py) end to end through the app.
+
+Seeds two milestones with --changes changes between them and starts the
+worker pool, then checks that:
+
+* completing a milestone with ?archive=async answers 202 with a job, and
+  the job archives the same changes the synchronous path does, reporting
+  progress up to its total; both request times are printed, together with
+  the worst POST /changes/ latency seen while each archive ran;
+* POST /changes/bulk?mode=async imports every valid item and reports the
+  invalid ones in the job result;
+* a manifests.backfill job fills in every deployment manifest;
+* a handler that fails twice succeeds on its third attempt, and one that
+  always fails ends failed after max_attempts with its error recorded;
+* a worker whose job was taken over gets JobLost from ctx.progress and
+  does not overwrite the new owner's claim with its outcome;
+* with the in-process pool stopped, a separate ``python jobs.py`` worker
+  (the JOBS_WORKERS=0 setup) runs a queued bulk import.
+
+Exits non-zero on any failure.
+"""
+import os
+
+os.environ.setdefault("JOBS_RETRY_DELAY", "0.05")
+os.environ.setdefault("JOBS_POLL_INTERVAL", "0.05")
+
+import argparse
+import asyncio
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+from common import load_app, seed, temp_engine
+
+import database, jobs, models
+
+attempts = {"flaky": 0}
+
+
+@jobs.handler("check.flaky")
+def _flaky(ctx):
+    attempts["flaky"] += 1
+    if attempts["flaky"] < 3:
+        raise RuntimeError(f"attempt {attempts['flaky']} fails")
+    return {"attempts": attempts["flaky"]}
+
+
+@jobs.handler("check.broken")
+def _broken(ctx):
+    raise RuntimeError("always fails")
+
+
+taken_over = {"finished": threading.Event()}
+
+
+@jobs.handler("check.taken_over")
+def _taken_over(ctx):
+    # What another worker's claim() does once this one looks stale
+    with database.SessionLocal() as other:
+        other.query(models.Job).filter_by(id=ctx.job.id).update(
+            {"locked_by": "check:other", "attempts": models.Job.attempts + 1, "heartbeat_at": datetime.utcnow()},
+            synchronize_session=False,
+        )
+        other.commit()
+    try:
+        ctx.progress(1, 1)
+        taken_over["progress"] = "not raised"
+    except jobs.JobLost:
+        taken_over["progress"] = "JobLost"
+    taken_over["finished"].set()
+    return {"finished": True}
+
+
+async def wait_for_job(client, job_id, timeout=120):
+    deadline = time.perf_counter() + timeout
+    seen = set()
+    while time.perf_counter() < deadline:
+        job = (await client.get(f"/jobs/{job_id}")).json()
+        seen.add((job["progress"], job["total"]))
+        if job["status"] in ("succeeded", "failed"):
+            return job, seen
+        await asyncio.sleep(0.02)
+    raise TimeoutError(f"job {job_id} did not finish")
+
+
+async def writes_during(client, task):
+    """Worst POST /changes/ latency (ms) while ``task`` is running."""
+    worst = 0.0
+    i = 0
+    while not task.done():
+        t0 = time.perf_counter()
+        (await client.post("/changes/", json={
+            "app": "app-0", "version": "1.0.0", "dtt_change": "2024-01-01T00:00:00",
+            "change_title": f"concurrent {i}", "change_desc": "written during archive", "category": "tweaks",
+        })).raise_for_status()
+        worst = max(worst, (time.perf_counter() - t0) * 1000)
+        i += 1
+        await asyncio.sleep(0.005)
+    return worst
+
+
+async def complete(client, milestone_id, archive):
+    milestone = (await client.get(f"/milestones/{milestone_id}")).json()
+    body = {key: milestone[key] for key in ("milestone", "goal", "dt_milestone", "proj_ver")}
+    return await client.put(f"/milestones/{milestone_id}?archive={archive}", json={**body, "complete": True})
+
+
+async def run(args):
+    import httpx
+
+    failures = []
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        previews = {m: (await client.get(f"/milestones/{m}/archive-preview")).json()["changes"] for m in (1, 2)}
+
+        # Synchronous archive: the request does the work
+        t0 = time.perf_counter()
+        request = asyncio.create_task(complete(client, 1, "sync"))
+        sync_worst = await writes_during(client, request)
+        sync_ms = (time.perf_counter() - t0) * 1000
+        (await request).raise_for_status()
+
+        # Asynchronous archive: 202 and a job
+        t0 = time.perf_counter()
+        response = await complete(client, 2, "async")
+        async_ms = (time.perf_counter() - t0) * 1000
+        if response.status_code != 202 or response.headers.get("location") != f"/jobs/{response.json()['id']}":
+            failures.append(f"async completion answered {response.status_code} {response.headers.get('location')}")
+        poll = asyncio.create_task(wait_for_job(client, response.json()["id"]))
+        async_worst = await writes_during(client, poll)
+        job, seen = await poll
+        if job["status"] != "succeeded" or job["result"]["archived"] != previews[2]:
+            failures.append(f"archive job {job['status']}: {job['result']} for {previews[2]} changes")
+        if len(seen) < 2:
+            failures.append(f"archive job reported no intermediate progress: {sorted(seen, key=str)}")
+        left = (await client.get("/milestones/2/archive-preview")).json()["changes"]
+        if left:
+            failures.append(f"{left} changes left unarchived after the job")
+        print(f"complete milestone, {previews[1]} changes sync:   {sync_ms:8.0f} ms request, "
+              f"worst concurrent write {sync_worst:6.0f} ms")
+        print(f"complete milestone, {previews[2]} changes async:  {async_ms:8.0f} ms request, "
+              f"worst concurrent write {async_worst:6.0f} ms, job progress samples {len(seen)}")
+
+        # Bulk import as a job
+        items = [{
+            "app": "app-0", "version": "1.0.0", "dtt_change": "2024-01-01T00:00:00",
+            "change_title": f"imported {i}", "change_desc": "bulk job", "category": "tweaks",
+        } for i in range(args.bulk)] + [{"app": "app-0"}]
+        before = (await client.get("/dashboard/summary")).json()
+        response = await client.post("/changes/bulk?mode=async", json=items)
+        job, _ = await wait_for_job(client, response.json()["id"])
+        with database.SessionLocal() as db:
+            imported = db.query(models.Change).filter(models.Change.change_title.like("imported %")).count()
+        if job["status"] != "succeeded" or imported != args.bulk or len(job["result"]["errors"]) != 1:
+            failures.append(f"bulk job {job['status']}: {imported} / {args.bulk} imported, result {job['result']}")
+        print(f"bulk import job: {imported} changes, {len(job['result']['errors'])} invalid item reported")
+
+        # Backfill as a job
+        response = await client.post("/jobs/", json={"kind": "manifests.backfill", "params": {"batch_size": 100}})
+        job, _ = await wait_for_job(client, response.json()["id"])
+        with database.SessionLocal() as db:
+            missing = db.query(models.Deployment).filter(models.Deployment.manifest_at.is_(None)).count()
+        if job["status"] != "succeeded" or missing:
+            failures.append(f"backfill job {job['status']}, {missing} deployments without a manifest")
+        print(f"backfill job: {job['result']}")
+
+        # Retries
+        flaky = (await client.post("/jobs/", json={"kind": "check.flaky"})).json()
+        broken = (await client.post("/jobs/", json={"kind": "check.broken", "max_attempts": 2})).json()
+        flaky, _ = await wait_for_job(client, flaky["id"])
+        broken, _ = await wait_for_job(client, broken["id"])
+        if flaky["status"] != "succeeded" or flaky["attempts"] != 3:
+            failures.append(f"flaky job {flaky['status']} after {flaky['attempts']} attempts")
+        if broken["status"] != "failed" or broken["attempts"] != 2 or "always fails" not in (broken["error"] or ""):
+            failures.append(f"broken job {broken['status']} after {broken['attempts']} attempts: {broken['error']}")
+        print(f"retries: flaky {flaky['status']} after {flaky['attempts']}, "
+              f"broken {broken['status']} after {broken['attempts']} ({broken['error']})")
+        # Fencing: the outcome of a job taken over mid-run is discarded
+        job = (await client.post("/jobs/", json={"kind": "check.taken_over"})).json()
+        await asyncio.to_thread(taken_over["finished"].wait, 30)
+        await asyncio.sleep(0.2)
+        with database.SessionLocal() as db:
+            row = db.get(models.Job, job["id"])
+            state = (row.status, row.locked_by, row.result, row.progress)
+        if taken_over.get("progress") != "JobLost" or state != ("running", "check:other", None, 0):
+            failures.append(f"taken-over job: progress {taken_over.get('progress')}, "
+                            f"(status, locked_by, result, progress) {state}")
+        print(f"taken-over job: progress {taken_over.get('progress')}, left {state[0]} for {state[1]}")
+        if (await client.post("/jobs/", json={"kind": "no.such.kind"})).status_code != 400:
+            failures.append("unknown job kind was accepted")
+
+        # The standalone worker process
+        jobs.stop()
+        items = [{
+            "app": "app-0", "version": "1.0.0", "dtt_change": "2024-01-01T00:00:00",
+            "change_title": f"worker {i}", "change_desc": "standalone worker", "category": "tweaks",
+        } for i in range(10)]
+        response = await client.post("/changes/bulk?mode=async", json=items)
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "jobs.py")
+        worker = subprocess.Popen([sys.executable, script, "--workers", "1"])
+        try:
+            job, _ = await wait_for_job(client, response.json()["id"], timeout=60)
+        except TimeoutError as exc:
+            job = {"status": str(exc), "error": None}
+        finally:
+            worker.terminate()
+            worker.wait(10)
+        if job["status"] != "succeeded":
+            failures.append(f"python jobs.py: bulk job {job['status']} ({job['error']})")
+        print(f"python jobs.py worker: bulk job {job['status']}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--changes", type=int, default=200000)
+    parser.add_argument("--bulk", type=int, default=5000)
+    args = parser.parse_args()
+
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=10, versions_per_app=10, changes=args.changes, milestones=2)
+        load_app()  # instruments the engine before the workers start using it
+        jobs.start(SessionLocal, 2)
+        try:
+            return asyncio.run(run(args))
+        finally:
+            jobs.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
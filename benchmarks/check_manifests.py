@@ -0,0 +1,154 @@
+"""Check that deployment manifests stay current through every write path.
+
+Seeds a small dataset (plus a non-semver "nightly" version), backfills the
+manifests, then runs each write that can move changes between manifests
+and compares every stored manifest with a fresh manifests.build():
+
+* creating deployments (bulk and one at a time), updating and deleting them;
+* creating changes (one at a time, grouped and bulk) and updating them;
+* renaming a version, moving it to another app, creating and deleting one.
+
+It also replays the version create/delete case through the API: a change
+of a version that has no Version row yet is not in the manifest of a
+deployment of that version; POST /versions/ must put it there and DELETE
+must take it out again. Exits non-zero on any mismatch.
+"""
+import argparse
+import asyncio
+import random
+import sys
+from datetime import date, datetime, timedelta
+
+from common import load_app, seed, temp_engine
+
+import crud, manifests, models, schemas
+
+
+def snapshot(db):
+    DC = models.DeploymentChange
+    manifest = {dep_id: [] for (dep_id,) in db.query(models.Deployment.id)}
+    for dep_id, change_id in db.query(DC.deployment_id, DC.change_id).order_by(DC.deployment_id, DC.change_id):
+        manifest[dep_id].append(change_id)
+    return manifest
+
+
+def stale(db):
+    """Deployments whose stored manifest differs from a rebuild (rolled back)."""
+    stored = snapshot(db)
+    for dep in db.query(models.Deployment):
+        manifests.build(db, dep)
+    db.flush()
+    rebuilt = snapshot(db)
+    db.rollback()
+    return [dep_id for dep_id in rebuilt if rebuilt[dep_id] != stored[dep_id]]
+
+
+def write_paths(db, apps, versions, rng):
+    def deployment():
+        return schemas.DeploymentCreate(
+            app=rng.choice(apps), version=rng.choice(versions), milestone="m-0",
+            dtt_deploy=datetime(2021, 1, 1) + timedelta(days=rng.randrange(100)),
+        )
+
+    def change(i):
+        return schemas.ChangeCreate(
+            app=rng.choice(apps), version=rng.choice(versions), dtt_change=datetime(2021, 1, 1),
+            change_title=f"check {i}", change_desc="manifest check", category="bug",
+        )
+
+    def version(app, name, version_id=None):
+        dt_started = date(2020, 6, 1) if version_id is None else db.get(models.Version, version_id).dt_started
+        return schemas.VersionCreate(app=app, version=name, dt_started=dt_started,
+                                     delta_maj=0, delta_min=0, delta_pat=0, current=False)
+
+    def version_id(app, name):
+        return db.query(models.Version.id).filter_by(app=app, version=name).scalar()
+
+    yield "bulk_create_deployments", lambda: crud.bulk_create_deployments(db, [deployment() for _ in range(100)])
+    yield "create_change", lambda: [crud.create_change(db, change(i)) for i in range(20)]
+    yield "create_changes_grouped", lambda: crud.create_changes_grouped(db, [change(i) for i in range(30)])
+    yield "bulk_create_changes", lambda: crud.bulk_create_changes(db, [change(i) for i in range(300)])
+    yield "update_change", lambda: [
+        crud.update_change(db, change_id, change(change_id))
+        for change_id in rng.sample([i for (i,) in db.query(models.Change.id)], 40)
+    ]
+    yield "update_version (rename)", lambda: crud.update_version(
+        db, version_id(apps[1], "1.3.0"), version(apps[1], "1.9.5", version_id(apps[1], "1.3.0")))
+    yield "update_version (move app)", lambda: crud.update_version(
+        db, version_id(apps[2], "1.5.0"), version(apps[0], "1.5.7", version_id(apps[2], "1.5.0")))
+    yield "create_version", lambda: crud.create_version(db, version(apps[1], "1.3.0"))
+    yield "delete_version", lambda: crud.delete_version(db, version_id(apps[0], "1.4.0"))
+    yield "create_deployment", lambda: [crud.create_deployment(db, deployment()) for _ in range(10)]
+    yield "update_deployment", lambda: [
+        crud.update_deployment(db, dep_id, deployment())
+        for dep_id in rng.sample([i for (i,) in db.query(models.Deployment.id)], 15)
+    ]
+    yield "delete_deployment", lambda: [
+        crud.delete_deployment(db, dep_id)
+        for dep_id in rng.sample([i for (i,) in db.query(models.Deployment.id)], 15)
+    ]
+
+
+async def version_round_trip(app):
+    """The API replay: is the change shipped before the Version row, after POST, after DELETE?"""
+    import httpx
+
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+        (await client.post("/apps/", json={"app": app})).raise_for_status()
+        change = (await client.post("/changes/", json={
+            "app": app, "version": "7.0.0", "dtt_change": "2024-01-01T00:00:00",
+            "change_title": "unversioned", "change_desc": "no Version row yet", "category": "feature",
+        })).json()
+        deployment = (await client.post("/deployments/", json={
+            "app": app, "version": "7.0.0", "milestone": "m-0", "dtt_deploy": "2024-02-01T00:00:00",
+        })).json()
+
+        async def shipped():
+            response = await client.get(f"/deployments/{deployment['id']}/changes")
+            response.raise_for_status()
+            return change["id"] in {c["id"] for c in response.json()}
+
+        before = await shipped()
+        version = (await client.post("/versions/", json={
+            "app": app, "version": "7.0.0", "dt_started": "2024-01-01",
+            "delta_maj": 1, "delta_min": 0, "delta_pat": 0, "current": False,
+        })).json()
+        created = await shipped()
+        (await client.delete(f"/versions/{version['id']}")).raise_for_status()
+        deleted = await shipped()
+    return before, created, deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--changes", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    failed = False
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, apps=3, versions_per_app=8, changes=args.changes)
+        apps = [f"app-{i}" for i in range(3)]
+        versions = [f"1.{v}.0" for v in range(8)] + ["nightly"]
+        with SessionLocal() as db:
+            db.add(models.Version(app=apps[0], version="nightly", dt_started=date(2020, 1, 1),
+                                  delta_maj=0, delta_min=0, delta_pat=0, current=False))
+            db.commit()
+            manifests.backfill(SessionLocal, 50, log=lambda message: None)
+            for name, write in write_paths(db, apps, versions, rng):
+                write()
+                bad = stale(db)
+                failed = failed or bool(bad)
+                print(f"[{'FAIL' if bad else 'ok'}] {name}: {len(bad)} stale manifests {bad[:5]}")
+
+        shipped = asyncio.run(version_round_trip("app-check"))
+        ok = shipped == (False, True, False)
+        failed = failed or not ok
+        print(f"[{'ok' if ok else 'FAIL'}] POST/DELETE /versions/: change shipped "
+              f"{' -> '.join(map(str, shipped))} (expected False -> True -> False)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Fail if any hot change/deployment query scans instead of seeking.
+
+Runs the crud filter paths against a seeded SQLite database (two thirds of
+its changes archived, as after a few completed milestones), captures every
+statement they emit and checks its ``EXPLAIN QUERY PLAN`` output. A
+filtered path must reach the table with a SEARCH. The only scan allowed
+is of a partial index, which holds just the rows its WHERE selects, and
+every partial index must be used by one of the paths. ``SCAN <table>
+USING INDEX`` (a walk of the whole index) and bare ``SCAN <table>`` both
+fail, as does ``USE TEMP B-TREE FOR ORDER BY``: a listing must read its
+index in the keyset order rather than sort every matching row. Exits non-zero on any failure, so it can be wired into CI.
+"""
+import sys
+
+from sqlalchemy import event
+
+from common import seed, temp_engine
+
+import crud, models
+
+
+def capture_plans(engine):
+    plans = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def explain(conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(("SELECT", "UPDATE")):
+            return
+        rows = cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        plans.append((statement, [row[-1] for row in rows]))
+
+    return plans
+
+
+def partial_indexes():
+    return {
+        index.name
+        for table in models.Base.metadata.tables.values()
+        for index in table.indexes
+        if index.dialect_options["sqlite"]["where"] is not None
+    }
+
+
+def scans(plan, partial):
+    """Plan lines that read a whole table or index (other than a partial one), or sort for ORDER BY."""
+    return [
+        line for line in plan
+        if line.startswith("SCAN ") and not any(line.endswith(f" INDEX {name}") for name in partial)
+        or line == "USE TEMP B-TREE FOR ORDER BY"
+    ]
+
+
+def main():
+    with temp_engine() as (engine, SessionLocal):
+        seed(engine, changes=20000)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("UPDATE changes SET archived = 1 WHERE id % 3 != 0")
+            conn.exec_driver_sql("ANALYZE")
+
+        plans = capture_plans(engine)
+        db = SessionLocal()
+        cases = {
+            "get_changes(archived=False)": lambda: crud.get_changes(db, archived=False),
+            "get_changes(app, version, archived)": lambda: crud.get_changes(db, app="app-1", version="1.1.0", archived=False),
+            "get_changes(app)": lambda: crud.get_changes(db, app="app-1"),
+            "get_changes(current_only)": lambda: crud.get_changes(db, current_only=True, archived=False),
+            "get_app_changes_by_version": lambda: crud.get_app_changes_by_version(db, "app-1", "1.1.0", archived=False),
+            "archive_changes_for_milestone": lambda: crud.archive_changes_for_milestone(db, "m-1"),
+        }
+        partial = partial_indexes()
+        used = set()
+        failed = False
+        for name, run in cases.items():
+            del plans[:]
+            run()
+            for statement, plan in plans:
+                bad = scans(plan, partial)
+                used.update(index for index in partial if any(line.endswith(f" INDEX {index}") for line in plan))
+                status = "FAIL" if bad else "ok"
+                failed = failed or bool(bad)
+                print(f"[{status}] {name}: {' | '.join(plan)}")
+        for index in sorted(partial - used):
+            failed = True
+            print(f"[FAIL] partial index {index} is not used by any checked query")
+        db.rollback()
+        db.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Check primary / replica routing with SQLite file copies as replicas.
+
+Seeds the benchmark database, copies it to two replica files, and adds a
+third replica URL that cannot be opened. Then, through the ASGI app, it
+checks that:
+
+* GET requests are served by the healthy replicas, round robin, and never
+  by the broken one;
+* writes go to the primary and set the stickiness cookie;
+* a client holding the cookie reads its own write from the primary, while
+  a client without it still reads the (stale) replica;
+* the replicas refuse writes.
+
+Exits non-zero on any failure. Run from the repository root; it works in
+either DATABASE_MODE.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+_replica_dir = tempfile.mkdtemp(prefix="devoptics-replicas-")
+_replica_files = [os.path.join(_replica_dir, f"replica-{i}.db") for i in range(2)]
+os.environ["DATABASE_REPLICA_URLS"] = ",".join(
+    [f"sqlite:///{path}" for path in _replica_files] + [f"sqlite:///{_replica_dir}/missing/replica.db"]
+)
+os.environ.setdefault("REPLICA_HEALTH_INTERVAL", "0.2")
+
+import asyncio
+import time
+
+from sqlalchemy import event
+
+from common import load_app, seed, temp_engine
+
+import database
+
+
+def count_statements(engines):
+    counts = {name: 0 for name in engines}
+    for name, engine in engines.items():
+        def record(*args, name=name):
+            counts[name] += 1
+        event.listen(engine, "before_cursor_execute", record)
+    return counts
+
+
+async def run():
+    import httpx
+
+    app = load_app()
+    # In async mode requests go through the async engines' sync_engine
+    engines = {"primary": (database.async_engine.sync_engine if database.ASYNC_MODE else database.engine)}
+    for replica in database.replicas.replicas:
+        engines[replica.name] = replica.sync_engines()[-1]
+    counts = count_statements(engines)
+    failures = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as reader, \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as writer:
+        database.replicas.pick()  # start the health checks
+        time.sleep(1)
+        healthy = [r.name for r in database.replicas.replicas if r.healthy]
+        if len(healthy) != 2:
+            failures.append(f"expected 2 healthy replicas, got {healthy}")
+
+        before = dict(counts)
+        for _ in range(10):
+            (await reader.get("/changes/?limit=5")).raise_for_status()
+        served = {name: counts[name] - before[name] for name in counts}
+        print(f"10 reads: {served}")
+        if served["primary"] or any(not served[name] for name in healthy):
+            failures.append("reads were not spread over the healthy replicas only")
+
+        response = await writer.post("/apps/", json={"app": "written-app"})
+        response.raise_for_status()
+        if "devoptics_primary" not in response.cookies:
+            failures.append("write did not set the stickiness cookie")
+        # /apps/{id} is not cached, so it shows which database answered
+        path = f"/apps/{response.json()['id']}"
+        own, other = (await writer.get(path)).status_code, (await reader.get(path)).status_code
+        print(f"reading the new app: writer {own}, other client {other}")
+        if own != 200:
+            failures.append("the writing client did not read its own write")
+        if other != 404:
+            failures.append("a client without the cookie read from the primary")
+
+    replica = database.replicas.replicas[0]
+    try:
+        with replica.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM apps")
+        failures.append("replica accepted a write")
+    except Exception as exc:
+        print(f"replica write refused: {type(exc).__name__}")
+
+    print(f"replicas: {[(r['name'].rsplit('/', 1)[-1], r['healthy']) for r in database.replicas.status()]}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    try:
+        with temp_engine() as (engine, _):
+            seed(engine, apps=3, versions_per_app=3, changes=500, milestones=2)
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+            for path in _replica_files:
+                shutil.copyfile(database.engine.url.database, path)
+            return asyncio.run(run())
+    finally:
+        shutil.rmtree(_replica_dir, True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
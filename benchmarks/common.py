@@ -0,0 +1,136 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against a throwaway SQLite file so they never touch
+devoptics.db. To benchmark another database, point BENCH_DATABASE_URL at an
+empty scratch database: the scripts create their tables there and drop
+them afterwards, and refuse to start if it already has tables.
+Run them from the repository root, e.g.::
+
+    python benchmarks/bench_pagination.py --changes 200000
+"""
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.realpath(os.path.join(os.path.dirname(__file__), '..')))
+
+# ``database`` reads DATABASE_URL when first imported, so point it at the
+# benchmark database before anything below imports it.
+if not os.getenv("BENCH_DATABASE_URL"):
+    _tmp = tempfile.mkdtemp(prefix="devoptics-bench-")
+    atexit.register(shutil.rmtree, _tmp, True)
+    os.environ["BENCH_DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+
+from sqlalchemy import insert, inspect
+
+import database
+import models
+
+CATEGORIES = [c.value for c in models.CategoryEnum]
+
+
+@contextmanager
+def temp_engine():
+    """Yield ``(engine, SessionLocal)`` with a fresh schema on the benchmark database.
+
+    The database must be empty, so the tables dropped afterwards are only
+    ever ones created here.
+    """
+    engine = database.engine
+    existing = inspect(engine).get_table_names()
+    if existing:
+        engine.dispose()
+        raise SystemExit(
+            f"{engine.url.render_as_string(hide_password=True)} already has tables "
+            f"({', '.join(sorted(existing)[:5])}, ...); benchmarks need an empty database"
+        )
+    models.Base.metadata.create_all(bind=engine)
+    try:
+        yield engine, database.SessionLocal
+    finally:
+        models.Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+def load_app():
+    """Import the FastAPI app; it shares the benchmark database with ``temp_engine``.
+
+    DATABASE_MODE and the other database settings are read from the
+    environment when ``database`` is first imported.
+    """
+    import main
+    return main.app
+
+
+def seed(engine, apps=10, versions_per_app=10, changes=10000, milestones=5, batch=5000, rng=None,
+         vocabulary=None):
+    """Populate the schema with synthetic apps, versions, deployments and changes.
+
+    With a ``vocabulary``, change titles and descriptions are random words
+    drawn from it instead of numbered placeholders.
+    """
+    rng = rng or random.Random(42)
+    start = datetime(2020, 1, 1)
+    app_names = [f"app-{i}" for i in range(apps)]
+    milestone_names = [f"m-{i}" for i in range(milestones)]
+    version_pairs = [(a, f"1.{v}.0") for a in app_names for v in range(versions_per_app)]
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.App.__table__), [{"app": a, "description": a} for a in app_names])
+        conn.execute(insert(models.Milestone.__table__), [
+            {"milestone": m, "goal": m, "dt_milestone": "2020-01-01", "proj_ver": "1.0.0", "complete": False}
+            for m in milestone_names
+        ])
+        conn.execute(insert(models.Version.__table__), [
+            {
+                "app": a, "version": v, "dt_started": date(2020, 1, 1) + timedelta(days=i),
+                "delta_maj": 0, "delta_min": 1, "delta_pat": 0,
+                "current": v == f"1.{versions_per_app - 1}.0",
+                **models.semver_values(v),
+            }
+            for i, (a, v) in enumerate(version_pairs)
+        ])
+        conn.execute(insert(models.Deployment.__table__), [
+            {
+                "app": a, "version": v, "milestone": rng.choice(milestone_names),
+                "dtt_deploy": start + timedelta(days=i), "change_log": f"deploy {a} {v}",
+            }
+            for i, (a, v) in enumerate(version_pairs)
+        ])
+        rows = []
+        for i in range(changes):
+            a, v = rng.choice(version_pairs)
+            if vocabulary:
+                title = " ".join(rng.choices(vocabulary, k=4))
+                desc = " ".join(rng.choices(vocabulary, k=20))
+            else:
+                title, desc = f"change {i}", f"description for change {i}"
+            rows.append({
+                "app": a, "version": v,
+                "dtt_change": start + timedelta(seconds=rng.randrange(0, 5 * 365 * 86400)),
+                "change_title": title, "change_desc": desc,
+                "category": rng.choice(CATEGORIES), "dev": "bench", "archived": False,
+            })
+            if len(rows) >= batch:
+                conn.execute(insert(models.Change.__table__), rows)
+                rows = []
+        if rows:
+            conn.execute(insert(models.Change.__table__), rows)
+    return version_pairs
+
+
+def timed(fn, repeat=5):
+    """Best-of-``repeat`` wall time of ``fn()`` in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
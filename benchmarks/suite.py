@@ -0,0 +1,261 @@
+"""API benchmark and load-test suite.
+
+Seeds a synthetic dataset, then drives the app in process through httpx's
+ASGI transport:
+
+1. endpoints: each main read endpoint is requested ``--repeat`` times in a
+   row; latency percentiles are reported per endpoint.
+2. load: ``--concurrency`` clients run for ``--duration`` seconds, each
+   picking reads, change creates and milestone completions by weight.
+
+Results are written as JSON (``--output``). With ``--baseline`` a previous
+result file is compared against and the run exits non-zero when a p50 / p95
+got slower by more than ``--max-ratio`` (ignoring differences below
+``--min-delta-ms``) or a load operation failed more often than in the
+baseline, so it can gate CI. Example::
+
+    python benchmarks/suite.py --changes 200000 --output before.json
+    python benchmarks/suite.py --changes 200000 --baseline before.json
+
+DATABASE_MODE, SQLITE_PRAGMAS, CACHE_BACKEND etc. are read from the
+environment as usual and recorded in the result.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from common import load_app, seed, temp_engine
+
+ENDPOINTS = {
+    "apps": "/apps/",
+    "apps_include_versions": "/apps/?include=versions",
+    "versions": "/versions/",
+    "deployments": "/deployments/",
+    "milestones": "/milestones/",
+    "changes": "/changes/",
+    "changes_unarchived": "/changes/?archived=false&limit=50",
+    "changes_by_app": "/changes/?app=app-1&limit=50",
+    "changes_by_app_version": "/apps/app-1/versions/1.1.0/changes/?limit=50",
+    "changes_filter_options": "/changes/filter-options",
+    "changes_search": "/changes/search?q=change",
+    "dashboard_summary": "/dashboard/summary",
+}
+
+# Load scenario mix: operation -> weight
+LOAD_MIX = {
+    "read_changes": 50,
+    "read_dashboard": 10,
+    "read_apps": 15,
+    "create_change": 20,
+    "complete_milestone": 5,
+}
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        "n": len(samples_ms),
+        "min_ms": round(min(samples_ms), 3),
+        "p50_ms": round(percentile(samples_ms, 0.50), 3),
+        "p95_ms": round(percentile(samples_ms, 0.95), 3),
+        "p99_ms": round(percentile(samples_ms, 0.99), 3),
+        "mean_ms": round(statistics.fmean(samples_ms), 3),
+    }
+
+
+async def timed_request(client, method, path, **kwargs):
+    t0 = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    elapsed = (time.perf_counter() - t0) * 1000
+    response.raise_for_status()
+    return elapsed
+
+
+async def run_endpoints(client, repeat):
+    results = {}
+    for name, path in ENDPOINTS.items():
+        await timed_request(client, "GET", path)  # warm up
+        samples = [await timed_request(client, "GET", path) for _ in range(repeat)]
+        results[name] = summarize(samples)
+        print(f"  {name:26} p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms")
+    return results
+
+
+async def run_load(client, args, scale):
+    rng = random.Random(1)
+    operations, weights = zip(*LOAD_MIX.items())
+    samples = {op: [] for op in operations}
+    errors = {op: 0 for op in operations}
+    deadline = time.perf_counter() + args.duration
+
+    async def operation(op):
+        if op == "read_changes":
+            app = f"app-{rng.randrange(scale['apps'])}"
+            return await timed_request(client, "GET", f"/changes/?app={app}&archived=false&limit=50")
+        if op == "read_dashboard":
+            return await timed_request(client, "GET", "/dashboard/summary")
+        if op == "read_apps":
+            return await timed_request(client, "GET", "/apps/")
+        if op == "create_change":
+            app = f"app-{rng.randrange(scale['apps'])}"
+            version = f"1.{rng.randrange(scale['versions_per_app'])}.0"
+            return await timed_request(client, "POST", "/changes/", json={
+                "app": app, "version": version, "dtt_change": datetime.utcnow().isoformat(),
+                "change_title": "load test change", "change_desc": "created by the load scenario",
+                "category": "tweaks", "dev": "bench",
+            })
+        # Re-open then complete a milestone; completion archives its changes
+        milestone_id = rng.randrange(scale["milestones"]) + 1
+        body = {"milestone": f"m-{milestone_id - 1}", "goal": "bench", "dt_milestone": "2020-01-01",
+                "proj_ver": "1.0.0", "complete": False}
+        (await client.put(f"/milestones/{milestone_id}", json=body)).raise_for_status()
+        return await timed_request(client, "PUT", f"/milestones/{milestone_id}", json=dict(body, complete=True))
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            op = rng.choices(operations, weights)[0]
+            try:
+                samples[op].append(await operation(op))
+            except Exception:
+                errors[op] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+
+    total = sum(len(s) for s in samples.values())
+    result = {
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 1),
+        "errors": errors,
+        "operations": {op: summarize(s) for op, s in samples.items() if s},
+    }
+    print(f"  {total} operations, {result['throughput_rps']} ops/s, errors {sum(errors.values())}")
+    for op, stats in result["operations"].items():
+        print(f"  {op:26} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  n={stats['n']}")
+    return result
+
+
+async def run(args, scale):
+    import httpx
+
+    transport = httpx.ASGITransport(app=load_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        print("endpoints:")
+        endpoints = await run_endpoints(client, args.repeat)
+        print("load:")
+        load = await run_load(client, args, scale)
+    return endpoints, load
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def regressions(result, baseline, max_ratio, min_delta_ms):
+    """Yield a message for each p50/p95 that is slower than the baseline allows,
+    and for each load operation with more errors than in the baseline."""
+    previous_errors = baseline.get("load", {}).get("errors", {})
+    for name, count in result["load"]["errors"].items():
+        before = previous_errors.get(name, 0)
+        if count > before:
+            yield f"load.{name}.errors: {before} -> {count}"
+    pairs = [("endpoints", name, result["endpoints"], baseline.get("endpoints", {})) for name in result["endpoints"]]
+    pairs += [
+        ("load", name, result["load"]["operations"], baseline.get("load", {}).get("operations", {}))
+        for name in result["load"]["operations"]
+    ]
+    for section, name, current, previous in pairs:
+        if name not in previous:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            now, before = current[name][key], previous[name][key]
+            if now > before * max_ratio and now - before > min_delta_ms:
+                yield f"{section}.{name}.{key}: {before:.2f} -> {now:.2f} ms ({now / before:.2f}x)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=20)
+    parser.add_argument("--versions-per-app", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=50000)
+    parser.add_argument("--milestones", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=30, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="load scenario length in seconds")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previous results file")
+    parser.add_argument("--max-ratio", type=float, default=1.25)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    scale = {
+        "apps": args.apps,
+        "versions_per_app": args.versions_per_app,
+        "changes": args.changes,
+        "milestones": args.milestones,
+    }
+    with temp_engine() as (engine, _):
+        t0 = time.perf_counter()
+        seed(engine, apps=args.apps, versions_per_app=args.versions_per_app,
+             changes=args.changes, milestones=args.milestones)
+        print(f"seeded {scale} in {time.perf_counter() - t0:.1f}s")
+        endpoints, load = asyncio.run(run(args, scale))
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database_mode": os.getenv("DATABASE_MODE", "sync"),
+            "settings": {k: v for k, v in os.environ.items()
+                         if k.startswith(("DB_", "SQLITE_", "CACHE_")) or k == "DATABASE_MODE"},
+            "scale": scale,
+            "repeat": args.repeat,
+        },
+        "endpoints": endpoints,
+        "load": load,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = list(regressions(result, baseline, args.max_ratio, args.min_delta_ms))
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            return 1
+        print(f"no regressions against {args.baseline} (max ratio {args.max_ratio})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
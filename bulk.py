@@ -0,0 +1,53 @@
+import json
+from typing import List, Tuple
+
+from pydantic import ValidationError
+
+import schemas
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def _error_details(exc: ValidationError) -> List[dict]:
+    return [{"loc": list(e["loc"]), "msg": e["msg"], "type": e["type"]} for e in exc.errors()]
+
+
+def _raw_items(body: bytes, content_type: str):
+    """Yield ``(index, obj, error)`` for each item of a JSON array or NDJSON body."""
+    if content_type.split(";")[0].strip().lower() in NDJSON_TYPES:
+        index = 0
+        for line in body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line), None
+            except ValueError as exc:
+                yield index, None, {"loc": [], "msg": f"Invalid JSON: {exc}", "type": "json_invalid"}
+            index += 1
+        return
+    try:
+        items = json.loads(body or b"[]")
+    except ValueError as exc:
+        raise ValueError(f"Invalid JSON body: {exc}")
+    if not isinstance(items, list):
+        raise ValueError("Expected a JSON array or an NDJSON stream")
+    for index, item in enumerate(items):
+        yield index, item, None
+
+
+def parse_items(body: bytes, content_type: str, schema) -> Tuple[list, List[schemas.BulkItemError]]:
+    """Validate each item of a bulk request against ``schema``.
+
+    Returns the valid ``(index, model)`` pairs and a BulkItemError for every
+    item that failed. Raises ValueError if the body itself is unreadable.
+    """
+    valid, errors = [], []
+    for index, raw, error in _raw_items(body, content_type or ""):
+        if error:
+            errors.append(schemas.BulkItemError(index=index, errors=[error]))
+            continue
+        try:
+            valid.append((index, schema.parse_obj(raw)))
+        except ValidationError as exc:
+            errors.append(schemas.BulkItemError(index=index, errors=_error_details(exc)))
+    return valid, errors
@@ -0,0 +1,176 @@
+"""Read-through cache for read-mostly lookups (apps, milestones, filter options).
+
+Entries live in a namespace whose generation token is part of every key, so
+``invalidate(namespace)`` drops all of its entries by writing a new token,
+whatever parameters they were cached under. Entries also expire after
+a TTL. With several workers a per-process cache only sees its own
+invalidations, so the callers in crud.py also put the table_versions
+counters of the tables they read into the key (see crud._cached).
+
+The backend is chosen with CACHE_BACKEND: ``memory`` (default, in-process
+LRU), ``redis`` (needs the ``redis`` package and CACHE_REDIS_URL) or
+``none``.
+"""
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "1024"))
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """Storage interface; a Redis-like store only needs get/set-with-expiry/delete."""
+
+    def get(self, key: str):
+        """Return the stored value, or ``_MISSING``."""
+        raise NotImplementedError
+
+    def set(self, key: str, value, ttl: Optional[float]):
+        """Store ``value``; a ``ttl`` of None means no expiry."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class MemoryLRUCache(CacheBackend):
+    def __init__(self, maxsize: int = CACHE_MAXSIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            expires = float("inf") if ttl is None else time.monotonic() + ttl
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class RedisCache(CacheBackend):
+    """Adapter for a redis-py compatible client; values are pickled."""
+
+    def __init__(self, client, prefix: str = "devoptics:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return _MISSING if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl):
+        px = None if ttl is None else int(ttl * 1000)
+        self.client.set(self.prefix + key, pickle.dumps(value), px=px)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class NullCache(CacheBackend):
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+class Cache:
+    def __init__(self, backend: CacheBackend, ttl: float = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.invalidations = defaultdict(int)
+
+    def _generation(self, namespace):
+        # A lost (evicted) token is replaced by a fresh one, which can only
+        # cause misses, never resurrect entries from before an invalidation.
+        generation = self.backend.get(f"gen:{namespace}")
+        if generation is _MISSING:
+            generation = self._new_generation(namespace)
+        return generation
+
+    def _new_generation(self, namespace):
+        generation = uuid.uuid4().hex[:12]
+        self.backend.set(f"gen:{namespace}", generation, None)
+        return generation
+
+    def get_or_set(self, namespace: str, params, compute, ttl: Optional[float] = None):
+        """Return the cached value for ``params`` or store ``compute()``.
+
+        ``ttl`` shortens the expiry of a newly stored value below the cache's own.
+        """
+        key = f"{namespace}:{self._generation(namespace)}:{params!r}"
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            with self._lock:
+                self.hits[namespace] += 1
+            return value
+        with self._lock:
+            self.misses[namespace] += 1
+        value = compute()
+        self.backend.set(key, value, self.ttl if ttl is None else min(ttl, self.ttl))
+        return value
+
+    def invalidate(self, namespace: str):
+        self._new_generation(namespace)
+        with self._lock:
+            self.invalidations[namespace] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses) | set(self.invalidations)
+            return {
+                "backend": type(self.backend).__name__,
+                "ttl": self.ttl,
+                "namespaces": {
+                    ns: {
+                        "hits": self.hits[ns],
+                        "misses": self.misses[ns],
+                        "invalidations": self.invalidations[ns],
+                    }
+                    for ns in sorted(namespaces)
+                },
+            }
+
+
+def _default_backend() -> CacheBackend:
+    if CACHE_BACKEND == "none":
+        return NullCache()
+    if CACHE_BACKEND == "redis":
+        import redis  # optional dependency
+
+        return RedisCache(redis.Redis.from_url(os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")))
+    return MemoryLRUCache()
+
+
+cache = Cache(_default_backend())
@@ -0,0 +1,104 @@
+"""Group commit: concurrent writes collected into one transaction.
+
+Every POST /changes/ used to be its own commit, so with many clients
+writing at once (CI agents reporting changes) throughput was bounded by
+commit latency and by writers queueing for SQLite's single write lock. With
+WRITE_COALESCE=1, create requests are handed to a Coalescer instead. It
+waits up to WRITE_COALESCE_WINDOW_MS (default 5) after the first pending
+item, or until WRITE_COALESCE_MAX_BATCH items (default 100) are waiting,
+then passes the whole batch to one flush call that commits it once. Items
+that arrive while a batch is being written form the next batch, so under
+load the window is mostly spent writing rather than waiting.
+
+The flush function returns one result per item, either the item's row or
+the exception it raised, and each caller gets back its own result. A
+failing item therefore only fails its own request (see
+crud.create_changes_grouped).
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, List
+
+WRITE_COALESCE = os.getenv("WRITE_COALESCE", "0").strip().lower() in ("1", "true", "yes", "on")
+WRITE_COALESCE_WINDOW_MS = float(os.getenv("WRITE_COALESCE_WINDOW_MS", "5"))
+WRITE_COALESCE_MAX_BATCH = int(os.getenv("WRITE_COALESCE_MAX_BATCH", "100"))
+
+
+class Coalescer:
+    """Batches concurrent ``submit(item)`` calls into ``flush(items)`` calls.
+
+    Batches are flushed one at a time, from a task on the event loop.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List], Awaitable[List]],
+        window: float = WRITE_COALESCE_WINDOW_MS / 1000,
+        max_batch: int = WRITE_COALESCE_MAX_BATCH,
+    ):
+        self.flush = flush
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._full = None
+        self._task = None
+        self.batches = 0
+        self.items = 0
+        self.failed = 0
+        self.largest = 0
+
+    async def submit(self, item):
+        """Queue ``item`` for the next batch and return its flush result.
+
+        Raises the exception the flush reported for this item.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, loop.time()))
+        if self._task is None or self._task.done():
+            self._full = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        elif len(self._pending) >= self.max_batch:
+            self._full.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            # The window runs from the oldest waiting item, so items that
+            # queued up during the previous flush are not held back again.
+            wait = self._pending[0][2] + self.window - loop.time()
+            if wait > 0 and len(self._pending) < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            try:
+                results = await self.flush([item for item, _, _ in batch])
+            except Exception as exc:
+                results = [exc] * len(batch)
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(result)
+                elif not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "failed": self.failed,
+            "largest_batch": self.largest,
+            "mean_batch": round(self.items / self.batches, 2) if self.batches else 0,
+        }
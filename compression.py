@@ -0,0 +1,196 @@
+"""Response compression negotiated from Accept-Encoding.
+
+gzip is always available; brotli (``br``) and zstd are offered when the
+``brotli`` / ``zstandard`` packages are installed. For equal q-values the
+preference is br, zstd, gzip. Bodies under COMPRESS_MIN_SIZE bytes (default
+1024) are sent as is. Streaming responses are compressed chunk by chunk and
+flushed after every chunk, so exports still arrive incrementally.
+
+Responses that already have a Content-Encoding, partial content, already
+compressed media (images, audio, video, archives), event streams and proxy
+offloaded files (X-Accel-Redirect / X-Sendfile) are left untouched. A
+compressed response's ETag is made weak, since its bytes differ from the
+identity representation; conditional GET compares weakly (see etags.py).
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli  # optional dependency
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # optional dependency
+except ImportError:
+    zstandard = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+SKIP_TYPES = ("image/", "audio/", "video/", "font/woff", "application/zip", "application/gzip",
+              "application/x-gzip", "application/zstd", "text/event-stream")
+COMPRESSIBLE_IMAGES = ("image/svg+xml",)
+
+
+class _Gzip:
+    def __init__(self):
+        self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data) + self._obj.flush()
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self):
+        self._obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def available_codings() -> dict:
+    """Supported content codings, most preferred first."""
+    codings = {}
+    if brotli is not None:
+        codings["br"] = _Brotli
+    if zstandard is not None:
+        codings["zstd"] = _Zstd
+    codings["gzip"] = _Gzip
+    return codings
+
+
+CODINGS = available_codings()
+
+
+def negotiate(accept_encoding: str):
+    """Pick a coding from an Accept-Encoding header, or None for identity."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in CODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def add_vary(headers: MutableHeaders, token: str) -> None:
+    """Add a token to the Vary header unless it is already listed (or Vary is ``*``)."""
+    tokens = [t.strip() for value in headers.getlist("vary") for t in value.split(",") if t.strip()]
+    if "*" in tokens or token.lower() in (t.lower() for t in tokens):
+        return
+    headers["Vary"] = ", ".join(tokens + [token])
+
+
+def _compressible(status: int, headers: Headers) -> bool:
+    if status != 200 or "content-encoding" in headers:
+        return False
+    if "x-accel-redirect" in headers or "x-sendfile" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(COMPRESSIBLE_IMAGES):
+        return True
+    return not content_type.startswith(SKIP_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        coding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if coding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        def encoded_headers(message):
+            headers = MutableHeaders(raw=message["headers"])
+            headers["Content-Encoding"] = coding
+            add_vary(headers, "Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            return headers
+
+        async def wrapped_send(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                passthrough = not _compressible(message["status"], Headers(raw=message["headers"]))
+                if passthrough:
+                    add_vary(MutableHeaders(raw=message["headers"]), "Accept-Encoding")
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body:
+                    # Whole body in one message
+                    if len(body) < self.minimum_size:
+                        add_vary(MutableHeaders(raw=start["headers"]), "Accept-Encoding")
+                        await send(start)
+                        await send(message)
+                        return
+                    codec = CODINGS[coding]()
+                    compressed = codec.compress(body) + codec.finish()
+                    headers = encoded_headers(start)
+                    headers["Content-Length"] = str(len(compressed))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                compressor = CODINGS[coding]()
+                headers = encoded_headers(start)
+                del headers["Content-Length"]
+                await send(start)
+
+            chunk = compressor.compress(body) if body else b""
+            if not more_body:
+                chunk += compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, wrapped_send)
@@ -1,26 +1,155 @@
+import os
+import random
 from datetime import datetime
-from typing import Optional
-
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
-import models, schemas
+from typing import Callable, Collection, List, Optional, Sequence
+
+from sqlalchemy import and_, delete, event, func, insert, select, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, aliased, raiseload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+import database, models, schemas, pagination, search, serialize, manifests, jobs
+from events import publish
+from cache import cache
+
+# --- Relationship expansion (?include=) ---
+# Each included relationship is loaded for the whole page with one
+# SELECT ... WHERE key IN (...) (selectinload), so the number of queries does
+# not grow with the number of rows. Relationships that were not asked for
+# raise instead of lazy loading one row at a time.
+#
+# Changes grow without bound, so an included "changes" list holds at most
+# INCLUDE_LIMIT rows per app or version (the first by id), loaded with one
+# ROW_NUMBER() query for the page instead of selectinload; the full list is
+# paged at /changes/?app=&version=.
+INCLUDE_LIMIT = int(os.getenv("INCLUDE_LIMIT", "100"))
+
+INCLUDES = {
+    models.App: {
+        "versions": (models.App.versions, schemas.Version),
+        "deployments": (models.App.deployments, schemas.Deployment),
+        "changes": (models.App.changes, schemas.Change),
+    },
+    models.Version: {
+        "deployments": (models.Version.deployments, schemas.Deployment),
+        "changes": (models.Version.changes, schemas.Change),
+    },
+    models.Milestone: {
+        "deployments": (models.Milestone.deployments, schemas.Deployment),
+    },
+}
+
+CAPPED_INCLUDES = {(models.App, "changes"), (models.Version, "changes")}
+
+EXPANDED_SCHEMAS = {
+    models.App: (schemas.App, schemas.AppExpanded),
+    models.Version: (schemas.Version, schemas.VersionExpanded),
+    models.Milestone: (schemas.Milestone, schemas.MilestoneExpanded),
+}
+
+def parse_includes(model, include: Optional[str]) -> List[str]:
+    """Split a comma-separated ``include`` value, rejecting unknown names."""
+    names = list(dict.fromkeys(n.strip() for n in (include or "").split(",") if n.strip()))
+    unknown = [n for n in names if n not in INCLUDES[model]]
+    if unknown:
+        raise ValueError(
+            f"Unknown include {', '.join(unknown)}; expected any of {', '.join(INCLUDES[model])}"
+        )
+    return names
+
+def include_tables(model, includes: Sequence[str]) -> List[str]:
+    return [INCLUDES[model][name][0].property.entity.local_table.name for name in includes]
+
+def _with_includes(query, model, includes: Sequence[str]):
+    loaders = [selectinload(INCLUDES[model][name][0]) for name in includes if (model, name) not in CAPPED_INCLUDES]
+    return query.options(*loaders, raiseload("*"))
+
+def _load_capped(db: Session, objs, model, name: str):
+    """Load INCLUDE_LIMIT rows of the ``name`` collection for each of ``objs``."""
+    prop = INCLUDES[model][name][0].property
+    local = [model.__mapper__.get_property_by_column(col).key for col, _ in prop.local_remote_pairs]
+    remote = [col for _, col in prop.local_remote_pairs]
+    target = prop.entity.class_
+    keys = {tuple(getattr(obj, attr) for attr in local) for obj in objs}
+    found = {key: [] for key in keys}
+    if keys:
+        ranked = (
+            select(target, func.row_number().over(partition_by=remote, order_by=target.id).label("n"))
+            .where(tuple_(*remote).in_(keys) if len(remote) > 1 else remote[0].in_([key[0] for key in keys]))
+            .subquery()
+        )
+        row = aliased(target, ranked)
+        for obj in db.query(row).filter(ranked.c.n <= INCLUDE_LIMIT):
+            found[tuple(getattr(obj, col.key) for col in remote)].append(obj)
+    for obj in objs:
+        set_committed_value(obj, name, found[tuple(getattr(obj, attr) for attr in local)])
+
+def _expand_all(db: Session, objs, model, includes: Sequence[str]):
+    for name in includes:
+        if (model, name) in CAPPED_INCLUDES:
+            _load_capped(db, objs, model, name)
+    return [_expand(obj, model, includes) for obj in objs]
+
+def _expand(obj, model, includes: Sequence[str]):
+    base, expanded = EXPANDED_SCHEMAS[model]
+    related = {
+        name: [INCLUDES[model][name][1].from_orm(o) for o in sorted(getattr(obj, name), key=lambda o: o.id)]
+        for name in includes
+    }
+    return expanded(**base.from_orm(obj).dict(), **related)
 
 # --- Apps ---
-def get_apps(db: Session, skip: int=0, limit: int=100):
-    return db.query(models.App).offset(skip).limit(limit).all()
+def _page(query, skip: int, limit: int, cursor: Optional[str]):
+    # A cursor replaces OFFSET; skip is only honoured for offset paging.
+    if not cursor:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+# Cached reads are keyed by their tables' write counters, like the dashboard
+# below: the ETag comes from the same counters, so a write made by another
+# worker can't leave this one serving its old body under the new ETag.
+def _cached(db: Session, namespace: str, tables, params, load):
+    key = (tuple(version for _, version, _ in get_table_versions(db, tables)), params)
+    return cache.get_or_set(namespace, key, load, db.info.get("cache_ttl"))
+
+def get_apps(db: Session, skip: int=0, limit: int=100, cursor: Optional[str]=None, includes: Sequence[str]=()):
+    def load():
+        query = _with_includes(db.query(models.App), models.App, includes)
+        query = pagination.apply_keyset(query, None, models.App.id, cursor)
+        return _expand_all(db, _page(query, skip, limit, cursor), models.App, includes)
+    # Expansions read other tables, whose writes don't invalidate "apps"
+    if includes:
+        return load()
+    return _cached(db, "apps", ("apps",), (skip, limit, cursor), load)
 
 def create_app(db: Session, app: schemas.AppCreate):
     db_obj = models.App(**app.dict())
     db.add(db_obj)
     db.commit()
+    cache.invalidate("apps")
     db.refresh(db_obj)
+    publish("apps", "created", db_obj, schemas.App)
     return db_obj
 
 # You can add get_by_name, update, delete similarly…
 
 # --- Versions ---
-def get_versions(db: Session, skip=0, limit=100):
-    return db.query(models.Version).offset(skip).limit(limit).all()
+# rows=True selects only the response schema's columns and returns plain
+# result rows for the fast serialisation path (see serialize.py).
+def get_versions(db: Session, skip=0, limit=100, cursor: Optional[str]=None, includes: Sequence[str]=(), rows: bool=False):
+    if rows and not includes:
+        base = db.query(*serialize.columns(models.Version, schemas.Version))
+    else:
+        base = _with_includes(db.query(models.Version), models.Version, includes)
+    query = pagination.apply_keyset(
+        base,
+        models.Version.dt_started,
+        models.Version.id,
+        cursor,
+        pagination.parse_date,
+    )
+    if rows and not includes:
+        return _page(query, skip, limit, cursor)
+    return _expand_all(db, _page(query, skip, limit, cursor), models.Version, includes)
 
 def create_version(db: Session, version: schemas.VersionCreate):
     if version.current:
@@ -33,13 +162,26 @@ def create_version(db: Session, version: schemas.VersionCreate):
             raise ValueError("A current version already exists for this app; deactivate it before adding another current version.")
     db_obj = models.Version(**version.dict())
     db.add(db_obj)
+    # Manifests place each change by its Version row's semver key, so a new
+    # row can move changes into (or out of) the app's existing manifests
+    db.flush()
+    manifests.rebuild_apps(db, {db_obj.app})
     db.commit()
+    cache.invalidate("versions")
     db.refresh(db_obj)
+    publish("versions", "created", db_obj, schemas.Version)
     return db_obj
 
 # --- Deployments ---
-def get_deployments(db: Session, skip=0, limit=100):
-    return db.query(models.Deployment).offset(skip).limit(limit).all()
+def get_deployments(db: Session, skip=0, limit=100, cursor: Optional[str]=None, rows: bool=False):
+    query = pagination.apply_keyset(
+        db.query(*serialize.columns(models.Deployment, schemas.Deployment)) if rows else db.query(models.Deployment),
+        models.Deployment.dtt_deploy,
+        models.Deployment.id,
+        cursor,
+        pagination.parse_datetime,
+    )
+    return _page(query, skip, limit, cursor)
 
 def create_deployment(db: Session, dep: schemas.DeploymentCreate):
     db_obj = models.Deployment(**dep.dict())
@@ -54,25 +196,28 @@ def create_deployment(db: Session, dep: schemas.DeploymentCreate):
     )
     if version_obj and version_obj.current:
         version_obj.current = False
+    db.flush()
+    manifests.build_around(db, db_obj)
     db.commit()
     db.refresh(db_obj)
+    publish("deployments", "created", db_obj, schemas.Deployment)
     if version_obj:
         db.refresh(version_obj)
+        publish("versions", "updated", version_obj, schemas.Version)
     return db_obj
 
 # --- Changes ---
-def get_changes(
-    db: Session,
-    skip: int = 0,
-    limit: int = 100,
+def _filter_changes(
+    query,
     archived: Optional[bool] = None,
     current_only: Optional[bool] = None,
     app: Optional[str] = None,
     version: Optional[str] = None,
 ):
-    query = db.query(models.Change)
+    # Works on both ORM queries and select() statements
     if archived is not None:
-        query = query.filter(models.Change.archived == archived)
+        # IS <literal> rather than = :param so the partial unarchived index applies
+        query = query.filter(models.Change.archived.is_(archived))
     if app:
         query = query.filter(models.Change.app == app)
     if version:
@@ -85,28 +230,169 @@ def get_changes(
                 models.Change.version == models.Version.version,
             ),
         ).filter(models.Version.current.is_(True))
-    return query.offset(skip).limit(limit).all()
+    return query
+
+def get_changes(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    archived: Optional[bool] = None,
+    current_only: Optional[bool] = None,
+    app: Optional[str] = None,
+    version: Optional[str] = None,
+    cursor: Optional[str] = None,
+    rows: bool = False,
+):
+    base = db.query(*serialize.columns(models.Change, schemas.Change)) if rows else db.query(models.Change)
+    query = _filter_changes(base, archived, current_only, app, version)
+    query = pagination.apply_keyset(
+        query,
+        models.Change.dtt_change,
+        models.Change.id,
+        cursor,
+        pagination.parse_datetime,
+    )
+    return _page(query, skip, limit, cursor)
 
 
+# New changes also join the manifests of deployments that already shipped
+# their version (see manifests.sync_changes).
 def create_change(db: Session, ch: schemas.ChangeCreate):
     db_obj = models.Change(**ch.dict())
     db.add(db_obj)
+    db.flush()
+    manifests.sync_changes(db, [(db_obj.id, db_obj.app, db_obj.version)], replace=False)
     db.commit()
     db.refresh(db_obj)
+    publish("changes", "created", db_obj, schemas.Change)
     return db_obj
 
+# Group commit (see coalesce.py): all of ``changes`` in one transaction.
+# Returns, in order, each item's new row or the exception it raised. The
+# batch is written optimistically with one INSERT ... RETURNING; if that
+# fails, the items are retried one transaction each so that only the bad
+# ones fail.
+def create_changes_grouped(db: Session, changes: List[schemas.ChangeCreate]) -> List:
+    stmt = insert(models.Change).returning(models.Change, sort_by_parameter_order=True)
+    try:
+        rows = db.scalars(stmt, [ch.dict() for ch in changes]).all()
+        # Converted before the commit expires them
+        created = [schemas.Change.from_orm(row) for row in rows]
+        manifests.sync_changes(db, [(ch.id, ch.app, ch.version) for ch in created], replace=False)
+        db.commit()
+    except SQLAlchemyError as exc:
+        db.rollback()
+        if len(changes) == 1:
+            return [exc]
+        return [result for ch in changes for result in create_changes_grouped(db, [ch])]
+    for change in created:
+        publish("changes", "created", change.dict())
+    return created
+
+# Full-text search, best match first (see search.py)
+def search_changes(
+    db: Session,
+    q: str,
+    skip: int = 0,
+    limit: int = 20,
+    archived: Optional[bool] = None,
+    current_only: Optional[bool] = None,
+    app: Optional[str] = None,
+    version: Optional[str] = None,
+):
+    stmt = search.statement(db.get_bind().dialect.name, q)
+    stmt = _filter_changes(stmt, archived, current_only, app, version)
+    rows = db.execute(stmt.offset(skip).limit(limit)).all()
+    return [
+        schemas.ChangeSearchHit(**schemas.Change.from_orm(change).dict(), rank=rank, snippet=snippet)
+        for change, rank, snippet in rows
+    ]
+
+# --- Bulk ingest ---
+BULK_BATCH_SIZE = 1000
+
+def _bulk_insert(db: Session, model, rows: List[dict]) -> List[int]:
+    # executemany-style batches; ids come back in parameter order
+    ids = []
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    for start in range(0, len(rows), BULK_BATCH_SIZE):
+        ids.extend(db.scalars(stmt, rows[start:start + BULK_BATCH_SIZE]).all())
+    return ids
+
+def bulk_create_changes(db: Session, changes: List[schemas.ChangeCreate]) -> List[int]:
+    if not changes:
+        return []
+    ids = _bulk_insert(db, models.Change, [ch.dict() for ch in changes])
+    manifests.sync_changes(db, [(id_, ch.app, ch.version) for id_, ch in zip(ids, changes)], replace=False)
+    db.commit()
+    publish("changes", "bulk_created", {"ids": ids})
+    return ids
+
+def bulk_create_deployments(db: Session, deps: List[schemas.DeploymentCreate]) -> List[int]:
+    if not deps:
+        return []
+    ids = _bulk_insert(db, models.Deployment, [dep.dict() for dep in deps])
+    # Same side effect as create_deployment: deployed versions stop being current
+    pairs = list({(dep.app, dep.version) for dep in deps})
+    for start in range(0, len(pairs), BULK_BATCH_SIZE):
+        db.execute(
+            update(models.Version)
+            .where(
+                tuple_(models.Version.app, models.Version.version).in_(pairs[start:start + BULK_BATCH_SIZE]),
+                models.Version.current.is_(True),
+            )
+            .values(current=False)
+            .execution_options(synchronize_session=False)
+        )
+    new = []
+    for start in range(0, len(ids), BULK_BATCH_SIZE):
+        new.extend(db.query(models.Deployment).filter(models.Deployment.id.in_(ids[start:start + BULK_BATCH_SIZE])))
+    manifests.build_many(db, new, following=True)
+    db.commit()
+    publish("deployments", "bulk_created", {"ids": ids})
+    return ids
+
+# --- Exports ---
+# Column-only statements for the streaming export endpoints, in the same
+# order as the keyset pagination so exports are stable.
+def changes_export_query(
+    archived: Optional[bool] = None,
+    current_only: Optional[bool] = None,
+    app: Optional[str] = None,
+    version: Optional[str] = None,
+):
+    stmt = _filter_changes(select(*models.Change.__table__.columns), archived, current_only, app, version)
+    return stmt.order_by(models.Change.dtt_change, models.Change.id)
+
+def deployments_export_query():
+    return (
+        select(*models.Deployment.__table__.columns)
+        .order_by(models.Deployment.dtt_deploy, models.Deployment.id)
+    )
+
+def versions_export_query():
+    return (
+        select(*models.Version.__table__.columns)
+        .order_by(models.Version.dt_started, models.Version.id)
+    )
+
 # Filter dropdown support
 def get_change_filter_options(db: Session):
+    return _cached(db, "versions", ("versions",), (), lambda: _load_change_filter_options(db))
+
+def _load_change_filter_options(db: Session):
     options = [
         schemas.ChangeFilterOption(label="<current>", type="current"),
     ]
+    # Semantic version order (1.9.0 before 1.10.0); unparseable versions last
+    semver = models.Version.semver_columns()
     version_rows = (
-        db.query(models.Version.app, models.Version.version)
+        db.query(models.Version.app, models.Version.version, *semver)
         .distinct()
-        .order_by(models.Version.app, models.Version.version)
+        .order_by(models.Version.app, semver[0].is_(None), *semver, models.Version.version)
         .all()
     )
-    for app, version in version_rows:
+    for app, version, *_ in version_rows:
         options.append(
             schemas.ChangeFilterOption(
                 label=f"{app}:{version}",
@@ -126,21 +412,84 @@ def get_app_changes_by_version(
     skip: int = 0,
     limit: int = 100,
     archived: Optional[bool] = None,
+    rows: bool = False,
 ):
-    query = db.query(models.Change).filter(
+    base = db.query(*serialize.columns(models.Change, schemas.Change)) if rows else db.query(models.Change)
+    query = base.filter(
         models.Change.version == version,
         models.Change.app == app,
     )
     if archived is not None:
-        query = query.filter(models.Change.archived == archived)
+        query = query.filter(models.Change.archived.is_(archived))
     return query.offset(skip).limit(limit).all()
 
+# Changes of every version of ``app`` from ``from_version`` to ``to_version``
+# (inclusive, either bound optional) in semantic-version order: one range
+# scan of ix_versions_app_semver joined to the changes of each version.
+def _semver_bound(version: str):
+    key = models.semver_key(version)
+    if key is None:
+        raise ValueError(f"{version!r} is not a semantic version")
+    return tuple_(*key)
+
+def get_app_changes_between(
+    db: Session,
+    app: str,
+    from_version: Optional[str] = None,
+    to_version: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    archived: Optional[bool] = None,
+    rows: bool = False,
+):
+    semver = models.Version.semver_columns()
+    key = tuple_(*semver)
+    base = db.query(*serialize.columns(models.Change, schemas.Change)) if rows else db.query(models.Change)
+    query = base.join(
+        models.Version,
+        and_(models.Version.app == models.Change.app, models.Version.version == models.Change.version),
+    ).filter(models.Version.app == app, models.Change.app == app)
+    if from_version:
+        query = query.filter(key >= _semver_bound(from_version))
+    else:
+        query = query.filter(semver[0].isnot(None))
+    if to_version:
+        query = query.filter(key <= _semver_bound(to_version))
+    if archived is not None:
+        query = query.filter(models.Change.archived.is_(archived))
+    query = query.order_by(*semver, models.Change.dtt_change, models.Change.id)
+    return query.offset(skip).limit(limit).all()
+
+# Changes shipped with a deployment, from its manifest (see manifests.py):
+# a range read of the deployment_changes primary key, in change id order.
+def get_deployment_changes(
+    db: Session,
+    deployment_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    rows: bool = False,
+):
+    base = db.query(*serialize.columns(models.Change, schemas.Change)) if rows else db.query(models.Change)
+    query = base.join(
+        models.DeploymentChange, models.DeploymentChange.change_id == models.Change.id
+    ).filter(models.DeploymentChange.deployment_id == deployment_id)
+    query = pagination.apply_keyset(query, None, models.DeploymentChange.change_id, cursor)
+    return _page(query, skip, limit, cursor)
+
 # --- Get by ID helpers ---
-def get_app_by_id(db: Session, app_id: int):
-    return db.query(models.App).filter(models.App.id == app_id).first()
+def _get_expanded(db: Session, model, obj_id: int, includes: Sequence[str]):
+    obj = _with_includes(db.query(model), model, includes).filter(model.id == obj_id).first()
+    return _expand_all(db, [obj], model, includes)[0] if obj else None
 
-def get_version_by_id(db: Session, version_id: int):
-    return db.query(models.Version).filter(models.Version.id == version_id).first()
+def get_app_by_id(db: Session, app_id: int, includes: Sequence[str]=()):
+    return _get_expanded(db, models.App, app_id, includes)
+
+def get_version_by_id(db: Session, version_id: int, includes: Sequence[str]=()):
+    return _get_expanded(db, models.Version, version_id, includes)
+
+def get_milestone_by_id(db: Session, milestone_id: int, includes: Sequence[str]=()):
+    return _get_expanded(db, models.Milestone, milestone_id, includes)
 
 # Get version by semver
 def get_version_by_semver(db: Session, semver: str):
@@ -152,6 +501,12 @@ def get_deployment_by_id(db: Session, deployment_id: int):
 def get_change_by_id(db: Session, change_id: int):
     return db.query(models.Change).filter(models.Change.id == change_id).first()
 
+# Which of the image names have a generated thumbnail (see uploads.py)
+def get_thumbnails(db: Session, names: Collection[str]) -> set:
+    if not names:
+        return set()
+    return set(db.scalars(select(models.Thumbnail.name).where(models.Thumbnail.name.in_(sorted(names)))))
+
 # --- Delete operations ---
 
 def get_app(db: Session, app_id: int):
@@ -162,6 +517,8 @@ def delete_app(db: Session, app_id: int):
     if db_obj:
         db.delete(db_obj)
         db.commit()
+        cache.invalidate("apps")
+        publish("apps", "deleted", {"id": app_id})
     return db_obj
 
 def get_version(db: Session, version_id: int):
@@ -171,7 +528,12 @@ def delete_version(db: Session, version_id: int):
     db_obj = get_version(db, version_id)
     if db_obj:
         db.delete(db_obj)
+        # As in create_version: the app's manifests lose this version's key
+        db.flush()
+        manifests.rebuild_apps(db, {db_obj.app})
         db.commit()
+        cache.invalidate("versions")
+        publish("versions", "deleted", {"id": version_id})
     return db_obj
 
 def get_deployment(db: Session, deployment_id: int):
@@ -180,8 +542,13 @@ def get_deployment(db: Session, deployment_id: int):
 def delete_deployment(db: Session, deployment_id: int):
     db_obj = get_deployment(db, deployment_id)
     if db_obj:
+        followers = manifests.remove(db, db_obj)
         db.delete(db_obj)
+        db.flush()
+        for follower in followers:
+            manifests.build(db, follower)
         db.commit()
+        publish("deployments", "deleted", {"id": deployment_id})
     return db_obj
 
 def get_change(db: Session, change_id: int):
@@ -190,8 +557,10 @@ def get_change(db: Session, change_id: int):
 def delete_change(db: Session, change_id: int):
     db_obj = get_change(db, change_id)
     if db_obj:
+        db.execute(delete(models.DeploymentChange).where(models.DeploymentChange.change_id == change_id))
         db.delete(db_obj)
         db.commit()
+        publish("changes", "deleted", {"id": change_id})
     return db_obj
 
 def update_app(db: Session, app_id: int, app_in: schemas.AppCreate):
@@ -201,77 +570,153 @@ def update_app(db: Session, app_id: int, app_in: schemas.AppCreate):
     for key, value in app_in.dict().items():
         setattr(db_obj, key, value)
     db.commit()
+    cache.invalidate("apps")
     db.refresh(db_obj)
+    publish("apps", "updated", db_obj, schemas.App)
     return db_obj
 
 def update_version(db: Session, version_id: int, version_in: schemas.VersionCreate):
     db_obj = get_version(db, version_id)
     if not db_obj:
         return None
+    old = (db_obj.app, db_obj.version)
     for key, value in version_in.dict().items():
         setattr(db_obj, key, value)
+    if (db_obj.app, db_obj.version) != old:
+        # The version's place in the semver order moved: every manifest of the app may change
+        db.flush()
+        manifests.rebuild_apps(db, {old[0], db_obj.app})
     db.commit()
+    cache.invalidate("versions")
     db.refresh(db_obj)
+    publish("versions", "updated", db_obj, schemas.Version)
     return db_obj
 
 def update_deployment(db: Session, deployment_id: int, dep_in: schemas.DeploymentCreate):
     db_obj = get_deployment(db, deployment_id)
     if not db_obj:
         return None
+    old_followers = manifests.followers(db, db_obj)
     for key, value in dep_in.dict().items():
         setattr(db_obj, key, value)
+    db.flush()
+    manifests.build_around(db, db_obj, old_followers)
     db.commit()
     db.refresh(db_obj)
+    publish("deployments", "updated", db_obj, schemas.Deployment)
     return db_obj
 
 def update_change(db: Session, change_id: int, change_in: schemas.ChangeCreate):
     db_obj = get_change(db, change_id)
     if not db_obj:
         return None
+    old = (db_obj.app, db_obj.version)
     for key, value in change_in.dict().items():
         setattr(db_obj, key, value)
+    if (db_obj.app, db_obj.version) != old:
+        db.flush()
+        manifests.sync_changes(db, [(db_obj.id, db_obj.app, db_obj.version)])
     db.commit()
     db.refresh(db_obj)
+    publish("changes", "updated", db_obj, schemas.Change)
     return db_obj
 
 
 # --- Milestones CRUD ---
 
-def archive_changes_for_milestone(db: Session, milestone_name: str) -> int:
-    deployments = (
-        db.query(models.Deployment.app, models.Deployment.version)
-        .filter(models.Deployment.milestone == milestone_name)
+# Changes still to be archived when a milestone completes: every unarchived
+# change of an (app, version) pair deployed under the milestone.
+ARCHIVE_CHUNK_SIZE = 50000
+
+def _milestone_pairs(milestone_name: str):
+    return (
+        select(models.Deployment.app, models.Deployment.version)
+        .where(models.Deployment.milestone == milestone_name)
         .distinct()
-        .all()
     )
-    if not deployments:
-        return 0
+
+def _unarchived_for_milestone(milestone_name: str):
+    return and_(
+        tuple_(models.Change.app, models.Change.version).in_(_milestone_pairs(milestone_name)),
+        models.Change.archived.is_(False),
+    )
+
+def archive_changes_for_milestone(
+    db: Session,
+    milestone_name: str,
+    chunk_size: Optional[int] = ARCHIVE_CHUNK_SIZE,
+    on_chunk: Optional[Callable[[int], None]] = None,
+) -> int:
+    """Archive the milestone's changes with set-based UPDATEs; returns the row count.
+
+    One statement per ``chunk_size`` rows (one in total if None), all in the
+    caller's transaction. ``on_chunk(archived)`` is called after each chunk
+    and may commit it.
+    """
+    values = {"archived": True, "archived_at": datetime.utcnow()}
+    if not chunk_size:
+        return db.execute(
+            update(models.Change)
+            .where(_unarchived_for_milestone(milestone_name))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
 
     total_archived = 0
-    archive_time = datetime.utcnow()
-    for app, version in deployments:
-        total_archived += (
-            db.query(models.Change)
-            .filter(
-                models.Change.app == app,
-                models.Change.version == version,
-                models.Change.archived.is_(False),
-            )
-            .update(
-                {"archived": True, "archived_at": archive_time},
-                synchronize_session=False,
-            )
+    while True:
+        chunk = (
+            select(models.Change.id)
+            .where(_unarchived_for_milestone(milestone_name))
+            .limit(chunk_size)
+            .scalar_subquery()
         )
-    return total_archived
+        archived = db.execute(
+            update(models.Change)
+            .where(models.Change.id.in_(chunk))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        total_archived += archived
+        if on_chunk is not None:
+            on_chunk(archived)
+        if archived < chunk_size:
+            return total_archived
+
+def preview_archive_for_milestone(db: Session, milestone_name: str) -> schemas.ArchivePreview:
+    rows = (
+        db.query(models.Change.app, models.Change.version, func.count(models.Change.id))
+        .filter(_unarchived_for_milestone(milestone_name))
+        .group_by(models.Change.app, models.Change.version)
+        .order_by(models.Change.app, models.Change.version)
+        .all()
+    )
+    pairs = db.execute(select(func.count()).select_from(_milestone_pairs(milestone_name).subquery())).scalar()
+    return schemas.ArchivePreview(
+        milestone=milestone_name,
+        versions=pairs,
+        changes=sum(count for _, _, count in rows),
+        by_version=[
+            schemas.ArchivePreviewItem(app=app, version=version, changes=count)
+            for app, version, count in rows
+        ],
+    )
 
-def get_milestones(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Milestone).offset(skip).limit(limit).all()
+def get_milestones(db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, includes: Sequence[str] = ()):
+    def load():
+        query = _with_includes(db.query(models.Milestone), models.Milestone, includes)
+        query = pagination.apply_keyset(query, None, models.Milestone.id, cursor)
+        return _expand_all(db, _page(query, skip, limit, cursor), models.Milestone, includes)
+    if includes:
+        return load()
+    return _cached(db, "milestones", ("milestones",), (skip, limit, cursor), load)
 
 def create_milestone(db: Session, milestone_in: schemas.MilestoneCreate):
     db_obj = models.Milestone(**milestone_in.dict())
     db.add(db_obj)
     db.commit()
+    cache.invalidate("milestones")
     db.refresh(db_obj)
+    publish("milestones", "created", db_obj, schemas.Milestone)
     return db_obj
 
 def get_milestone(db: Session, milestone_id: int):
@@ -282,18 +727,227 @@ def delete_milestone(db: Session, milestone_id: int):
     if db_obj:
         db.delete(db_obj)
         db.commit()
+        cache.invalidate("milestones")
+        publish("milestones", "deleted", {"id": milestone_id})
     return db_obj
 
-def update_milestone(db: Session, milestone_id: int, milestone_in: schemas.MilestoneCreate):
+def _update_milestone(db: Session, milestone_id: int, milestone_in: schemas.MilestoneCreate, defer_archive: bool):
     db_obj = get_milestone(db, milestone_id)
     if not db_obj:
-        return None
+        return None, None
     was_complete = db_obj.complete
     for key, value in milestone_in.dict().items():
         setattr(db_obj, key, value)
     should_archive = (not was_complete) and db_obj.complete
-    if should_archive:
-        archive_changes_for_milestone(db, db_obj.milestone)
+    job = None
+    if should_archive and defer_archive:
+        # Enqueued in the same transaction, so the job exists iff the milestone is complete
+        job = jobs.enqueue(db, "milestone.archive", {"milestone": db_obj.milestone}, commit=False)
+    archived = archive_changes_for_milestone(db, db_obj.milestone) if should_archive and not job else 0
     db.commit()
+    cache.invalidate("milestones")
     db.refresh(db_obj)
-    return db_obj
+    publish("milestones", "updated", db_obj, schemas.Milestone)
+    if job:
+        db.refresh(job)
+        jobs.wake()
+    elif should_archive:
+        # One event for the whole set-based UPDATE rather than one per change
+        publish("changes", "archived", {"milestone": db_obj.milestone, "count": archived})
+    return db_obj, job
+
+def update_milestone(db: Session, milestone_id: int, milestone_in: schemas.MilestoneCreate):
+    return _update_milestone(db, milestone_id, milestone_in, defer_archive=False)[0]
+
+def update_milestone_deferred(db: Session, milestone_id: int, milestone_in: schemas.MilestoneCreate):
+    """update_milestone(), except that completing the milestone enqueues a
+    ``milestone.archive`` job instead of archiving in this transaction.
+
+    Returns ``(milestone, job)``; job is None when nothing is to be archived.
+    """
+    return _update_milestone(db, milestone_id, milestone_in, defer_archive=True)
+
+
+# --- Background jobs (see jobs.py) ---
+JOB_ARCHIVE_CHUNK_SIZE = 5000
+
+def enqueue_job(db: Session, kind: str, params: Optional[dict] = None, max_attempts: Optional[int] = None):
+    job = jobs.enqueue(db, kind, params, max_attempts or jobs.JOBS_MAX_ATTEMPTS)
+    db.refresh(job)
+    return job
+
+def get_job(db: Session, job_id: int):
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
+
+def get_jobs(db: Session, status: Optional[str] = None, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    query = db.query(models.Job)
+    if status:
+        query = query.filter(models.Job.status == status)
+    query = pagination.apply_keyset(query, None, models.Job.id, cursor)
+    return _page(query, skip, limit, cursor)
+
+# Archives in small committed chunks, so other writers get the database
+# between chunks and a retry carries on with the changes still unarchived.
+@jobs.handler("milestone.archive")
+def _archive_milestone_job(ctx: jobs.JobContext):
+    milestone_name = ctx.params["milestone"]
+    done = ctx.job.progress
+    remaining = ctx.db.execute(
+        select(func.count()).select_from(models.Change).where(_unarchived_for_milestone(milestone_name))
+    ).scalar()
+    ctx.progress(done, done + remaining)
+
+    def committed(archived):
+        nonlocal done
+        done += archived
+        ctx.progress(done)
+
+    archive_changes_for_milestone(ctx.db, milestone_name, JOB_ARCHIVE_CHUNK_SIZE, committed)
+    publish("changes", "archived", {"milestone": milestone_name, "count": done})
+    return {"milestone": milestone_name, "archived": done}
+
+BULK_JOB_TABLES = {
+    "changes": (schemas.ChangeCreate, bulk_create_changes),
+    "deployments": (schemas.DeploymentCreate, bulk_create_deployments),
+}
+
+# Bulk import of already validated items, one committed batch at a time
+@jobs.handler("bulk.insert")
+def _bulk_insert_job(ctx: jobs.JobContext):
+    schema, insert_items = BULK_JOB_TABLES[ctx.params["table"]]
+    items = ctx.params["items"]
+    ctx.progress(ctx.job.progress, len(items))
+    for start in range(ctx.job.progress, len(items), BULK_BATCH_SIZE):
+        batch = [schema.parse_obj(item) for item in items[start:start + BULK_BATCH_SIZE]]
+        # Committed together with the batch, so a retry never inserts it twice
+        ctx.progress(start + len(batch), commit=False)
+        insert_items(ctx.db, batch)
+        ctx.publish()
+    return {"inserted": len(items), "errors": ctx.params.get("errors", [])}
+
+
+# --- Dashboard ---
+# The summary is a handful of GROUP BY queries over whole tables. It is cached
+# under the tables' write counters, so any write (from any worker) changes the
+# key and the next request recomputes it.
+DASHBOARD_TABLES = ("apps", "changes", "deployments", "versions")
+
+def get_dashboard_summary(db: Session) -> schemas.DashboardSummary:
+    key = tuple(version for _, version, _ in get_table_versions(db, DASHBOARD_TABLES))
+    return cache.get_or_set("dashboard", key, lambda: _load_dashboard_summary(db))
+
+def _load_dashboard_summary(db: Session) -> schemas.DashboardSummary:
+    summaries = {
+        app: schemas.DashboardApp(
+            app=app,
+            changes_by_category={c.value: 0 for c in models.CategoryEnum},
+            changes_archived=0,
+            changes_unarchived=0,
+        )
+        for (app,) in db.execute(select(models.App.app).order_by(models.App.app))
+    }
+
+    current = (
+        select(models.Version.app, models.Version.version)
+        .where(models.Version.current.is_(True))
+        .order_by(models.Version.dt_started, models.Version.id)
+    )
+    for app, version in db.execute(current):
+        if app in summaries:
+            summaries[app].current_version = version  # latest started wins
+
+    ranked = select(
+        models.Deployment.app,
+        models.Deployment.version,
+        models.Deployment.milestone,
+        models.Deployment.dtt_deploy,
+        func.row_number().over(
+            partition_by=models.Deployment.app,
+            order_by=(models.Deployment.dtt_deploy.desc(), models.Deployment.id.desc()),
+        ).label("rn"),
+    ).subquery()
+    latest = select(ranked.c.app, ranked.c.version, ranked.c.milestone, ranked.c.dtt_deploy).where(ranked.c.rn == 1)
+    for app, version, milestone, dtt_deploy in db.execute(latest):
+        if app in summaries:
+            summaries[app].last_deployment = schemas.DashboardDeployment(
+                version=version, milestone=milestone, dtt_deploy=dtt_deploy
+            )
+
+    counts = select(
+        models.Change.app, models.Change.category, models.Change.archived, func.count()
+    ).group_by(models.Change.app, models.Change.category, models.Change.archived)
+    for app, category, archived, count in db.execute(counts):
+        summary = summaries.get(app)
+        if summary is None:
+            continue
+        if category is not None:
+            summary.changes_by_category[category.value] += count
+        if archived:
+            summary.changes_archived += count
+        else:
+            summary.changes_unarchived += count
+
+    return schemas.DashboardSummary(apps=list(summaries.values()))
+
+# --- Table versions (conditional GET) ---
+# Every write made through a Session bumps its table's row in table_versions in
+# the same transaction, so a read endpoint can tell whether anything changed with
+# one indexed lookup instead of re-running its query.
+#
+# Each table has TABLE_VERSION_STRIPES rows and a write bumps one of them at
+# random; the version is their sum. On a server database concurrent writers
+# then rarely wait for each other's lock on the same counter row until commit.
+# SQLite has a single writer anyway, so it keeps one stripe by default.
+TABLE_VERSION_STRIPES = int(os.getenv("TABLE_VERSION_STRIPES", "1" if database.IS_SQLITE else "16"))
+
+VERSIONED_TABLES = [t.name for t in models.Base.metadata.sorted_tables if t.name != "table_versions"]
+
+def init_table_versions(db: Session):
+    existing = set(db.query(models.TableVersion.name, models.TableVersion.stripe).all())
+    for name in VERSIONED_TABLES:
+        for stripe in range(TABLE_VERSION_STRIPES):
+            if (name, stripe) not in existing:
+                db.add(models.TableVersion(name=name, stripe=stripe, version=0, updated_at=datetime.utcnow()))
+    db.commit()
+
+def get_table_versions(db: Session, tables):
+    T = models.TableVersion
+    return (
+        db.query(T.name, func.sum(T.version), func.max(T.updated_at))
+        .filter(T.name.in_(tables))
+        .group_by(T.name)
+        .order_by(T.name)
+        .all()
+    )
+
+def _bump_table_versions(connection, tables):
+    table = models.TableVersion.__table__
+    names = sorted(tables)
+    stripe = random.randrange(TABLE_VERSION_STRIPES)
+    bump = (
+        update(table)
+        .where(table.c.name.in_(names))
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+    bumped = connection.execute(bump.where(table.c.stripe == stripe)).rowcount
+    if bumped < len(names) and stripe != 0:
+        # Stripes that init_table_versions hasn't created yet; stripe 0 always exists
+        connection.execute(bump.where(table.c.stripe == 0))
+
+@event.listens_for(Session, "after_flush")
+def _bump_after_flush(session, flush_context):
+    tables = {
+        obj.__table__.name
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if not isinstance(obj, models.TableVersion)
+    }
+    if tables:
+        _bump_table_versions(session.connection(), tables)
+
+@event.listens_for(Session, "do_orm_execute")
+def _bump_on_orm_dml(orm_execute_state):
+    # Bulk insert() / update() / query.update() bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        if table.name != "table_versions":
+            _bump_table_versions(orm_execute_state.session.connection(), {table.name})
@@ -0,0 +1,88 @@
+"""Async counterparts of the functions in crud.py.
+
+Each wrapper takes either session type. With an ``AsyncSession`` the sync
+crud function runs through ``run_sync``, so its SQL goes over the async
+driver without leaving the event loop; with a plain ``Session`` it is sent
+to Starlette's threadpool, which is what sync ``def`` handlers did before.
+"""
+import functools
+
+from starlette.concurrency import run_in_threadpool
+
+import crud
+
+
+async def run(db, fn, *args, **kwargs):
+    if hasattr(db, "run_sync"):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        return await run(db, fn, *args, **kwargs)
+    return wrapper
+
+
+# --- Apps ---
+get_apps = _async(crud.get_apps)
+create_app = _async(crud.create_app)
+get_app = _async(crud.get_app)
+get_app_by_id = _async(crud.get_app_by_id)
+update_app = _async(crud.update_app)
+delete_app = _async(crud.delete_app)
+
+# --- Versions ---
+get_versions = _async(crud.get_versions)
+create_version = _async(crud.create_version)
+get_version = _async(crud.get_version)
+get_version_by_id = _async(crud.get_version_by_id)
+get_version_by_semver = _async(crud.get_version_by_semver)
+update_version = _async(crud.update_version)
+delete_version = _async(crud.delete_version)
+
+# --- Deployments ---
+get_deployments = _async(crud.get_deployments)
+create_deployment = _async(crud.create_deployment)
+get_deployment = _async(crud.get_deployment)
+get_deployment_by_id = _async(crud.get_deployment_by_id)
+update_deployment = _async(crud.update_deployment)
+delete_deployment = _async(crud.delete_deployment)
+bulk_create_deployments = _async(crud.bulk_create_deployments)
+
+# --- Changes ---
+get_changes = _async(crud.get_changes)
+create_change = _async(crud.create_change)
+create_changes_grouped = _async(crud.create_changes_grouped)
+get_change = _async(crud.get_change)
+get_change_by_id = _async(crud.get_change_by_id)
+get_change_filter_options = _async(crud.get_change_filter_options)
+get_thumbnails = _async(crud.get_thumbnails)
+get_app_changes_by_version = _async(crud.get_app_changes_by_version)
+get_app_changes_between = _async(crud.get_app_changes_between)
+get_deployment_changes = _async(crud.get_deployment_changes)
+search_changes = _async(crud.search_changes)
+get_dashboard_summary = _async(crud.get_dashboard_summary)
+update_change = _async(crud.update_change)
+delete_change = _async(crud.delete_change)
+bulk_create_changes = _async(crud.bulk_create_changes)
+
+# --- Milestones ---
+get_milestones = _async(crud.get_milestones)
+create_milestone = _async(crud.create_milestone)
+get_milestone = _async(crud.get_milestone)
+get_milestone_by_id = _async(crud.get_milestone_by_id)
+update_milestone = _async(crud.update_milestone)
+update_milestone_deferred = _async(crud.update_milestone_deferred)
+delete_milestone = _async(crud.delete_milestone)
+archive_changes_for_milestone = _async(crud.archive_changes_for_milestone)
+preview_archive_for_milestone = _async(crud.preview_archive_for_milestone)
+
+# --- Table versions ---
+get_table_versions = _async(crud.get_table_versions)
+
+# --- Jobs ---
+enqueue_job = _async(crud.enqueue_job)
+get_job = _async(crud.get_job)
+get_jobs = _async(crud.get_jobs)
@@ -0,0 +1,46 @@
+import hashlib
+from typing import Sequence
+
+from starlette.requests import Request
+
+# Conditional GET validators.
+#
+# A read endpoint's representation depends only on its URL and on the tables
+# it reads, so the ETag hashes the URL together with those tables' write
+# counters (models.TableVersion).
+#
+# There is no Last-Modified: HTTP dates have one-second resolution, so a
+# client revalidating with If-Modified-Since would get a 304 for a write made
+# later in the same second. The counters change with every write.
+
+
+def validators(request: Request, versions: Sequence, variant: str = "") -> str:
+    """Return the ETag for ``(name, version, updated_at)`` rows.
+
+    ``variant`` names the negotiated representation (e.g. ``msgpack``) when
+    it is not the default JSON one, so each representation has its own tag.
+    """
+    digest = hashlib.sha1()
+    digest.update(request.url.path.encode())
+    digest.update(b"?")
+    digest.update("&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items())).encode())
+    if variant:
+        digest.update(f"#{variant}".encode())
+    for name, version, _ in versions:
+        digest.update(f"|{name}:{version}".encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """True if the client's cached copy (If-None-Match) is still current."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
@@ -0,0 +1,334 @@
+"""Change feed pushed to clients over Server-Sent Events or WebSocket.
+
+The crud write paths call ``publish(topic, action, data)`` after they
+commit. The event is JSON encoded once, in the writing thread, and handed to
+the hub, which copies it into every matching subscriber's queue on the event
+loop. Queues are bounded (EVENTS_QUEUE_SIZE, default 256): a client that
+falls that far behind has its backlog dropped and gets a single ``reset``
+event, after which it should refetch the lists it shows. A slow client
+therefore costs a fixed amount of memory and never delays the others.
+
+The fan-out backend is chosen with EVENTS_BACKEND: ``memory`` (default,
+events only reach clients of the process that made the write) or
+``redis`` (needs the ``redis`` package and EVENTS_REDIS_URL; every worker
+publishes to and listens on one channel, so clients see all writes). A
+listener that loses its Redis connection reconnects with backoff, up to
+EVENTS_RECONNECT_MAX seconds between attempts. Events published while it
+was disconnected are lost, so every subscriber is sent a ``reset``.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+import serialize
+
+logger = logging.getLogger(__name__)
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+EVENTS_RECONNECT_MAX = float(os.getenv("EVENTS_RECONNECT_MAX", "30"))
+
+TOPICS = ("apps", "versions", "deployments", "changes", "milestones", "jobs")
+
+_RESET = object()
+
+
+class Event:
+    """One encoded event; frames are built once and shared by all subscribers."""
+
+    __slots__ = ("id", "topic", "type", "json", "sse")
+
+    def __init__(self, event_id: int, event_type: str, payload: bytes):
+        self.id = event_id
+        self.type = event_type
+        self.topic = event_type.partition(".")[0]
+        # payload is '{"type":...,"data":...}'; splice the id in rather than re-encode
+        self.json = b'{"id":%d,' % event_id + payload[1:]
+        self.sse = b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, self.type.encode(), self.json)
+
+
+class Subscriber:
+    def __init__(self, topics: Optional[Iterable[str]] = None, maxsize: int = EVENTS_QUEUE_SIZE):
+        self.topics = frozenset(topics) if topics else None
+        self.queue = asyncio.Queue(maxsize)
+        self.resets = 0
+        self._lagging = False
+
+    def wants(self, topic: str) -> bool:
+        return self.topics is None or topic in self.topics
+
+    def offer(self, item) -> bool:
+        """Queue ``item``; on overflow drop the backlog for a single reset.
+
+        Until the client has read that reset, further events are dropped too.
+        """
+        if self._lagging:
+            return False
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            self.reset()
+            return False
+
+    def reset(self):
+        """Replace the backlog with a single reset event."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_RESET)
+        self._lagging = True
+        self.resets += 1
+
+    async def get(self, timeout: Optional[float] = None):
+        """The next Event, ``_RESET`` after an overflow, or None on timeout."""
+        try:
+            item = self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            try:
+                item = await _get_with_timeout(self.queue, timeout)
+            except asyncio.TimeoutError:
+                return None
+        if item is _RESET:
+            self._lagging = False
+        return item
+
+
+if hasattr(asyncio, "timeout"):
+    async def _get_with_timeout(queue, timeout):
+        # Unlike wait_for, does not start a task per call (Python 3.11+)
+        async with asyncio.timeout(timeout):
+            return await queue.get()
+else:
+    def _get_with_timeout(queue, timeout):
+        return asyncio.wait_for(queue.get(), timeout)
+
+
+# --- Fan-out backends ---
+
+class EventBackend:
+    """Carries encoded events to the hub of every process that should see them."""
+
+    # False when publish() only reaches this process, so writes made while
+    # nobody here is subscribed can skip encoding entirely.
+    shared = False
+
+    def start(self, deliver: Callable[[str, bytes], None], lost: Callable[[], None] = lambda: None):
+        """Begin calling ``deliver(event_type, payload)``, from any thread.
+
+        ``lost()`` is called when events may have been missed.
+        """
+        self._deliver = deliver
+
+    def publish(self, event_type: str, payload: bytes):
+        self._deliver(event_type, payload)
+
+
+class MemoryBackend(EventBackend):
+    pass
+
+
+class RedisBackend(EventBackend):
+    """Pub/sub over one Redis channel, read by a listener thread per process."""
+
+    shared = True
+
+    def __init__(self, client, channel: str = "devoptics:events", reconnect_max: float = EVENTS_RECONNECT_MAX):
+        self.client = client
+        self.channel = channel
+        self.reconnect_max = reconnect_max
+        self.reconnects = 0
+
+    def start(self, deliver, lost=lambda: None):
+        self._deliver = deliver
+        self._lost = lost
+        threading.Thread(target=self._listen, name="events-redis", daemon=True).start()
+
+    def publish(self, event_type, payload):
+        self.client.publish(self.channel, event_type.encode() + b" " + payload)
+
+    def _listen(self):
+        delay = 0.5
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if self.reconnects:
+                    self._lost()
+                delay = 0.5
+                for message in pubsub.listen():
+                    event_type, _, payload = message["data"].partition(b" ")
+                    self._deliver(event_type.decode(), payload)
+            except Exception:
+                logger.warning("Redis event listener disconnected; retrying in %.1fs", delay, exc_info=True)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+            self.reconnects += 1
+            time.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+
+
+# --- Hub ---
+
+class Hub:
+    def __init__(self, backend: EventBackend):
+        self.backend = backend
+        self.subscribers = set()
+        self._loop = None
+        self._ids = itertools.count(1)
+        self._started = False
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def publish(self, topic: str, action: str, data, schema=None):
+        """Send an event to subscribers; safe to call from any thread.
+
+        ``data`` is a dict, or an ORM object converted with ``schema``.
+        """
+        if not self.subscribers and not self.backend.shared:
+            return
+        if schema is not None:
+            data = schema.from_orm(data).dict()
+        event_type = f"{topic}.{action}"
+        payload = serialize.dumps({"type": event_type, "data": data})
+        self.published += 1
+        try:
+            self.backend.publish(event_type, payload)
+        except Exception:
+            logger.exception("Publishing %s.%s failed", topic, action)
+
+    def _deliver(self, event_type: str, payload: bytes):
+        loop = self._loop
+        if loop is None or not self.subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fanout, event_type, payload)
+        except RuntimeError:
+            pass  # loop closed
+
+    def _lost(self):
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._reset_all)
+        except RuntimeError:
+            pass  # loop closed
+
+    def _reset_all(self):
+        for subscriber in list(self.subscribers):
+            subscriber.reset()
+
+    def _fanout(self, event_type: str, payload: bytes):
+        event = Event(next(self._ids), event_type, payload)
+        for subscriber in list(self.subscribers):
+            if subscriber.wants(event.topic):
+                if subscriber.offer(event):
+                    self.delivered += 1
+                else:
+                    self.dropped += 1
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None, maxsize: int = EVENTS_QUEUE_SIZE) -> Subscriber:
+        """Register a subscriber; call from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        if not self._started:
+            self.backend.start(self._deliver, self._lost)
+            self._started = True
+        subscriber = Subscriber(topics, maxsize)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "reconnects": getattr(self.backend, "reconnects", 0),
+        }
+
+
+def parse_topics(topics: Optional[str]):
+    """Split a comma-separated ``topics`` value, rejecting unknown names."""
+    names = [t.strip() for t in (topics or "").split(",") if t.strip()]
+    unknown = [t for t in names if t not in TOPICS]
+    if unknown:
+        raise ValueError(f"Unknown topic {', '.join(unknown)}; expected any of {', '.join(TOPICS)}")
+    return names or None
+
+
+async def sse_stream(subscribe: Callable[[], Subscriber], heartbeat: float = EVENTS_HEARTBEAT):
+    """Yield SSE frames for the subscriber ``subscribe()`` returns, with a comment line as keep-alive.
+
+    The subscriber is only registered once the response starts streaming,
+    so a client gone before then leaves nothing behind to unsubscribe.
+    """
+    subscriber = subscribe()
+    try:
+        # Tell EventSource to wait a few seconds before reconnecting
+        yield b"retry: 3000\n\n"
+        while True:
+            item = await subscriber.get(heartbeat)
+            if item is None:
+                yield b": keep-alive\n\n"
+            elif item is _RESET:
+                yield b"event: reset\ndata: {}\n\n"
+            else:
+                yield item.sse
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+async def ws_stream(websocket, subscriber: Subscriber):
+    """Send events to an accepted WebSocket until the client goes away.
+
+    Incoming messages are read and ignored, which is how a close is noticed
+    while no events are arriving.
+    """
+    receiver = asyncio.ensure_future(_drain(websocket))
+    try:
+        while True:
+            getter = asyncio.ensure_future(subscriber.get())
+            await asyncio.wait((getter, receiver), return_when=asyncio.FIRST_COMPLETED)
+            if receiver.done():
+                getter.cancel()
+                return
+            item = getter.result()
+            if item is _RESET:
+                await websocket.send_text('{"type":"reset"}')
+            else:
+                await websocket.send_text(item.json.decode())
+    finally:
+        receiver.cancel()
+        hub.unsubscribe(subscriber)
+
+
+async def _drain(websocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+def _default_backend() -> EventBackend:
+    if EVENTS_BACKEND == "redis":
+        import redis  # optional dependency
+
+        return RedisBackend(redis.Redis.from_url(os.getenv("EVENTS_REDIS_URL", "redis://localhost:6379/0")))
+    return MemoryBackend()
+
+
+hub = Hub(_default_backend())
+publish = hub.publish
@@ -0,0 +1,100 @@
+import csv
+import enum
+import io
+import json
+from datetime import date, datetime
+
+from fastapi.responses import StreamingResponse
+
+import database
+
+# Rows fetched per round trip; also the unit each response chunk is built from
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson_encoder(columns):
+    def encode(rows):
+        return "".join(
+            json.dumps(dict(zip(columns, map(_plain, row))), separators=(",", ":")) + "\n"
+            for row in rows
+        ).encode()
+    return encode
+
+
+def _csv_encoder(columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def encode(rows):
+        writer.writerows([_plain(value) for value in row] for row in rows)
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk.encode()
+
+    header = encode([columns])
+    return encode, header
+
+
+# The export opens its own session (on a replica when configured): the
+# request's session is closed by get_db while the response body is still
+# being streamed.
+def _batches(stmt, primary):
+    factory, _ = database.session_factory(primary)
+    with factory() as db:
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        yield from result.partitions()
+
+
+async def _async_batches(stmt, primary):
+    factory, _ = database.session_factory(primary)
+    async with factory() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+def stream(stmt, fmt: str, filename: str, primary: bool = False) -> StreamingResponse:
+    """Stream the rows of ``stmt`` as NDJSON or CSV, one batch at a time.
+
+    Rows are fetched with ``yield_per`` (a server-side cursor where the
+    driver supports one), so memory use does not grow with the row count.
+    They are read from a replica when one is configured, unless ``primary``.
+    """
+    columns = [column.key for column in stmt.selected_columns]
+    if fmt == "csv":
+        encode, header = _csv_encoder(columns)
+    else:
+        encode, header = _ndjson_encoder(columns), b""
+
+    if database.ASYNC_MODE:
+        async def body():
+            if header:
+                yield header
+            async for rows in _async_batches(stmt, primary):
+                yield encode(rows)
+    else:
+        def body():
+            if header:
+                yield header
+            for rows in _batches(stmt, primary):
+                yield encode(rows)
+
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
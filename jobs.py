@@ -0,0 +1,346 @@
+"""Background jobs: a jobs table and a pool of worker threads that runs it.
+
+Work that is too slow for a request (archiving a large milestone, bulk
+imports, backfills) is enqueued as a row in ``jobs`` and the client gets
+the job id to poll at /jobs/{id}. Each web worker process starts
+JOBS_WORKERS threads (default 2; 0 to leave jobs to a separate process
+started with ``python jobs.py``). A worker claims the oldest due job with
+one conditional UPDATE, so any number of threads and processes can share
+the table, and runs the handler registered for its ``kind``.
+
+Handlers take a JobContext. ``ctx.progress(done, total)`` records progress
+and commits the handler's work so far, so long jobs should do their work in
+committed steps and, on a retry, resume from ``ctx.job.progress``. A
+handler that raises is retried up to the job's max_attempts (default
+JOBS_MAX_ATTEMPTS, 3) with exponential backoff from JOBS_RETRY_DELAY
+seconds; after that the job is failed with the error recorded. While a
+handler runs, its worker refreshes the job's heartbeat every
+JOBS_HEARTBEAT_INTERVAL seconds (default a third of JOBS_STALE_SECONDS);
+a running job whose heartbeat is older than JOBS_STALE_SECONDS, because
+its worker died, is taken over by another worker.
+
+Every write a worker makes to its job is conditional on its claim (the job's
+locked_by and attempt number), so once a job has been taken over the old
+worker's progress calls raise JobLost and its outcome is discarded rather
+than overwriting the new owner's.
+
+Job status changes are published on the change feed under ``jobs``.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+import models
+from events import publish
+
+logger = logging.getLogger(__name__)
+
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+JOBS_RETRY_DELAY = float(os.getenv("JOBS_RETRY_DELAY", "5"))
+JOBS_STALE_SECONDS = float(os.getenv("JOBS_STALE_SECONDS", "300"))
+JOBS_HEARTBEAT_INTERVAL = float(os.getenv("JOBS_HEARTBEAT_INTERVAL", str(JOBS_STALE_SECONDS / 3)))
+
+STATUSES = ("queued", "running", "succeeded", "failed")
+
+HANDLERS: Dict[str, Callable] = {}
+
+
+def handler(kind: str):
+    """Register the decorated function as the handler for jobs of ``kind``."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class JobLost(Exception):
+    """The job was taken over by another worker since this one claimed it."""
+
+
+def _claimed(job: models.Job):
+    """Condition matching ``job`` only while it is still held by the claim it has now."""
+    J = models.Job
+    return and_(J.id == job.id, J.locked_by == job.locked_by, J.attempts == job.attempts)
+
+
+def _write(db: Session, claimed, **values) -> bool:
+    """UPDATE the job under ``claimed`` (see _claimed()); False if it was taken over."""
+    return bool(db.execute(
+        update(models.Job).where(claimed).values(**values).execution_options(synchronize_session=False)
+    ).rowcount)
+
+
+class JobContext:
+    def __init__(self, db: Session, job: models.Job):
+        self.db = db
+        self.job = job
+        self.params = job.params or {}
+        self.claimed = _claimed(job)
+
+    def progress(self, done: int, total: Optional[int] = None, commit: bool = True):
+        """Record progress and heartbeat; commits the session.
+
+        Raises JobLost, with the work since the last call rolled back, if
+        another worker has taken the job over. With ``commit=False`` the
+        progress is left for the handler's next commit, so it is recorded
+        atomically with that work; call publish() after committing.
+        """
+        values = {"progress": done, "heartbeat_at": datetime.utcnow()}
+        if total is not None:
+            values["total"] = total
+        if not _write(self.db, self.claimed, **values):
+            self.db.rollback()
+            raise JobLost(f"Job {self.job.id} was taken over by another worker")
+        if commit:
+            self.db.commit()
+            self.publish()
+
+    def publish(self):
+        _publish(self.job)
+
+
+class _Heartbeat(threading.Thread):
+    """Refreshes a running job's heartbeat_at in its own session, so a handler
+    that goes longer than JOBS_STALE_SECONDS between progress calls is not
+    taken over while its worker is still alive."""
+
+    def __init__(self, session_factory, claimed, interval: float = JOBS_HEARTBEAT_INTERVAL):
+        super().__init__(name="jobs-heartbeat", daemon=True)
+        self.session_factory = session_factory
+        self.claimed = claimed
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self.session_factory() as db:
+                    held = _write(db, self.claimed, heartbeat_at=datetime.utcnow())
+                    db.commit()
+            except Exception:
+                # e.g. the handler holding SQLite's write lock; try again next interval
+                logger.warning("Job heartbeat failed", exc_info=True)
+                continue
+            if not held:
+                return
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _publish(job: models.Job):
+    publish("jobs", job.status, {
+        "id": job.id, "kind": job.kind, "status": job.status, "progress": job.progress, "total": job.total,
+    })
+
+
+def enqueue(db: Session, kind: str, params: Optional[dict] = None, max_attempts: int = JOBS_MAX_ATTEMPTS,
+            commit: bool = True) -> models.Job:
+    """Add a queued job; ``params`` must be JSON serialisable.
+
+    With ``commit=False`` the job is only flushed, so it is created in the
+    caller's transaction; call wake() after committing it.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}; expected any of {', '.join(sorted(HANDLERS))}")
+    job = models.Job(
+        kind=kind, params=params or {}, status="queued", attempts=0, max_attempts=max_attempts,
+        progress=0, created_at=datetime.utcnow(),
+    )
+    db.add(job)
+    db.flush()
+    if commit:
+        db.commit()
+        wake()
+    return job
+
+
+def _due(now: datetime):
+    J = models.Job
+    return or_(
+        and_(J.status == "queued", or_(J.run_after.is_(None), J.run_after <= now)),
+        and_(J.status == "running", J.heartbeat_at < now - timedelta(seconds=JOBS_STALE_SECONDS)),
+    )
+
+
+def claim(db: Session, owner: str) -> Optional[models.Job]:
+    """Mark the oldest due job as running for ``owner`` and return it."""
+    J = models.Job
+    now = datetime.utcnow()
+    # Idle polls stay read-only: no write lock, and the jobs table version
+    # (and with it every /jobs ETag) only changes when a job is claimed.
+    candidate = db.execute(select(J.id).where(_due(now)).order_by(J.id).limit(1)).scalar()
+    if candidate is None:
+        db.rollback()
+        return None
+    # The condition is repeated so that two workers racing for the same row
+    # cannot both claim it.
+    job_id = db.execute(
+        update(J)
+        .where(J.id == candidate, _due(now))
+        .values(status="running", locked_by=owner, attempts=J.attempts + 1, started_at=now, heartbeat_at=now)
+        .returning(J.id)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    db.commit()
+    return db.get(J, job_id) if job_id is not None else None
+
+
+def execute(db: Session, job: models.Job, session_factory=None):
+    """Run a claimed job and record its outcome.
+
+    With a ``session_factory`` the job's heartbeat is kept fresh while the
+    handler runs (see _Heartbeat). The outcome is written only if the job
+    is still held by this claim; otherwise it is rolled back, together
+    with the handler's uncommitted work.
+    """
+    ctx = JobContext(db, job)
+    attempt, max_attempts = job.attempts, job.max_attempts
+    heartbeat = _Heartbeat(session_factory, ctx.claimed) if session_factory is not None else None
+    _publish(job)
+    if heartbeat is not None:
+        heartbeat.start()
+    try:
+        fn = HANDLERS.get(job.kind)
+        if fn is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        result = fn(ctx)
+    except JobLost:
+        db.rollback()
+        logger.warning("Job %s (%s) attempt %s was taken over by another worker", job.id, job.kind, attempt)
+        return
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Job %s (%s) attempt %s failed", job.id, job.kind, attempt, exc_info=True)
+        now = datetime.utcnow()
+        values = {"error": f"{type(exc).__name__}: {exc}"}
+        if attempt < max_attempts:
+            values.update(status="queued", run_after=now + timedelta(seconds=JOBS_RETRY_DELAY * 2 ** (attempt - 1)))
+        else:
+            values.update(status="failed", finished_at=now)
+    else:
+        J = models.Job
+        values = {
+            "status": "succeeded", "result": result, "error": None, "finished_at": datetime.utcnow(),
+            "progress": func.coalesce(J.total, J.progress),
+        }
+    finally:
+        if heartbeat is not None:
+            heartbeat.stop()
+    if not _write(db, ctx.claimed, locked_by=None, **values):
+        db.rollback()
+        logger.warning("Job %s (%s) attempt %s was taken over by another worker; its outcome is discarded",
+                       job.id, job.kind, attempt)
+        return
+    db.commit()
+    _publish(job)
+
+
+class WorkerPool:
+    """Threads that claim and run jobs until stop()."""
+
+    def __init__(self, session_factory, workers: int = JOBS_WORKERS, poll_interval: float = JOBS_POLL_INTERVAL):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"jobs-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop claiming jobs and wait up to ``timeout`` for running ones."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self) -> bool:
+        """Claim and run one job; False when none was due."""
+        with self.session_factory() as db:
+            job = claim(db, self.owner)
+            if job is None:
+                return False
+            execute(db, job, self.session_factory)
+            return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                logger.exception("Job worker error")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+
+pool: Optional[WorkerPool] = None
+
+
+def start(session_factory, workers: int = JOBS_WORKERS) -> Optional[WorkerPool]:
+    """Start this process's worker pool (none if ``workers`` is 0)."""
+    global pool
+    if workers > 0 and pool is None:
+        pool = WorkerPool(session_factory, workers)
+        pool.start()
+    return pool
+
+
+def stop(timeout: Optional[float] = None):
+    global pool
+    if pool is not None:
+        pool.stop(timeout)
+        pool = None
+
+
+def wake():
+    """Have an idle worker of this process poll now instead of at its next interval."""
+    if pool is not None:
+        pool.wake()
+
+
+if __name__ == "__main__":
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=max(JOBS_WORKERS, 1))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    import database
+    import crud  # noqa: F401  registers the handlers
+    # Run as a script this module is __main__; crud registered its handlers
+    # on the imported ``jobs`` module, so that is the one to start.
+    import jobs
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    jobs.start(database.SessionLocal, args.workers)
+    try:
+        stopping.wait()
+    except KeyboardInterrupt:
+        pass
+    jobs.stop()
@@ -1,16 +1,38 @@
-from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException
+import math
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-import database, models, schemas, crud
-from fastapi import UploadFile, File
-from fastapi.staticfiles import StaticFiles
-import os, shutil
+import database, models, schemas, crud, crud_async, pagination, bulk, export, etags, search, uploads, metrics, serialize, events, coalesce, jobs
+from compression import CompressionMiddleware
+from assets import AssetFiles
+from cache import cache
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 # create database tables
 models.Base.metadata.create_all(bind=database.engine)
+with database.engine.begin() as _conn:
+    search.install(_conn)
+with database.SessionLocal() as _db:
+    crud.init_table_versions(_db)
 
-app = FastAPI(title="Dev-Optics API")
+# Each worker process runs JOBS_WORKERS background job threads (see jobs.py)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    jobs.start(database.SessionLocal)
+    yield
+    await run_in_threadpool(jobs.stop, JOBS_SHUTDOWN_TIMEOUT)
+
+JOBS_SHUTDOWN_TIMEOUT = 10
+
+app = FastAPI(title="Dev-Optics API", lifespan=lifespan)
+app.router.route_class = metrics.TimedRoute
 
 # Configure CORS to allow the Angular frontend
 app.add_middleware(
@@ -19,112 +41,434 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# Serve uploaded images from the static directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
-
-# Dependency to get DB session per-request
-def get_db():
-    db = database.SessionLocal()
+# gzip / br / zstd by Accept-Encoding above COMPRESS_MIN_SIZE (see compression.py)
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency, SQL statement count / time and serialisation time,
+# exposed at /metrics (see metrics.py)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument(database.engine)
+if database.async_engine is not None:
+    metrics.instrument(database.async_engine.sync_engine)
+for _replica in database.replicas.replicas:
+    for _engine in _replica.sync_engines():
+        metrics.instrument(_engine)
+
+# Serve uploaded images from the static directory; hashed uploads are
+# cached as immutable (see assets.py)
+app.mount("/static", AssetFiles(directory="static"), name="static")
+
+# Writes go to the primary. With DATABASE_REPLICA_URLS set, GET / HEAD reads
+# go to a replica unless the client wrote in the last REPLICA_STICKY_SECONDS,
+# which a write marks with a cookie so it holds across workers (see
+# database.py for replica health checks).
+READ_METHODS = ("GET", "HEAD")
+PRIMARY_COOKIE = "devoptics_primary"
+
+def sticky(request: Request) -> bool:
+    return PRIMARY_COOKIE in request.cookies
+
+def uses_primary(request: Request, response: Response) -> bool:
+    if request.method in READ_METHODS:
+        return sticky(request)
+    if database.replicas.replicas:
+        response.set_cookie(
+            PRIMARY_COOKIE, "1", max_age=math.ceil(database.REPLICA_STICKY_SECONDS), httponly=True, samesite="lax"
+        )
+    return True
+
+# Dependency to get DB session per-request. Handlers go through crud_async,
+# which accepts either session type, so DATABASE_MODE only changes this.
+# A replica whose connection fails mid-request leaves the rotation until its
+# next successful health check.
+if database.ASYNC_MODE:
+    async def get_db(request: Request, response: Response):
+        factory, replica = database.session_factory(uses_primary(request, response))
+        async with factory() as db:
+            try:
+                yield db
+            except OperationalError as exc:
+                if replica is not None:
+                    replica.mark_down(exc)
+                raise
+else:
+    def get_db(request: Request, response: Response):
+        factory, replica = database.session_factory(uses_primary(request, response))
+        db = factory()
+        try:
+            yield db
+        except OperationalError as exc:
+            if replica is not None:
+                replica.mark_down(exc)
+            raise
+        finally:
+            db.close()
+
+# List endpoints accept an opaque ``cursor`` for keyset paging; the cursor for
+# the following page is returned in the X-Next-Cursor header.
+async def paged(response: Response, fetch, limit: int, sort_attr: Optional[str] = None):
     try:
-        yield db
-    finally:
-        db.close()
+        rows = await fetch()
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    cursor = pagination.next_cursor(rows, limit, sort_attr)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    return rows
+
+# Fast serialisation path for the large list endpoints: the crud call returns
+# plain rows (rows=True) that are encoded straight to JSON, or to MessagePack
+# for clients that ask for it, skipping response_model validation. The
+# response_model still documents the shape.
+MSGPACK_RESPONSES = {200: {"content": {serialize.MSGPACK_TYPE: {}}}}
+
+def row_path(request: Request) -> bool:
+    return serialize.FAST or serialize.negotiate(request.headers.get("accept", "")) == "msgpack"
+
+def rows_response(request: Request, response: Response, rows):
+    body, media_type = serialize.encode_rows(rows, serialize.negotiate(request.headers.get("accept", "")))
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return Response(body, media_type=media_type, headers=headers)
+
+# Bulk endpoints take a JSON array or an NDJSON stream (Content-Type:
+# application/x-ndjson). Valid items are inserted in one transaction and
+# invalid ones are reported by their position in the request; ``ids`` lists
+# the new rows in request order, skipping the items listed in ``errors``.
+BULK_REQUEST_BODY = {
+    "content": {
+        "application/json": {"schema": {"type": "array", "items": {"type": "object"}}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+    },
+    "required": True,
+}
+
+# With ?mode=async the valid items are imported by a ``bulk.insert`` job
+# instead, and the response is 202 with the job.
+async def bulk_ingest(request: Request, response: Response, db, schema, insert, table: str, mode: str = "sync"):
+    try:
+        items, errors = await run_in_threadpool(
+            bulk.parse_items, await request.body(), request.headers.get("content-type"), schema
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if mode == "async":
+        params = {"table": table, "items": jsonable_encoder([item for _, item in items]), "errors": jsonable_encoder(errors)}
+        return accepted(response, await crud_async.enqueue_job(db, "bulk.insert", params))
+    ids = await insert(db, [item for _, item in items])
+    return schemas.BulkResult(inserted=len(ids), ids=ids, errors=errors)
+
+# 202 Accepted for work handed to a background job; poll the Location.
+# Headers already set on ``response`` (the read-your-writes cookie) are kept.
+def accepted(response: Response, job: models.Job) -> JSONResponse:
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    headers["Location"] = f"/jobs/{job.id}"
+    return JSONResponse(jsonable_encoder(schemas.Job.from_orm(job)), status_code=202, headers=headers)
+
+JOB_RESPONSES = {202: {"model": schemas.Job, "description": "Accepted; runs as a background job"}}
+RunMode = Literal["sync", "async"]
+
+ExportFormat = Literal["ndjson", "csv"]
+
+# Conditional GET for read routes: the ETag comes from the write counters of
+# the tables a route reads, and a matching If-None-Match answers 304 before
+# the handler runs its query.
+def conditional(*tables: str, expand=None):
+    async def check(request: Request, response: Response, db: Session = Depends(get_db)):
+        read = list(tables)
+        if expand is not None:
+            read += crud.include_tables(expand, includes_for(expand, request.query_params.get("include")))
+        versions = await crud_async.get_table_versions(db, read)
+        fmt = serialize.negotiate(request.headers.get("accept", ""))
+        etag = etags.validators(request, versions, "" if fmt == "json" else fmt)
+        headers = etags.headers(etag)
+        headers["Vary"] = "Accept"
+        if etags.not_modified(request, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+    return Depends(check)
+
+# ?include=a,b expands related rows on the app, version and milestone reads
+# (see crud.INCLUDES); unrequested relationship fields are left out. Included
+# changes are capped at crud.INCLUDE_LIMIT per app or version.
+def includes_for(model, include: Optional[str]):
+    try:
+        return crud.parse_includes(model, include)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 # --- Apps endpoints ---
-@app.get("/apps/", response_model=List[schemas.App])
-def read_apps(skip: int=0, limit: int=100, db: Session=Depends(get_db)):
-    return crud.get_apps(db, skip, limit)
+@app.get(
+    "/apps/",
+    response_model=List[schemas.AppExpanded],
+    response_model_exclude_unset=True,
+    dependencies=[conditional("apps", expand=models.App)],
+)
+async def read_apps(response: Response, skip: int=0, limit: int=100, cursor: Optional[str]=None, include: Optional[str]=None, db: Session=Depends(get_db)):
+    includes = includes_for(models.App, include)
+    return await paged(response, lambda: crud_async.get_apps(db, skip, limit, cursor, includes), limit)
 
 @app.post("/apps/", response_model=schemas.App)
-def create_app(app_in: schemas.AppCreate, db: Session=Depends(get_db)):
-    return crud.create_app(db, app_in)
+async def create_app(app_in: schemas.AppCreate, db: Session=Depends(get_db)):
+    return await crud_async.create_app(db, app_in)
 
 # Retrieve a single app by ID
-@app.get("/apps/{app_id}", response_model=schemas.App)
-def read_app(app_id: int, db: Session = Depends(get_db)):
-    db_app = crud.get_app_by_id(db, app_id)
+@app.get(
+    "/apps/{app_id}",
+    response_model=schemas.AppExpanded,
+    response_model_exclude_unset=True,
+    dependencies=[conditional("apps", expand=models.App)],
+)
+async def read_app(app_id: int, include: Optional[str] = None, db: Session = Depends(get_db)):
+    db_app = await crud_async.get_app_by_id(db, app_id, includes_for(models.App, include))
     if not db_app:
         raise HTTPException(status_code=404, detail="App not found")
     return db_app
 
 # --- Versions endpoints ---
-@app.get("/versions/", response_model=List[schemas.Version])
-def read_versions(skip: int=0, limit: int=100, db: Session=Depends(get_db)):
-    return crud.get_versions(db, skip, limit)
+@app.get(
+    "/versions/",
+    response_model=List[schemas.VersionExpanded],
+    response_model_exclude_unset=True,
+    responses=MSGPACK_RESPONSES,
+    dependencies=[conditional("versions", expand=models.Version)],
+)
+async def read_versions(request: Request, response: Response, skip: int=0, limit: int=100, cursor: Optional[str]=None, include: Optional[str]=None, db: Session=Depends(get_db)):
+    includes = includes_for(models.Version, include)
+    fast = row_path(request) and not includes
+    rows = await paged(response, lambda: crud_async.get_versions(db, skip, limit, cursor, includes, rows=fast), limit, "dt_started")
+    return rows_response(request, response, rows) if fast else rows
 
 @app.post("/versions/", response_model=schemas.Version)
-def create_version(v_in: schemas.VersionCreate, db: Session=Depends(get_db)):
+async def create_version(v_in: schemas.VersionCreate, db: Session=Depends(get_db)):
     try:
-        return crud.create_version(db, v_in)
+        return await crud_async.create_version(db, v_in)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
 
+@app.get("/versions/export", summary="Stream all versions as NDJSON or CSV")
+async def export_versions(request: Request, fmt: ExportFormat = Query("ndjson", alias="format")):
+    return export.stream(crud.versions_export_query(), fmt, "versions", primary=sticky(request))
+
 # Retrieve a single version by ID
-@app.get("/versions/{version_id}", response_model=schemas.Version)
-def read_version(version_id: int, db: Session = Depends(get_db)):
-    db_version = crud.get_version_by_id(db, version_id)
+@app.get(
+    "/versions/{version_id}",
+    response_model=schemas.VersionExpanded,
+    response_model_exclude_unset=True,
+    dependencies=[conditional("versions", expand=models.Version)],
+)
+async def read_version(version_id: int, include: Optional[str] = None, db: Session = Depends(get_db)):
+    db_version = await crud_async.get_version_by_id(db, version_id, includes_for(models.Version, include))
     if not db_version:
         raise HTTPException(status_code=404, detail="Version not found")
     return db_version
 
 # --- Deployments endpoints ---
-@app.get("/deployments/", response_model=List[schemas.Deployment])
-def read_deployments(skip: int=0, limit: int=100, db: Session=Depends(get_db)):
-    return crud.get_deployments(db, skip, limit)
+@app.get("/deployments/", response_model=List[schemas.Deployment], responses=MSGPACK_RESPONSES, dependencies=[conditional("deployments")])
+async def read_deployments(request: Request, response: Response, skip: int=0, limit: int=100, cursor: Optional[str]=None, db: Session=Depends(get_db)):
+    fast = row_path(request)
+    rows = await paged(response, lambda: crud_async.get_deployments(db, skip, limit, cursor, rows=fast), limit, "dtt_deploy")
+    return rows_response(request, response, rows) if fast else rows
 
 @app.post("/deployments/", response_model=schemas.Deployment)
-def create_deployment(d_in: schemas.DeploymentCreate, db: Session=Depends(get_db)):
-    return crud.create_deployment(db, d_in)
+async def create_deployment(d_in: schemas.DeploymentCreate, db: Session=Depends(get_db)):
+    return await crud_async.create_deployment(db, d_in)
+
+@app.post(
+    "/deployments/bulk",
+    response_model=schemas.BulkResult,
+    responses=JOB_RESPONSES,
+    summary="Create many deployments in one transaction",
+    openapi_extra={"requestBody": BULK_REQUEST_BODY},
+)
+async def create_deployments_bulk(request: Request, response: Response, mode: RunMode = "sync", db: Session=Depends(get_db)):
+    return await bulk_ingest(request, response, db, schemas.DeploymentCreate, crud_async.bulk_create_deployments, "deployments", mode)
+
+@app.get("/deployments/export", summary="Stream all deployments as NDJSON or CSV")
+async def export_deployments(request: Request, fmt: ExportFormat = Query("ndjson", alias="format")):
+    return export.stream(crud.deployments_export_query(), fmt, "deployments", primary=sticky(request))
 
 # Retrieve a single deployment by ID
-@app.get("/deployments/{deployment_id}", response_model=schemas.Deployment)
-def read_deployment(deployment_id: int, db: Session = Depends(get_db)):
-    db_deployment = crud.get_deployment_by_id(db, deployment_id)
+@app.get("/deployments/{deployment_id}", response_model=schemas.Deployment, dependencies=[conditional("deployments")])
+async def read_deployment(deployment_id: int, db: Session = Depends(get_db)):
+    db_deployment = await crud_async.get_deployment_by_id(db, deployment_id)
     if not db_deployment:
         raise HTTPException(status_code=404, detail="Deployment not found")
     return db_deployment
 
+# Changes shipped with a deployment (its manifest), in change id order; 409
+# for a deployment from before manifests whose manifest is not backfilled yet.
+@app.get(
+    "/deployments/{deployment_id}/changes",
+    response_model=List[schemas.Change],
+    responses=MSGPACK_RESPONSES,
+    dependencies=[conditional("deployments", "changes", "deployment_changes")],
+    summary="Changes shipped with a deployment",
+)
+async def read_deployment_changes(
+    request: Request,
+    response: Response,
+    deployment_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    fast = row_path(request)
+    rows = await paged(
+        response,
+        lambda: crud_async.get_deployment_changes(db, deployment_id, skip, limit, cursor, rows=fast),
+        limit,
+    )
+    if not rows:
+        deployment = await crud_async.get_deployment(db, deployment_id)
+        if not deployment:
+            raise HTTPException(status_code=404, detail="Deployment not found")
+        if deployment.manifest_at is None:
+            # An empty list would read as "shipped nothing"
+            raise HTTPException(
+                status_code=409,
+                detail="This deployment's manifest has not been built yet; run the manifests.backfill job",
+            )
+    return rows_response(request, response, rows) if fast else rows
+
 # --- Changes endpoints ---
-@app.get("/changes/", response_model=List[schemas.Change])
-def read_changes(
+# The thumbnails counter is part of the ETag, so ?image=thumb revalidates
+# once a thumbnail has been generated.
+@app.get("/changes/", response_model=List[schemas.Change], responses=MSGPACK_RESPONSES, dependencies=[conditional("changes", "versions", "thumbnails")])
+async def read_changes(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     archived: Optional[bool] = None,
     current_only: Optional[bool] = None,
     app: Optional[str] = None,
     version: Optional[str] = None,
+    cursor: Optional[str] = None,
+    image: Literal["original", "thumb"] = "original",
     db: Session = Depends(get_db),
 ):
-    return crud.get_changes(
-        db,
-        skip=skip,
-        limit=limit,
-        archived=archived,
-        current_only=current_only,
-        app=app,
-        version=version,
+    fast = row_path(request)
+    rows = await paged(
+        response,
+        lambda: crud_async.get_changes(
+            db,
+            skip=skip,
+            limit=limit,
+            archived=archived,
+            current_only=current_only,
+            app=app,
+            version=version,
+            cursor=cursor,
+            rows=fast,
+        ),
+        limit,
+        "dtt_change",
     )
+    # image=thumb swaps image_url for its thumbnail, where one has been generated
+    items = serialize.as_dicts(rows) if fast else rows
+    if image == "thumb":
+        urls = [item["image_url"] for item in items] if fast else [c.image_url for c in rows]
+        thumbnails = await crud_async.get_thumbnails(db, {uploads.image_name(url) for url in urls} - {None})
+        if fast:
+            for item in items:
+                item["image_url"] = uploads.thumbnail_url(item["image_url"], thumbnails)
+        else:
+            items = [
+                schemas.Change.from_orm(c).copy(update={"image_url": uploads.thumbnail_url(c.image_url, thumbnails)})
+                for c in rows
+            ]
+    return rows_response(request, response, items) if fast else items
+
+# With WRITE_COALESCE=1, concurrent creates are committed together in one
+# transaction (see coalesce.py); each batch uses its own primary session.
+async def _create_changes(items):
+    factory, _ = database.session_factory(primary=True)
+    if database.ASYNC_MODE:
+        async with factory() as db:
+            return await crud_async.create_changes_grouped(db, items)
+    with factory() as db:
+        return await crud_async.create_changes_grouped(db, items)
+
+change_writer = coalesce.Coalescer(_create_changes) if coalesce.WRITE_COALESCE else None
 
 @app.post("/changes/", response_model=schemas.Change)
-def create_change(c_in: schemas.ChangeCreate, db: Session=Depends(get_db)):
-    return crud.create_change(db, c_in)
+async def create_change(c_in: schemas.ChangeCreate, db: Session=Depends(get_db)):
+    if change_writer is not None:
+        return await change_writer.submit(c_in)
+    return await crud_async.create_change(db, c_in)
+
+@app.post(
+    "/changes/bulk",
+    response_model=schemas.BulkResult,
+    responses=JOB_RESPONSES,
+    summary="Create many changes in one transaction",
+    openapi_extra={"requestBody": BULK_REQUEST_BODY},
+)
+async def create_changes_bulk(request: Request, response: Response, mode: RunMode = "sync", db: Session=Depends(get_db)):
+    return await bulk_ingest(request, response, db, schemas.ChangeCreate, crud_async.bulk_create_changes, "changes", mode)
+
+@app.get("/changes/export", summary="Stream the change log as NDJSON or CSV")
+async def export_changes(
+    request: Request,
+    fmt: ExportFormat = Query("ndjson", alias="format"),
+    archived: Optional[bool] = None,
+    current_only: Optional[bool] = None,
+    app: Optional[str] = None,
+    version: Optional[str] = None,
+):
+    stmt = crud.changes_export_query(archived=archived, current_only=current_only, app=app, version=version)
+    return export.stream(stmt, fmt, "changes", primary=sticky(request))
+
+@app.get(
+    "/changes/search",
+    response_model=List[schemas.ChangeSearchHit],
+    dependencies=[conditional("changes", "versions")],
+    summary="Full-text search over change titles and descriptions",
+)
+async def search_changes(
+    q: str = Query(..., min_length=1),
+    skip: int = 0,
+    limit: int = 20,
+    archived: Optional[bool] = None,
+    current_only: Optional[bool] = None,
+    app: Optional[str] = None,
+    version: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    try:
+        return await crud_async.search_changes(
+            db,
+            q,
+            skip=skip,
+            limit=limit,
+            archived=archived,
+            current_only=current_only,
+            app=app,
+            version=version,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
 
-@app.get("/changes/filter-options", response_model=List[schemas.ChangeFilterOption])
-def read_change_filter_options(db: Session = Depends(get_db)):
-    return crud.get_change_filter_options(db)
+@app.get("/changes/filter-options", response_model=List[schemas.ChangeFilterOption], dependencies=[conditional("versions")])
+async def read_change_filter_options(db: Session = Depends(get_db)):
+    return await crud_async.get_change_filter_options(db)
 
 
 # Retrieve all changes for a given version
-@app.get("/versions/{version_id}/changes/", response_model=List[schemas.Change])
-def read_changes_by_version(version_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_changes_by_version(db, version_id, skip, limit)
+@app.get("/versions/{version_id}/changes/", response_model=List[schemas.Change], dependencies=[conditional("changes", "versions")])
+async def read_changes_by_version(version_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    return await crud_async.run(db, crud.get_changes_by_version, version_id, skip, limit)
 
 # Retrieve all changes for a given version by semantic version string
-@app.get("/apps/{app}/versions/{version}/changes/", response_model=List[schemas.Change])
-def read_app_changes_by_version(
+@app.get("/apps/{app}/versions/{version}/changes/", response_model=List[schemas.Change], responses=MSGPACK_RESPONSES, dependencies=[conditional("changes")])
+async def read_app_changes_by_version(
+    request: Request,
+    response: Response,
     app: str,
     version: str,
     skip: int = 0,
@@ -132,120 +476,316 @@ def read_app_changes_by_version(
     archived: Optional[bool] = None,
     db: Session = Depends(get_db),
 ):
-    return crud.get_app_changes_by_version(db, app, version, skip, limit, archived)
+    fast = row_path(request)
+    rows = await crud_async.get_app_changes_by_version(db, app, version, skip, limit, archived, rows=fast)
+    return rows_response(request, response, rows) if fast else rows
+
+# Changes of a range of versions, e.g. ?from=1.4.0&to=2.1.0 (both inclusive,
+# either optional), ordered by semantic version then date
+@app.get(
+    "/apps/{app}/changes",
+    response_model=List[schemas.Change],
+    responses=MSGPACK_RESPONSES,
+    dependencies=[conditional("changes", "versions")],
+    summary="Changes between two versions of an app",
+)
+async def read_app_changes_between(
+    request: Request,
+    response: Response,
+    app: str,
+    from_version: Optional[str] = Query(None, alias="from"),
+    to_version: Optional[str] = Query(None, alias="to"),
+    skip: int = 0,
+    limit: int = 100,
+    archived: Optional[bool] = None,
+    db: Session = Depends(get_db),
+):
+    fast = row_path(request)
+    try:
+        rows = await crud_async.get_app_changes_between(
+            db, app, from_version, to_version, skip, limit, archived, rows=fast
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return rows_response(request, response, rows) if fast else rows
 
 # Retrieve a single change by ID
-@app.get("/changes/{change_id}", response_model=schemas.Change)
-def read_change(change_id: int, db: Session = Depends(get_db)):
-    db_change = crud.get_change_by_id(db, change_id)
+@app.get("/changes/{change_id}", response_model=schemas.Change, dependencies=[conditional("changes")])
+async def read_change(change_id: int, db: Session = Depends(get_db)):
+    db_change = await crud_async.get_change_by_id(db, change_id)
     if not db_change:
         raise HTTPException(status_code=404, detail="Change not found")
     return db_change
 
-@app.post("/changes/upload-image/", summary="Upload image for a Change")
-async def upload_change_image(file: UploadFile = File(...)):
+UPLOAD_REQUEST_BODY = {
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"file": {"type": "string", "format": "binary"}},
+                "required": ["file"],
+            },
+        },
+    },
+    "required": True,
+}
+
+@app.post(
+    "/changes/upload-image/",
+    response_model=schemas.ImageUpload,
+    summary="Upload image for a Change",
+    openapi_extra={"requestBody": UPLOAD_REQUEST_BODY},
+)
+async def upload_change_image(request: Request):
     """
-    Accepts a multipart-encoded file upload and saves it under static/images,
-    returning the URL path that can be stored in Change.image_url.
+    Accepts a multipart-encoded PNG, JPEG, GIF or WebP image and stores it
+    under static/images named by its SHA-256, returning the URL path that can
+    be stored in Change.image_url. Identical images share one file.
+
+    The form is parsed here rather than by FastAPI so that a body over
+    MAX_UPLOAD_BYTES is refused by its Content-Length, or as soon as that
+    much has streamed in, instead of after it has been spooled to disk.
     """
-    upload_dir = "static/images"
-    os.makedirs(upload_dir, exist_ok=True)
-    file_path = os.path.join(upload_dir, file.filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return {"filename": file.filename, "url": f"/static/images/{file.filename}"}
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > uploads.MAX_UPLOAD_BYTES + uploads.FORM_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image exceeds the {uploads.MAX_UPLOAD_BYTES} byte limit")
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    try:
+        form = await MultiPartParser(request.headers, uploads.limited(request.stream()), max_files=1).parse()
+    except uploads.UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except MultiPartException as exc:
+        raise HTTPException(status_code=400, detail=exc.message)
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(status_code=422, detail="Missing the 'file' form field")
+        return await run_in_threadpool(uploads.store, file.file, file.filename)
+    except uploads.UploadTooLarge as exc:
+        raise HTTPException(status_code=413, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=415, detail=str(exc))
+    finally:
+        await form.close()
 
 # --- Delete endpoints ---
 
 @app.delete("/apps/{app_id}", status_code=204)
-def delete_app(app_id: int, db: Session = Depends(get_db)):
-    db_app = crud.get_app(db, app_id)
+async def delete_app(app_id: int, db: Session = Depends(get_db)):
+    db_app = await crud_async.get_app(db, app_id)
     if not db_app:
         raise HTTPException(status_code=404, detail="App not found")
-    crud.delete_app(db, app_id)
+    await crud_async.delete_app(db, app_id)
 
 @app.delete("/versions/{version_id}", status_code=204)
-def delete_version(version_id: int, db: Session = Depends(get_db)):
-    db_ver = crud.get_version(db, version_id)
+async def delete_version(version_id: int, db: Session = Depends(get_db)):
+    db_ver = await crud_async.get_version(db, version_id)
     if not db_ver:
         raise HTTPException(status_code=404, detail="Version not found")
-    crud.delete_version(db, version_id)
+    await crud_async.delete_version(db, version_id)
 
 @app.delete("/deployments/{deployment_id}", status_code=204)
-def delete_deployment(deployment_id: int, db: Session = Depends(get_db)):
-    db_dep = crud.get_deployment(db, deployment_id)
+async def delete_deployment(deployment_id: int, db: Session = Depends(get_db)):
+    db_dep = await crud_async.get_deployment(db, deployment_id)
     if not db_dep:
         raise HTTPException(status_code=404, detail="Deployment not found")
-    crud.delete_deployment(db, deployment_id)
+    await crud_async.delete_deployment(db, deployment_id)
 
 @app.delete("/changes/{change_id}", status_code=204)
-def delete_change(change_id: int, db: Session = Depends(get_db)):
-    db_ch = crud.get_change(db, change_id)
+async def delete_change(change_id: int, db: Session = Depends(get_db)):
+    db_ch = await crud_async.get_change(db, change_id)
     if not db_ch:
         raise HTTPException(status_code=404, detail="Change not found")
-    crud.delete_change(db, change_id)
+    await crud_async.delete_change(db, change_id)
     
 	# --- Update endpoints ---
     
 @app.put("/apps/{app_id}", response_model=schemas.App)
-def update_app(app_id: int, app_in: schemas.AppCreate, db: Session = Depends(get_db)):
-    db_app = crud.get_app(db, app_id)
+async def update_app(app_id: int, app_in: schemas.AppCreate, db: Session = Depends(get_db)):
+    db_app = await crud_async.get_app(db, app_id)
     if not db_app:
         raise HTTPException(status_code=404, detail="App not found")
-    return crud.update_app(db, app_id, app_in)
+    return await crud_async.update_app(db, app_id, app_in)
 
 
 @app.put("/changes/{change_id}", response_model=schemas.Change)
-def update_change(change_id: int, change_in: schemas.ChangeCreate, db: Session = Depends(get_db)):
-    db_ch = crud.get_change(db, change_id)
+async def update_change(change_id: int, change_in: schemas.ChangeCreate, db: Session = Depends(get_db)):
+    db_ch = await crud_async.get_change(db, change_id)
     if not db_ch:
         raise HTTPException(status_code=404, detail="Change not found")
-    return crud.update_change(db, change_id, change_in)
+    return await crud_async.update_change(db, change_id, change_in)
 
 @app.put("/versions/{version_id}", response_model=schemas.Version)
-def update_version(version_id: int, version_in: schemas.VersionCreate, db: Session = Depends(get_db)):
-    db_ver = crud.get_version(db, version_id)
+async def update_version(version_id: int, version_in: schemas.VersionCreate, db: Session = Depends(get_db)):
+    db_ver = await crud_async.get_version(db, version_id)
     if not db_ver:
         raise HTTPException(status_code=404, detail="Version not found")
-    return crud.update_version(db, version_id, version_in)
+    return await crud_async.update_version(db, version_id, version_in)
 
 @app.put("/deployments/{deployment_id}", response_model=schemas.Deployment)
-def update_deployment(deployment_id: int, dep_in: schemas.DeploymentCreate, db: Session = Depends(get_db)):
-    db_dep = crud.get_deployment(db, deployment_id)
+async def update_deployment(deployment_id: int, dep_in: schemas.DeploymentCreate, db: Session = Depends(get_db)):
+    db_dep = await crud_async.get_deployment(db, deployment_id)
     if not db_dep:
         raise HTTPException(status_code=404, detail="Deployment not found")
-    return crud.update_deployment(db, deployment_id, dep_in)
+    return await crud_async.update_deployment(db, deployment_id, dep_in)
+
+# --- Dashboard ---
+@app.get(
+    "/dashboard/summary",
+    response_model=schemas.DashboardSummary,
+    dependencies=[conditional(*crud.DASHBOARD_TABLES)],
+    summary="Per-app current version, last deployment and change counts",
+)
+async def read_dashboard_summary(db: Session = Depends(get_db)):
+    return await crud_async.get_dashboard_summary(db)
+
+# --- Database diagnostics ---
+@app.get("/db/pool", summary="Connection pool occupancy and checkout wait stats")
+async def read_pool_status():
+    return database.pool_status()
+
+@app.get("/db/write-batches", summary="Group commit batch counters for POST /changes/")
+async def read_write_batches():
+    return {"enabled": True, **change_writer.stats()} if change_writer is not None else {"enabled": False}
+
+@app.get("/cache/stats", summary="Lookup cache hit/miss counters per namespace")
+async def read_cache_stats():
+    return cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, summary="Request and SQL metrics in Prometheus text format")
+async def read_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# --- Change feed ---
+# Create / update / delete / archive events from the crud write paths, so the
+# frontend can refetch on change instead of polling (see events.py).
+# ?topics=changes,deployments limits the stream to those tables.
+def topics_for(topics: Optional[str]):
+    try:
+        return events.parse_topics(topics)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
 
-# --- Milestones endpoints ---
-@app.get("/milestones/", response_model=List[schemas.Milestone])
-def read_milestones(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_milestones(db, skip, limit)
+@app.get(
+    "/events",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"text/event-stream": {}}}},
+    summary="Server-Sent Events stream of writes",
+)
+async def stream_events(topics: Optional[str] = None):
+    names = topics_for(topics)
+    return StreamingResponse(
+        events.sse_stream(lambda: events.hub.subscribe(names)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-@app.get("/milestones/{milestone_id}", response_model=schemas.Milestone)
-def read_milestone(milestone_id: int, db: Session = Depends(get_db)):
-    db_milestone = crud.get_milestone(db, milestone_id)
+@app.websocket("/events/ws")
+async def stream_events_ws(websocket: WebSocket, topics: Optional[str] = None):
+    try:
+        names = events.parse_topics(topics)
+    except ValueError as exc:
+        await websocket.close(code=1008, reason=str(exc))
+        return
+    await websocket.accept()
+    await events.ws_stream(websocket, events.hub.subscribe(names))
+
+@app.get("/events/stats", summary="Change feed subscribers and delivery counters")
+async def read_event_stats():
+    return events.hub.stats()
+
+# --- Milestones endpoints ---
+@app.get(
+    "/milestones/",
+    response_model=List[schemas.MilestoneExpanded],
+    response_model_exclude_unset=True,
+    dependencies=[conditional("milestones", expand=models.Milestone)],
+)
+async def read_milestones(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, include: Optional[str] = None, db: Session = Depends(get_db)):
+    includes = includes_for(models.Milestone, include)
+    return await paged(response, lambda: crud_async.get_milestones(db, skip, limit, cursor, includes), limit)
+
+@app.get(
+    "/milestones/{milestone_id}",
+    response_model=schemas.MilestoneExpanded,
+    response_model_exclude_unset=True,
+    dependencies=[conditional("milestones", expand=models.Milestone)],
+)
+async def read_milestone(milestone_id: int, include: Optional[str] = None, db: Session = Depends(get_db)):
+    db_milestone = await crud_async.get_milestone_by_id(db, milestone_id, includes_for(models.Milestone, include))
     if not db_milestone:
         raise HTTPException(status_code=404, detail="Milestone not found")
     return db_milestone
 
+@app.get(
+    "/milestones/{milestone_id}/archive-preview",
+    response_model=schemas.ArchivePreview,
+    summary="Dry run: changes that completing the milestone would archive",
+)
+async def preview_milestone_archive(milestone_id: int, db: Session = Depends(get_db)):
+    db_milestone = await crud_async.get_milestone(db, milestone_id)
+    if not db_milestone:
+        raise HTTPException(status_code=404, detail="Milestone not found")
+    return await crud_async.preview_archive_for_milestone(db, db_milestone.milestone)
+
 @app.post("/milestones/", response_model=schemas.Milestone)
-def create_milestone(milestone_in: schemas.MilestoneCreate, db: Session = Depends(get_db)):
-    return crud.create_milestone(db, milestone_in)
+async def create_milestone(milestone_in: schemas.MilestoneCreate, db: Session = Depends(get_db)):
+    return await crud_async.create_milestone(db, milestone_in)
 
 @app.delete("/milestones/{milestone_id}", status_code=204)
-def delete_milestone(milestone_id: int, db: Session = Depends(get_db)):
-    db_milestone = crud.get_milestone(db, milestone_id)
+async def delete_milestone(milestone_id: int, db: Session = Depends(get_db)):
+    db_milestone = await crud_async.get_milestone(db, milestone_id)
     if not db_milestone:
         raise HTTPException(status_code=404, detail="Milestone not found")
-    crud.delete_milestone(db, milestone_id)
-
-@app.put("/milestones/{milestone_id}", response_model=schemas.Milestone)
-def update_milestone(milestone_id: int, milestone_in: schemas.MilestoneCreate, db: Session = Depends(get_db)):
-    db_milestone = crud.get_milestone(db, milestone_id)
+    await crud_async.delete_milestone(db, milestone_id)
+
+# Completing a milestone archives its changes. With ?archive=async that is
+# left to a background job and the response is 202 with the job.
+@app.put("/milestones/{milestone_id}", response_model=schemas.Milestone, responses=JOB_RESPONSES)
+async def update_milestone(
+    milestone_id: int,
+    milestone_in: schemas.MilestoneCreate,
+    response: Response,
+    archive: RunMode = "sync",
+    db: Session = Depends(get_db),
+):
+    db_milestone = await crud_async.get_milestone(db, milestone_id)
     if not db_milestone:
         raise HTTPException(status_code=404, detail="Milestone not found")
-    return crud.update_milestone(db, milestone_id, milestone_in)
+    if archive == "async":
+        db_milestone, job = await crud_async.update_milestone_deferred(db, milestone_id, milestone_in)
+        return accepted(response, job) if job else db_milestone
+    return await crud_async.update_milestone(db, milestone_id, milestone_in)
+
+# --- Background jobs ---
+@app.get("/jobs/", response_model=List[schemas.Job], dependencies=[conditional("jobs")])
+async def read_jobs(
+    response: Response,
+    status: Optional[Literal[jobs.STATUSES]] = None,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    return await paged(response, lambda: crud_async.get_jobs(db, status, skip, limit, cursor), limit)
+
+@app.post("/jobs/", status_code=202, response_model=schemas.Job, summary="Enqueue a background job, e.g. manifests.backfill")
+async def create_job(job_in: schemas.JobCreate, response: Response, db: Session = Depends(get_db)):
+    try:
+        return accepted(response, await crud_async.enqueue_job(db, job_in.kind, job_in.params, job_in.max_attempts))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job, dependencies=[conditional("jobs")], summary="Job status and progress")
+async def read_job(job_id: int, db: Session = Depends(get_db)):
+    db_job = await crud_async.get_job(db, job_id)
+    if not db_job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
 
+# Single-process development server with auto-reload. In production run
+# serve.py, which starts several workers and drains them on shutdown.
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
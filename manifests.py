@@ -0,0 +1,409 @@
+"""Deployment manifests: the changes that went out with each deployment.
+
+A deployment of version V of an app ships every change of that app whose
+version sorts after the version of the app's previous deployment and up to
+V, in semantic-version order (see models.semver_key). "Previous" means the
+latest earlier deployment of the same app, by (dtt_deploy, id), whose
+version is a semantic version; with none, the manifest starts at the app's
+first version. Deployments without a dtt_deploy are only ordered among
+themselves, by id. A deployment of a version that is not a semantic version
+ships just that version's changes.
+
+The manifest is written to deployment_changes in the same transaction as
+the deployment, so /deployments/{id}/changes is one primary-key range read.
+Writing a deployment also rewrites the manifests of the app's following
+deployments whose lower bound may have moved: up to the next one whose
+version is a semantic version. Creating or editing a change, or creating,
+renaming or deleting a version, updates the manifests it affects too. Deployments created before
+manifests existed have ``manifest_at`` NULL; fill them in with
+
+    python manifests.py --batch-size 500
+
+which commits per batch and can be stopped and re-run at any point, or
+as a background job: POST /jobs/ {"kind": "manifests.backfill"}.
+"""
+import argparse
+import bisect
+from datetime import datetime
+from typing import List, Sequence
+
+from sqlalchemy import and_, delete, insert, literal, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+import jobs
+import models
+
+BACKFILL_BATCH_SIZE = 500
+BATCH_SIZE = 1000
+
+
+# Row-value comparisons, so both neighbours are a seek on
+# ix_deployments_app_dtt_deploy_id rather than a scan of the app's deployments.
+def _earlier(dep: models.Deployment):
+    D = models.Deployment
+    if dep.dtt_deploy is None:
+        return and_(D.app == dep.app, D.dtt_deploy.is_(None), D.id < dep.id)
+    return and_(D.app == dep.app, tuple_(D.dtt_deploy, D.id) < tuple_(dep.dtt_deploy, dep.id))
+
+
+def _later(dep: models.Deployment):
+    D = models.Deployment
+    if dep.dtt_deploy is None:
+        return and_(D.app == dep.app, D.dtt_deploy.is_(None), D.id > dep.id)
+    return and_(D.app == dep.app, tuple_(D.dtt_deploy, D.id) > tuple_(dep.dtt_deploy, dep.id))
+
+
+def previous_key(db: Session, dep: models.Deployment):
+    """Semver key of the version of the app's previous deployment, or None."""
+    D, V = models.Deployment, models.Version
+    row = (
+        db.query(*V.semver_columns())
+        .select_from(D)
+        .join(V, and_(V.app == D.app, V.version == D.version))
+        .filter(_earlier(dep), V.semver_major.isnot(None))
+        .order_by(D.dtt_deploy.desc(), D.id.desc())
+        .first()
+    )
+    return tuple(row) if row else None
+
+
+def followers(db: Session, dep: models.Deployment, page: int = 16) -> List[models.Deployment]:
+    """The app's deployments after ``dep`` whose lower bound can be ``dep``'s
+    version: up to and including the first one that has a semver Version
+    row, which bounds those after it. Usually just the next deployment.
+    """
+    D, V = models.Deployment, models.Version
+    query = (
+        db.query(D, V.semver_major)
+        .outerjoin(V, and_(V.app == D.app, V.version == D.version))
+        .order_by(D.dtt_deploy, D.id)
+    )
+    result = []
+    after = dep
+    while True:
+        rows = query.filter(_later(after)).limit(page).all()
+        for later, major in rows:
+            result.append(later)
+            if major is not None:
+                return result
+        if len(rows) < page:
+            return result
+        after = rows[-1][0]
+
+
+def _shipped(db: Session, dep: models.Deployment):
+    """SELECT of (deployment id, change id) for every change ``dep`` shipped.
+
+    None when the version range is empty.
+    """
+    C, V = models.Change, models.Version
+    stmt = select(literal(dep.id), C.id)
+    key = models.semver_key(dep.version) if dep.version else None
+    if key is None:
+        return stmt.where(C.app == dep.app, C.version == dep.version)
+    semver = tuple_(*V.semver_columns())
+    stmt = stmt.join(V, and_(V.app == C.app, V.version == C.version)).where(
+        C.app == dep.app, V.app == dep.app, semver <= tuple_(*key)
+    )
+    lower = previous_key(db, dep)
+    if lower is None:
+        return stmt.where(V.semver_major.isnot(None))
+    if lower >= key:
+        return None  # redeploy or rollback: nothing new shipped
+    return stmt.where(semver > tuple_(*lower))
+
+
+def build(db: Session, dep: models.Deployment) -> int:
+    """(Re)write the manifest of a flushed deployment; returns its size.
+
+    Does not commit.
+    """
+    DC = models.DeploymentChange
+    if dep.manifest_at is not None:
+        db.execute(delete(DC).where(DC.deployment_id == dep.id))
+    dep.manifest_at = datetime.utcnow()
+    shipped = _shipped(db, dep)
+    if shipped is None:
+        return 0
+    return db.execute(insert(DC).from_select(["deployment_id", "change_id"], shipped)).rowcount
+
+
+def build_around(db: Session, dep: models.Deployment, old_followers: Sequence[models.Deployment] = ()) -> int:
+    """build() ``dep`` and its followers(), plus ``old_followers``.
+
+    ``old_followers`` are the deployments that followed ``dep`` before it
+    was moved (its app, version or dtt_deploy changed), whose lower bound
+    may now differ.
+    """
+    count = build(db, dep)
+    for other in (set(followers(db, dep)) | set(old_followers)) - {dep}:
+        build(db, other)
+    return count
+
+
+# --- Many deployments at once ---
+# build() costs a few statements per deployment. For bulk inserts and the
+# backfill, build_many() instead reads the affected apps' deployments once,
+# then the change ids in the version range those deployments cover, works out
+# every manifest in memory and writes them with one executemany.
+
+def _chains(db: Session, apps):
+    """Each app's deployments in manifest order, as (id, version, semver key)."""
+    D, V = models.Deployment, models.Version
+    rows = (
+        db.query(D.id, D.app, D.dtt_deploy, D.version, V.semver_major, *V.semver_columns()[1:])
+        .outerjoin(V, and_(V.app == D.app, V.version == D.version))
+        .filter(D.app.in_(apps))
+        .order_by(D.app, D.dtt_deploy.nulls_first(), D.id)
+    )
+    chains = {}
+    for dep_id, app, dtt_deploy, version, *semver in rows:
+        key = tuple(semver) if semver[0] is not None else None
+        chains.setdefault((app, dtt_deploy is None), []).append((dep_id, version, key))
+    return chains
+
+
+def _bounds(chains):
+    """Yield ``(id, app, version, key, lower)`` for every deployment: the
+    semver key of its own version (None: ships only that version's changes)
+    and of its previous deployment's (None: from the app's first version).
+    """
+    for (app, _), chain in chains.items():
+        lower = None
+        for dep_id, version, key in chain:
+            yield dep_id, app, version, models.semver_key(version) if version else None, lower
+            if key is not None:
+                lower = key
+
+
+def _changes_in_range(db: Session, targets):
+    """Change ids the ``targets`` (as from _bounds) can ship: per app, sorted
+    semver keys and their change ids, and ids by plain version.
+
+    Only the changes between the lowest lower bound and the highest version
+    of each app's targets are read.
+    """
+    C, V = models.Change, models.Version
+    ranges = {}
+    for _, app, version, key, lower in targets:
+        lo, hi, plain, unbounded = ranges.get(app, (None, None, set(), False))
+        if key is None:
+            plain.add(version)
+        else:
+            hi = key if hi is None else max(hi, key)
+            unbounded = unbounded or lower is None
+            lo = lower if lo is None else (lo if lower is None else min(lo, lower))
+        ranges[app] = (lo, hi, plain, unbounded)
+
+    semver = tuple_(*V.semver_columns())
+    conditions = []
+    for app, (lo, hi, plain, unbounded) in ranges.items():
+        parts = []
+        if hi is not None:
+            in_range = and_(V.semver_major.isnot(None), semver <= tuple_(*hi))
+            parts.append(in_range if unbounded else and_(in_range, semver > tuple_(*lo)))
+        if plain:
+            parts.append(C.version.in_(sorted(plain)))
+        conditions.append(and_(C.app == app, or_(*parts)))
+    if not conditions:
+        return {}, {}
+
+    rows = (
+        db.query(C.id, C.app, C.version, V.semver_major, *V.semver_columns()[1:])
+        .outerjoin(V, and_(V.app == C.app, V.version == C.version))
+        .filter(or_(*conditions))
+    )
+    by_key, by_version = {}, {}
+    for change_id, app, version, *semver_values in rows:
+        by_version.setdefault((app, version), []).append(change_id)
+        if semver_values[0] is not None:
+            by_key.setdefault(app, {}).setdefault(tuple(semver_values), []).append(change_id)
+    return {app: (sorted(keys), keys) for app, keys in by_key.items()}, by_version
+
+
+def build_many(db: Session, deps: Sequence[models.Deployment], following: bool = False) -> int:
+    """build() every deployment in ``deps``, and with ``following`` each one's
+    next deployment too; returns the number of manifest rows written.
+
+    Does not commit.
+    """
+    if not deps:
+        return 0
+    D, DC = models.Deployment, models.DeploymentChange
+    chains = _chains(db, {dep.app for dep in deps})
+    wanted = {dep.id for dep in deps}
+    if following:
+        # As followers(): each one's successors up to one with a semver key
+        for chain in chains.values():
+            bounded = True
+            for dep_id, _, key in chain:
+                if dep_id in wanted:
+                    bounded = False
+                elif not bounded:
+                    wanted.add(dep_id)
+                    bounded = key is not None
+    targets = [bounds for bounds in _bounds(chains) if bounds[0] in wanted]
+    keys, by_version = _changes_in_range(db, targets)
+
+    rows = []
+    for dep_id, app, version, key, lower in targets:
+        if key is None:
+            shipped = by_version.get((app, version), ())
+        else:
+            ordered, ids = keys.get(app, ((), {}))
+            lo = 0 if lower is None else bisect.bisect_right(ordered, lower)
+            hi = bisect.bisect_right(ordered, key)
+            shipped = [change_id for k in ordered[lo:hi] for change_id in ids[k]]
+        rows.extend({"deployment_id": dep_id, "change_id": change_id} for change_id in shipped)
+
+    ids = sorted(dep_id for dep_id, *_ in targets)
+    now = datetime.utcnow()
+    for start in range(0, len(ids), BATCH_SIZE):
+        chunk = ids[start:start + BATCH_SIZE]
+        db.execute(delete(DC).where(DC.deployment_id.in_(chunk)))
+        db.execute(
+            update(D).where(D.id.in_(chunk)).values(manifest_at=now).execution_options(synchronize_session=False)
+        )
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(DC), rows[start:start + BATCH_SIZE])
+    for dep in deps:
+        set_committed_value(dep, "manifest_at", now)  # already written above
+    return len(rows)
+
+
+def rebuild_apps(db: Session, apps) -> int:
+    """build_many() every deployment of ``apps``, e.g. after one of their
+    versions was added, renamed, moved or deleted. Does not commit.
+    """
+    D = models.Deployment
+    return build_many(db, db.query(D).filter(D.app.in_(set(apps))).all())
+
+
+# --- Changes ---
+# A change written after its deployments were built, or moved to another app
+# or version, is placed into (or taken out of) existing manifests directly.
+
+def sync_changes(db: Session, changes, replace: bool = True) -> int:
+    """Put each ``(id, app, version)`` change into the manifests of the
+    deployments that shipped its version; returns the rows written.
+
+    With ``replace`` the changes are first taken out of every manifest (for
+    edits; new changes are in none). Does not commit.
+    """
+    if not changes:
+        return 0
+    D, DC, V = models.Deployment, models.DeploymentChange, models.Version
+    if replace:
+        ids = [change_id for change_id, _, _ in changes]
+        for start in range(0, len(ids), BATCH_SIZE):
+            db.execute(delete(DC).where(DC.change_id.in_(ids[start:start + BATCH_SIZE])))
+
+    pairs = sorted({(app, version) for _, app, version in changes})
+    keys = {}
+    for start in range(0, len(pairs), BATCH_SIZE):
+        rows = db.query(V.app, V.version, *V.semver_columns()).filter(
+            tuple_(V.app, V.version).in_(pairs[start:start + BATCH_SIZE]), V.semver_major.isnot(None)
+        )
+        keys.update({(app, version): tuple(semver) for app, version, *semver in rows})
+
+    # Deployments not built yet (manifest_at NULL) are left to the backfill
+    built = set(db.scalars(
+        select(D.id).where(D.app.in_({app for app, _ in pairs}), D.manifest_at.isnot(None))
+    ))
+    bounds = [b for b in _bounds(_chains(db, {app for app, _ in pairs})) if b[0] in built]
+    shipped_by = {}
+    for app, version in pairs:
+        key = keys.get((app, version))
+        shipped_by[app, version] = [
+            dep_id
+            for dep_id, dep_app, dep_version, dep_key, lower in bounds
+            if dep_app == app and (
+                dep_version == version if dep_key is None
+                else key is not None and key <= dep_key and (lower is None or lower < key)
+            )
+        ]
+    rows = [
+        {"deployment_id": dep_id, "change_id": change_id}
+        for change_id, app, version in changes
+        for dep_id in shipped_by[app, version]
+    ]
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(DC), rows[start:start + BATCH_SIZE])
+    return len(rows)
+
+
+def remove(db: Session, dep: models.Deployment) -> List[models.Deployment]:
+    """Drop the manifest of a deployment about to be deleted; does not commit.
+
+    Returns its followers(), which take over its changes and
+    need build() once it is gone.
+    """
+    DC = models.DeploymentChange
+    after = followers(db, dep)
+    db.execute(delete(DC).where(DC.deployment_id == dep.id))
+    return after
+
+
+def backfill_batch(db: Session, batch_size: int = BACKFILL_BATCH_SIZE, after_id: int = 0):
+    """Build and commit the manifests of the next ``batch_size`` deployments
+    without one, with ids above ``after_id``.
+
+    Returns ``(deployments, manifest rows, last id)``; 0 deployments when
+    there are none left.
+    """
+    D = models.Deployment
+    batch = (
+        db.query(D)
+        .filter(D.manifest_at.is_(None), D.id > after_id)
+        .order_by(D.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not batch:
+        return 0, 0, after_id
+    rows = build_many(db, batch)
+    db.commit()
+    return len(batch), rows, batch[-1].id
+
+
+def backfill(session_factory, batch_size: int = BACKFILL_BATCH_SIZE, log=print) -> int:
+    """Build the manifest of every deployment that has none, in id order.
+
+    Each batch is committed on its own, so an interrupted run resumes where
+    it stopped. Returns the number of deployments processed.
+    """
+    done = 0
+    last_id = 0
+    while True:
+        with session_factory() as db:
+            count, rows, last_id = backfill_batch(db, batch_size, last_id)
+        if not count:
+            return done
+        done += count
+        log(f"{done} deployments, last id {last_id}: {rows} manifest rows in this batch")
+
+
+@jobs.handler("manifests.backfill")
+def _backfill_job(ctx: jobs.JobContext):
+    D = models.Deployment
+    batch_size = int(ctx.params.get("batch_size", BACKFILL_BATCH_SIZE))
+    done = ctx.job.progress
+    ctx.progress(done, done + ctx.db.query(D).filter(D.manifest_at.is_(None)).count())
+    last_id = 0
+    while True:
+        count, _, last_id = backfill_batch(ctx.db, batch_size, last_id)
+        if not count:
+            return {"deployments": done}
+        done += count
+        ctx.progress(done)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE)
+    args = parser.parse_args()
+
+    import database
+
+    print(f"backfilled {backfill(database.SessionLocal, args.batch_size)} deployments")
@@ -0,0 +1,234 @@
+"""Per-route request metrics in Prometheus text format, and a slow-query log.
+
+MetricsMiddleware times every HTTP request. SQLAlchemy cursor events on the
+instrumented engines count the statements each request runs and their total
+time. TimedRoute records when the endpoint function returned, so the rest
+of the route handler (response validation and JSON encoding) is reported
+as serialisation time.
+
+Metrics are per process; with several workers each one exposes its own.
+Statements slower than SLOW_QUERY_MS (default 500, negative disables) are
+logged to the ``devoptics.slow_query`` logger with their parameters.
+"""
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+
+slow_query_log = logging.getLogger("devoptics.slow_query")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "endpoint_done")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.endpoint_done = None
+
+
+# Set by the middleware for the duration of a request. The object is mutated
+# in place, so updates from threadpool / greenlet copies of the context land
+# in the same place.
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            base = _labels(label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values = defaultdict(float)
+
+    def inc(self, labels: tuple, value: float = 1):
+        self._values[labels] += value
+
+    def render(self, label_names):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            series = f"{{{_labels(label_names, labels)}}}" if label_names else ""
+            lines.append(f"{self.name}{series} {value}")
+        return lines
+
+
+def _labels(names, values) -> str:
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class Registry:
+    """The request metrics, labelled by method and route template."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter("devoptics_http_requests_total", "HTTP requests by status code.")
+        self.latency = Histogram(
+            "devoptics_http_request_duration_seconds", "Request latency.", LATENCY_BUCKETS
+        )
+        self.queries = Histogram(
+            "devoptics_db_queries_per_request", "SQL statements executed per request.", QUERY_COUNT_BUCKETS
+        )
+        self.db_time = Counter("devoptics_db_seconds_total", "Time spent executing SQL.")
+        self.serialization = Histogram(
+            "devoptics_serialization_duration_seconds",
+            "Time from the endpoint returning to the response being built.",
+            LATENCY_BUCKETS,
+        )
+        self.slow_queries = Counter("devoptics_db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.")
+
+    def record(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats,
+               serialization: Optional[float]):
+        labels = (method, route)
+        with self._lock:
+            self.requests.inc((method, route, str(status)))
+            self.latency.observe(labels, elapsed)
+            self.queries.observe(labels, stats.queries)
+            self.db_time.inc(labels, stats.db_time)
+            if serialization is not None:
+                self.serialization.observe(labels, serialization)
+
+    def render(self) -> str:
+        route_labels = ("method", "route")
+        with self._lock:
+            lines = (
+                self.requests.render(("method", "route", "status"))
+                + self.latency.render(route_labels)
+                + self.queries.render(route_labels)
+                + self.db_time.render(route_labels)
+                + self.serialization.render(route_labels)
+                + self.slow_queries.render(())
+            )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# --- SQL instrumentation ---
+
+def instrument(engine):
+    """Count and time statements on ``engine`` (a sync Engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    if 0 <= SLOW_QUERY_MS <= elapsed * 1000:
+        with registry._lock:
+            registry.slow_queries.inc(())
+        params = repr(parameters)
+        if len(params) > 1000:
+            params = params[:1000] + "..."
+        slow_query_log.warning("%.1f ms: %s; parameters: %s", elapsed * 1000, " ".join(statement.split()), params)
+
+
+# --- Requests ---
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        handler_done = None
+
+        async def send_wrapper(message):
+            nonlocal status, handler_done
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                handler_done = time.perf_counter()
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            serialization = None
+            if stats.endpoint_done is not None and handler_done is not None:
+                serialization = max(handler_done - stats.endpoint_done, 0.0)
+            registry.record(scope["method"], path, status, elapsed, stats, serialization)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that notes when its endpoint function returns."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed(endpoint), **kwargs)
+
+
+def _timed(endpoint):
+    def done():
+        stats = _current.get()
+        if stats is not None:
+            stats.endpoint_done = time.perf_counter()
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                done()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                done()
+    return wrapper
@@ -1,10 +1,10 @@
 from sqlalchemy import (
     Column, Integer, String, Date, DateTime,
-    Text, Enum, ForeignKey, Boolean
+    Text, Enum, ForeignKey, Boolean, Index, JSON, literal_column
 )
-from sqlalchemy.dialects.sqlite import JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 import enum
+import re
 
 from database import Base
 
@@ -15,6 +15,54 @@ class CategoryEnum(str, enum.Enum):
     refactoring = "refactoring"
     breaking = "breaking"
 
+# Semantic-version sort key: (major, minor, patch, release, prerelease).
+# A leading "v" and missing minor / patch parts are accepted and build
+# metadata ("+...") is ignored. release is 1 for a final release so that
+# 1.0.0-rc.1 sorts before 1.0.0; prereleases of one version are ordered by
+# prerelease_key(). Version strings that don't parse have no key (all NULL).
+SEMVER = re.compile(r"^\s*v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?\s*$")
+SEMVER_FIELDS = ("semver_major", "semver_minor", "semver_patch", "semver_release", "semver_pre")
+
+def prerelease_key(pre: str) -> str:
+    """A string whose (binary) order is SemVer precedence for ``pre``.
+
+    Numeric identifiers become "0" + a two-digit length + the number, so
+    rc.2 < rc.10 and numbers sort before words ("1" + the identifier).
+    Identifiers are joined with a space, which sorts below every identifier
+    character, so alpha < alpha.1 < alpha-x.
+    """
+    return " ".join(
+        f"0{len(str(int(part))):02d}{int(part)}" if part.isdigit() else f"1{part}"
+        for part in pre.split(".")
+    ) if pre else ""
+
+def semver_key(version):
+    match = SEMVER.match(version or "")
+    if not match:
+        return None
+    major, minor, patch, pre = match.groups()
+    return (int(major), int(minor or 0), int(patch or 0), 0 if pre else 1, prerelease_key(pre))
+
+def semver_values(version) -> dict:
+    """The Version sort columns for ``version``."""
+    return dict(zip(SEMVER_FIELDS, semver_key(version) or (None,) * len(SEMVER_FIELDS)))
+
+# Index for keyset pages (pagination.apply_keyset), which are ordered by
+# (key NULLS FIRST, id): ``columns`` end with the key and id. SQLite's
+# ascending order already puts NULLs first (and it rejects NULLS FIRST in
+# CREATE INDEX); PostgreSQL puts them last, so there the key is declared
+# NULLS FIRST for the index to match the ORDER BY. info["postgresql"] tells
+# alembic/env.py which of the two to compare.
+def keyset_index(name, *columns, **kw):
+    *leading, key, id_ = columns
+    return (
+        Index(name, *columns, info={"postgresql": False}, **kw).ddl_if(
+            callable_=lambda ddl, target, bind, dialect=None, **_: dialect.name != "postgresql"
+        ),
+        Index(name, *leading, literal_column(key).nulls_first(), id_, info={"postgresql": True}, **kw)
+        .ddl_if(dialect="postgresql"),
+    )
+
 class App(Base):
     __tablename__ = "apps"
     id          = Column(Integer, primary_key=True, index=True)
@@ -39,10 +87,45 @@ class Version(Base):
     delta_min   = Column(Integer)
     delta_pat   = Column(Integer)
     current     = Column(Boolean)
+    # Precomputed from ``version`` whenever it is set (see semver_key)
+    semver_major   = Column(Integer)
+    semver_minor   = Column(Integer)
+    semver_patch   = Column(Integer)
+    semver_release = Column(Integer)
+    semver_pre     = Column(String)
 
     app_obj     = relationship("App", back_populates="versions")
-    deployments = relationship("Deployment", back_populates="version_obj")
-    changes     = relationship("Change", back_populates="version_obj")
+    # Version numbers are only unique per app, so these join on both columns
+    deployments = relationship(
+        "Deployment",
+        back_populates="version_obj",
+        primaryjoin="and_(Version.app == foreign(Deployment.app), Version.version == foreign(Deployment.version))",
+        viewonly=True,
+        sync_backref=False,
+    )
+    changes     = relationship(
+        "Change",
+        back_populates="version_obj",
+        primaryjoin="and_(Version.app == foreign(Change.app), Version.version == foreign(Change.version))",
+        viewonly=True,
+        sync_backref=False,
+    )
+
+    __table_args__ = (
+        *keyset_index("ix_versions_dt_started_id", "dt_started", "id"),
+        Index("ix_versions_app_version_current", "app", "version", "current"),
+        Index("ix_versions_app_semver", "app", *SEMVER_FIELDS),
+    )
+
+    @validates("version")
+    def _set_semver(self, key, version):
+        for field, value in semver_values(version).items():
+            setattr(self, field, value)
+        return version
+
+    @classmethod
+    def semver_columns(cls):
+        return [getattr(cls, field) for field in SEMVER_FIELDS]
 
 class Milestone(Base):
     __tablename__ = "milestones"
@@ -65,11 +148,25 @@ class Deployment(Base):
     git_tag     = Column(Text)
     docker_tag  = Column(Text)
     change_log  = Column(Text)
+    # When the deployment_changes manifest was written; NULL until backfilled
+    manifest_at = Column(DateTime)
 
     app_obj     = relationship("App", back_populates="deployments")
-    version_obj = relationship("Version", back_populates="deployments")
+    version_obj = relationship(
+        "Version",
+        back_populates="deployments",
+        primaryjoin="and_(Version.app == foreign(Deployment.app), Version.version == foreign(Deployment.version))",
+        viewonly=True,
+        sync_backref=False,
+    )
     milestone_obj = relationship("Milestone", back_populates="deployments")
 
+    __table_args__ = (
+        *keyset_index("ix_deployments_dtt_deploy_id", "dtt_deploy", "id"),
+        Index("ix_deployments_milestone_app_version", "milestone", "app", "version"),
+        Index("ix_deployments_app_dtt_deploy_id", "app", "dtt_deploy", "id"),
+    )
+
 class Change(Base):
     __tablename__ = "changes"
     id           = Column(Integer, primary_key=True, index=True)
@@ -85,4 +182,85 @@ class Change(Base):
     archived_at  = Column(DateTime)
 
     app_obj      = relationship("App", back_populates="changes")
-    version_obj  = relationship("Version", back_populates="changes")
+    version_obj  = relationship(
+        "Version",
+        back_populates="changes",
+        primaryjoin="and_(Version.app == foreign(Change.app), Version.version == foreign(Change.version))",
+        viewonly=True,
+        sync_backref=False,
+    )
+
+    __table_args__ = (
+        *keyset_index("ix_changes_dtt_change_id", "dtt_change", "id"),
+        # Filtered /changes/ listings (app, version, archived) read straight off it in listing order
+        *keyset_index("ix_changes_app_version_archived", "app", "version", "archived", "dtt_change", "id"),
+        # /changes/?app= seeks to the app and reads it in listing order
+        *keyset_index("ix_changes_app_dtt_change_id", "app", "dtt_change", "id"),
+        # Covers the dashboard's per-app change counts
+        Index("ix_changes_app_category_archived", "app", "category", "archived"),
+        # Partial index for the default dashboard listing of unarchived changes;
+        # chosen once archived changes are a large share of the table
+        *keyset_index(
+            "ix_changes_unarchived_dtt_change_id", "dtt_change", "id",
+            sqlite_where=archived.is_(False),
+            postgresql_where=archived.is_(False),
+        ),
+    )
+
+class DeploymentChange(Base):
+    """Manifest row: ``change_id`` shipped with ``deployment_id`` (see manifests.py)."""
+    __tablename__ = "deployment_changes"
+    deployment_id = Column(Integer, ForeignKey("deployments.id"), primary_key=True)
+    change_id     = Column(Integer, ForeignKey("changes.id"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_deployment_changes_change_id", "change_id"),
+    )
+
+class Job(Base):
+    """Background job run by the worker pool in jobs.py.
+
+    ``status`` goes queued -> running -> succeeded, or back to queued (after
+    ``run_after``) for a retry, until ``max_attempts`` is spent and it is
+    failed.
+    """
+    __tablename__ = "jobs"
+    id           = Column(Integer, primary_key=True, index=True)
+    kind         = Column(String, nullable=False)
+    params       = Column(JSON)
+    status       = Column(String, nullable=False, default="queued", server_default="queued")
+    attempts     = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False, default=3, server_default="3")
+    progress     = Column(Integer, nullable=False, default=0, server_default="0")
+    total        = Column(Integer)
+    result       = Column(JSON)
+    error        = Column(Text)
+    locked_by    = Column(String)
+    run_after    = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    created_at   = Column(DateTime)
+    started_at   = Column(DateTime)
+    finished_at  = Column(DateTime)
+
+    __table_args__ = (
+        # The workers' claim query: next queued job that is due, oldest first
+        Index("ix_jobs_status_run_after_id", "status", "run_after", "id"),
+    )
+
+class Thumbnail(Base):
+    """A stored image (``<sha256>.<ext>``) whose thumbnail has been generated (see uploads.py)."""
+    __tablename__ = "thumbnails"
+    name        = Column(String, primary_key=True)
+    created_at  = Column(DateTime)
+
+class TableVersion(Base):
+    """Write counter per table, bumped in the same transaction as each write.
+
+    A table's counter is split over stripes; its version is their sum (see
+    crud.get_table_versions). Read endpoints derive their ETag from it.
+    """
+    __tablename__ = "table_versions"
+    name        = Column(String, primary_key=True)
+    stripe      = Column(Integer, primary_key=True, default=0, server_default="0")
+    version     = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at  = Column(DateTime)
@@ -0,0 +1,86 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Any, Callable, Optional, Sequence
+
+from sqlalchemy import and_, or_, tuple_
+
+# Keyset (cursor) pagination.
+#
+# A cursor is an opaque, url-safe token holding the sort key and id of the
+# last row of the previous page. The next page is fetched with
+# ``WHERE (key, id) > (:key, :id) ORDER BY key, id LIMIT n``, which walks the
+# matching index instead of counting past ``skip`` rows like OFFSET does.
+
+
+def _to_json(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(value: Any, row_id: int) -> str:
+    payload = json.dumps([_to_json(value), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, parse: Callable[[Any], Any] = lambda v: v):
+    """Return the ``(value, id)`` pair stored in a cursor.
+
+    Raises ValueError if the cursor was not produced by ``encode_cursor``.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(row_id, int):
+            raise TypeError(row_id)
+        return (parse(value) if value is not None else None), row_id
+    except (binascii.Error, TypeError, ValueError) as exc:
+        raise ValueError("Invalid pagination cursor") from exc
+
+
+def apply_keyset(query, sort_col, id_col, cursor: Optional[str] = None, parse=lambda v: v):
+    """Order ``query`` by ``(sort_col, id_col)`` and seek past ``cursor``.
+
+    NULL sort keys are ordered first so that they can be paged through as
+    well, which the (key, id) index has to match to be walked in order (see
+    models.keyset_index); ``sort_col`` may be None for tables that are only
+    keyed by id.
+    """
+    if sort_col is None:
+        query = query.order_by(id_col)
+        if cursor:
+            _, last_id = decode_cursor(cursor)
+            query = query.filter(id_col > last_id)
+        return query
+
+    query = query.order_by(sort_col.nulls_first(), id_col)
+    if cursor:
+        value, last_id = decode_cursor(cursor, parse)
+        if value is None:
+            query = query.filter(
+                or_(sort_col.isnot(None), and_(sort_col.is_(None), id_col > last_id))
+            )
+        else:
+            # Row-value comparison, so the planner seeks the (key, id) index
+            # rather than scanning it.
+            query = query.filter(tuple_(sort_col, id_col) > tuple_(value, last_id))
+    return query
+
+
+def next_cursor(rows: Sequence[Any], limit: int, sort_attr: Optional[str] = None) -> Optional[str]:
+    """Cursor for the page after ``rows``, or None when this was the last page."""
+    if not rows or len(rows) < limit:
+        return None
+    last = rows[-1]
+    value = getattr(last, sort_attr) if sort_attr else None
+    return encode_cursor(value, last.id)
+
+
+def parse_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+def parse_date(value: str) -> date:
+    return date.fromisoformat(value)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from models import CategoryEnum
 
 class AppBase(BaseModel):
@@ -17,6 +17,7 @@ class App(AppBase):
     id: int
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class VersionBase(BaseModel):
     version: str
@@ -35,6 +36,7 @@ class Version(VersionBase):
     id: int
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class DeploymentBase(BaseModel):
     dtt_deploy: datetime
@@ -52,6 +54,7 @@ class Deployment(DeploymentBase):
     id: int
     class Config:
         orm_mode = True
+        from_attributes = True
 
 class ChangeBase(BaseModel):
     app: str
@@ -72,6 +75,40 @@ class Change(ChangeBase):
     archived_at: Optional[datetime] = None
     class Config:
         orm_mode = True
+        from_attributes = True
+
+
+# ?include= expansions; relationship fields are only present when requested
+class AppExpanded(App):
+    versions: Optional[List[Version]] = None
+    deployments: Optional[List[Deployment]] = None
+    changes: Optional[List[Change]] = None
+
+class VersionExpanded(Version):
+    deployments: Optional[List[Deployment]] = None
+    changes: Optional[List[Change]] = None
+
+class ChangeSearchHit(Change):
+    rank: float
+    snippet: Optional[str] = None
+
+class ImageUpload(BaseModel):
+    filename: Optional[str] = None
+    url: str
+    thumbnail_url: Optional[str] = None
+    sha256: str
+    size: int
+    content_type: str
+    deduplicated: bool
+
+class BulkItemError(BaseModel):
+    index: int
+    errors: List[dict]
+
+class BulkResult(BaseModel):
+    inserted: int
+    ids: List[int]
+    errors: List[BulkItemError]
 
 
 class ChangeFilterOption(BaseModel):
@@ -94,3 +131,57 @@ class Milestone(MilestoneBase):
     id: int
     class Config:
         orm_mode = True
+        from_attributes = True
+
+class MilestoneExpanded(Milestone):
+    deployments: Optional[List[Deployment]] = None
+
+class ArchivePreviewItem(BaseModel):
+    app: str
+    version: str
+    changes: int
+
+class ArchivePreview(BaseModel):
+    milestone: str
+    versions: int
+    changes: int
+    by_version: List[ArchivePreviewItem]
+
+class DashboardDeployment(BaseModel):
+    version: Optional[str] = None
+    milestone: Optional[str] = None
+    dtt_deploy: Optional[datetime] = None
+
+class DashboardApp(BaseModel):
+    app: str
+    current_version: Optional[str] = None
+    last_deployment: Optional[DashboardDeployment] = None
+    changes_by_category: Dict[str, int]
+    changes_archived: int
+    changes_unarchived: int
+
+class DashboardSummary(BaseModel):
+    apps: List[DashboardApp]
+
+class JobCreate(BaseModel):
+    kind: str
+    params: Dict[str, Any] = {}
+    max_attempts: Optional[int] = None
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    progress: int
+    total: Optional[int] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    run_after: Optional[datetime] = None
+    class Config:
+        orm_mode = True
+        from_attributes = True
@@ -0,0 +1,137 @@
+"""Full-text search over change titles and descriptions.
+
+SQLite uses an external-content FTS5 table, ``changes_fts``, kept in sync
+with ``changes`` by triggers. Postgres uses a GIN index on the same
+tsvector expression the search query uses. Both are created by ``install``
+(called at startup next to ``create_all``) and by the Alembic migration.
+"""
+from sqlalchemy import column, desc, func, literal_column, select, table
+
+import models
+
+changes_fts = table("changes_fts", column("rowid"))
+
+# Must match the GIN index expression exactly for Postgres to use the index
+PG_DOCUMENT = (
+    "to_tsvector('english', coalesce(changes.change_title, '') || ' ' || "
+    "coalesce(changes.change_desc, ''))"
+)
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS changes_fts USING fts5(
+        change_title, change_desc, content='changes', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_fts_ai AFTER INSERT ON changes BEGIN
+        INSERT INTO changes_fts(rowid, change_title, change_desc)
+        VALUES (new.id, new.change_title, new.change_desc);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_fts_ad AFTER DELETE ON changes BEGIN
+        INSERT INTO changes_fts(changes_fts, rowid, change_title, change_desc)
+        VALUES ('delete', old.id, old.change_title, old.change_desc);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS changes_fts_au AFTER UPDATE OF change_title, change_desc ON changes BEGIN
+        INSERT INTO changes_fts(changes_fts, rowid, change_title, change_desc)
+        VALUES ('delete', old.id, old.change_title, old.change_desc);
+        INSERT INTO changes_fts(rowid, change_title, change_desc)
+        VALUES (new.id, new.change_title, new.change_desc);
+    END
+    """,
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_changes_fts ON changes USING GIN ({PG_DOCUMENT.replace('changes.', '')})",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS changes_fts_au",
+    "DROP TRIGGER IF EXISTS changes_fts_ad",
+    "DROP TRIGGER IF EXISTS changes_fts_ai",
+    "DROP TABLE IF EXISTS changes_fts",
+]
+
+POSTGRES_DROP = ["DROP INDEX IF EXISTS ix_changes_fts"]
+
+
+def install(connection):
+    """Create the search index for the connection's backend if it is missing."""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'changes_fts'"
+        ).first()
+        for ddl in SQLITE_DDL:
+            connection.exec_driver_sql(ddl)
+        if not exists:
+            # Index the rows written before the triggers existed
+            connection.exec_driver_sql("INSERT INTO changes_fts(changes_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        for ddl in POSTGRES_DDL:
+            connection.exec_driver_sql(ddl)
+
+
+def uninstall(connection):
+    statements = {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}.get(connection.dialect.name, [])
+    for ddl in statements:
+        connection.exec_driver_sql(ddl)
+
+
+def fts5_query(q: str) -> str:
+    """Turn free text into an FTS5 query matching all terms.
+
+    Each term is quoted so that punctuation and FTS5 operators in user input
+    cannot cause syntax errors.
+    """
+    terms = [term.replace('"', '""') for term in q.split()]
+    return " ".join(f'"{term}"' for term in terms)
+
+
+def statement(dialect: str, q: str):
+    """Select ``(Change, rank, snippet)`` rows matching ``q``, best match first.
+
+    Raises ValueError when ``q`` has no terms (an empty FTS5 MATCH is an error).
+    """
+    if not q.split():
+        raise ValueError("Search query must contain at least one term")
+    if dialect == "sqlite":
+        return (
+            select(
+                models.Change,
+                func.bm25(literal_column("changes_fts")).label("rank"),
+                func.snippet(literal_column("changes_fts"), -1, "<b>", "</b>", "…", 16).label("snippet"),
+            )
+            .join(changes_fts, changes_fts.c.rowid == models.Change.id)
+            .where(literal_column("changes_fts").op("MATCH")(fts5_query(q)))
+            # bm25() is lower for better matches
+            .order_by("rank", models.Change.id)
+        )
+    if dialect == "postgresql":
+        document = literal_column(PG_DOCUMENT)
+        query = func.websearch_to_tsquery("english", q)
+        return (
+            select(
+                models.Change,
+                func.ts_rank(document, query).label("rank"),
+                func.ts_headline(
+                    "english",
+                    func.coalesce(models.Change.change_title, "") + " " + func.coalesce(models.Change.change_desc, ""),
+                    query,
+                    "StartSel=<b>, StopSel=</b>, MaxFragments=1",
+                ).label("snippet"),
+            )
+            .where(document.op("@@")(query))
+            .order_by(desc("rank"), models.Change.id)
+        )
+    # No full-text support: fall back to a substring scan
+    pattern = f"%{q}%"
+    return (
+        select(models.Change, literal_column("0.0").label("rank"), models.Change.change_title.label("snippet"))
+        .where(models.Change.change_title.ilike(pattern) | models.Change.change_desc.ilike(pattern))
+        .order_by(models.Change.id)
+    )
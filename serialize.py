@@ -0,0 +1,96 @@
+"""Fast JSON encoding for large list responses.
+
+List endpoints normally return ORM objects that FastAPI validates against
+their response_model field by field before encoding. On the fast path the
+query selects just the schema's columns, and the rows, which come straight
+from the database and need no re-validation, are encoded directly to JSON
+bytes. The response_model stays on the route, so the OpenAPI schema does
+not change.
+
+orjson is used when installed, the standard json module otherwise.
+RESPONSE_SERIALIZATION=pydantic switches the fast JSON path off.
+
+Clients that send ``Accept: application/msgpack`` get MessagePack instead
+when the ``msgpack`` package is installed (dates and enums are encoded as
+in JSON).
+"""
+import enum
+import json
+import os
+from datetime import date, datetime
+
+try:
+    import orjson  # optional dependency
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack  # optional dependency
+except ImportError:
+    msgpack = None
+
+FAST = os.getenv("RESPONSE_SERIALIZATION", "fast") == "fast"
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+
+def columns(model, schema):
+    """``model``'s columns for ``schema``'s fields, in the order the schema emits them."""
+    return [getattr(model, name) for name in schema.__fields__]
+
+
+def _default(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def as_dicts(rows) -> list:
+    # Much cheaper than Row._asdict() per row
+    if not rows or isinstance(rows[0], dict):
+        return list(rows)
+    keys = rows[0]._fields
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def rows_json(rows) -> bytes:
+    """Encode result rows (or mappings) as a JSON array of objects."""
+    return dumps(as_dicts(rows))
+
+
+def negotiate(accept: str) -> str:
+    """``"msgpack"`` if the Accept header prefers MessagePack and it is available, else ``"json"``."""
+    if msgpack is None or not accept:
+        return "json"
+    weights = {}
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[media_type.strip().lower()] = q
+    msgpack_q = max(weights.get(t, 0.0) for t in MSGPACK_TYPES)
+    json_q = max(weights.get(JSON_TYPE, 0.0), weights.get("application/*", 0.0), weights.get("*/*", 0.0))
+    return "msgpack" if msgpack_q > 0 and msgpack_q >= json_q else "json"
+
+
+def encode_rows(rows, fmt: str):
+    """Return ``(body, media_type)`` for rows in the negotiated format."""
+    if fmt == "msgpack":
+        return msgpack.packb(as_dicts(rows), default=_default, datetime=False), MSGPACK_TYPE
+    return rows_json(rows), JSON_TYPE
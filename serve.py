@@ -0,0 +1,116 @@
+"""Production entry point: uvicorn with a pool of worker processes.
+
+    python serve.py --workers 4 --port 8000
+
+Every option can also be set through the environment (WEB_WORKERS,
+WEB_PORT, ...). The schema is created once here, before the workers start,
+so they do not race to create it. The uvicorn supervisor starts each worker
+as a fresh interpreter; it restarts workers that die and, with
+--max-requests, recycles them. Fork-based servers such as
+``gunicorn --preload -k uvicorn.workers.UvicornWorker main:app`` also work:
+database.py drops inherited pool connections in the child after a fork.
+
+On SIGTERM / SIGINT each worker stops accepting connections, lets
+in-flight requests finish for up to --graceful-timeout seconds, then
+cancels what is left. Open /events streams count as in flight, so they are
+cut at the timeout and EventSource clients reconnect on their own.
+
+With more than one worker, set EVENTS_BACKEND=redis: the default
+``memory`` backend only delivers a write to /events clients of the worker
+that handled it. CACHE_BACKEND=redis is recommended too. A ``memory`` cache
+stays correct, because entries are keyed by the table write counters, but
+every worker fills and holds its own copy. With either backend left at
+``memory`` and several workers, a warning is logged at startup.
+"""
+import argparse
+import logging
+import os
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+def _env(name: str, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return type(default)(value) if default is not None else value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=_env("WEB_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env("WEB_PORT", 1337))
+    parser.add_argument("--workers", type=int, default=_env("WEB_WORKERS", os.cpu_count() or 1),
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--keep-alive", type=int, default=_env("WEB_KEEPALIVE", 5),
+                        help="seconds an idle keep-alive connection is held open")
+    parser.add_argument("--backlog", type=int, default=_env("WEB_BACKLOG", 2048),
+                        help="pending connections queued by the listening socket")
+    parser.add_argument("--loop", choices=["auto", "asyncio", "uvloop"], default=_env("WEB_LOOP", "auto"),
+                        help="event loop; auto uses uvloop when installed")
+    parser.add_argument("--http", choices=["auto", "h11", "httptools"], default=_env("WEB_HTTP", "auto"),
+                        help="HTTP parser; auto uses httptools when installed")
+    parser.add_argument("--graceful-timeout", type=int, default=_env("WEB_GRACEFUL_TIMEOUT", 30),
+                        help="seconds to drain in-flight requests on shutdown")
+    parser.add_argument("--max-requests", type=int, default=_env("WEB_MAX_REQUESTS", 0),
+                        help="recycle a worker after this many requests (0: never)")
+    parser.add_argument("--forwarded-allow-ips", default=_env("WEB_FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="proxies trusted for X-Forwarded-* headers")
+    parser.add_argument("--access-log", action=argparse.BooleanOptionalAction,
+                        default=_env("WEB_ACCESS_LOG", "1") not in ("0", "false", "no", "off"))
+    return parser.parse_args(argv)
+
+
+def check_backends(workers: int):
+    """Warn about per-process backends that don't work across ``workers`` processes."""
+    import cache
+    import events
+
+    if workers <= 1:
+        return
+    if events.EVENTS_BACKEND == "memory":
+        logger.warning(
+            "EVENTS_BACKEND=memory with %d workers: /events clients only see writes handled by "
+            "their own worker. Set EVENTS_BACKEND=redis (and EVENTS_REDIS_URL) or run one worker.",
+            workers,
+        )
+    if cache.CACHE_BACKEND == "memory":
+        logger.warning(
+            "CACHE_BACKEND=memory with %d workers: each worker fills and holds its own cache. "
+            "Set CACHE_BACKEND=redis (and CACHE_REDIS_URL) to share one.",
+            workers,
+        )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Create the schema, search index and write counters once in the parent
+    import database
+    import main as _app  # noqa: F401
+
+    database.engine.dispose()
+    check_backends(args.workers)
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=args.loop,
+        http=args.http,
+        timeout_keep_alive=args.keep_alive,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        limit_max_requests_jitter=args.max_requests // 10,
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        access_log=args.access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()
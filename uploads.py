@@ -0,0 +1,192 @@
+"""Content-addressed image storage.
+
+The upload route caps the request body (limited(), checked as it streams
+in, before any of it is spooled to disk). Uploads are copied to a
+temporary file in chunks while being hashed, then
+renamed to ``static/images/<sha256>.<ext>``; an image that is already stored
+is not written again. The type is taken from the file's magic bytes, not
+from the client's filename or Content-Type.
+
+Thumbnails (``static/images/thumbs/<sha256>.<ext>``) are generated by a
+background worker when Pillow is installed; without it uploads still work
+and the thumbnail variant falls back to the original. Each generated
+thumbnail is recorded in the ``thumbnails`` table, so readers look it up
+with one query per page instead of checking the file system, and its write
+counter changes the ETag of the routes that serve thumbnail URLs.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Collection, Optional
+
+import database
+import models
+import schemas
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = "static"
+IMAGE_DIR = os.path.join(STATIC_DIR, "images")
+THUMB_DIR = os.path.join(IMAGE_DIR, "thumbs")
+IMAGE_URL = "/static/images"
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+CHUNK_SIZE = 64 * 1024
+
+# (magic prefix, extension, content type)
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+]
+
+
+# Room for the multipart boundaries and part headers around the image
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+async def limited(stream: AsyncIterator[bytes], limit: int = MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES):
+    """Pass ``stream`` through, raising UploadTooLarge once it exceeds ``limit`` bytes."""
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLarge(f"Image exceeds the {MAX_UPLOAD_BYTES} byte limit")
+        yield chunk
+
+
+def sniff(head: bytes):
+    """Return ``(extension, content_type)`` for a supported image, else None."""
+    for magic, ext, content_type in SIGNATURES:
+        if head.startswith(magic):
+            return ext, content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+def image_url(name: str) -> str:
+    return f"{IMAGE_URL}/{name}"
+
+
+def image_name(url: Optional[str]) -> Optional[str]:
+    """The stored file name behind an image URL, or None for other URLs."""
+    if not url or not url.startswith(IMAGE_URL + "/"):
+        return None
+    name = url[len(IMAGE_URL) + 1:]
+    return None if "/" in name else name
+
+
+def thumbnail_url(url: Optional[str], thumbnails: Collection[str]) -> Optional[str]:
+    """The thumbnail variant of an image URL, or ``url`` if there is none (yet).
+
+    ``thumbnails`` holds the names with a generated thumbnail (crud.get_thumbnails).
+    """
+    name = image_name(url)
+    if name is None or name not in thumbnails:
+        return url
+    return f"{IMAGE_URL}/thumbs/{name}"
+
+
+def store(src: BinaryIO, filename: Optional[str] = None) -> schemas.ImageUpload:
+    """Copy ``src`` into the image store; blocking, run it in a thread.
+
+    Raises UploadTooLarge above MAX_UPLOAD_BYTES and ValueError for files
+    that are not a supported image type.
+    """
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    kind = None
+    fd, tmp_path = tempfile.mkstemp(dir=IMAGE_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if kind is None:
+                    kind = sniff(chunk)
+                    if kind is None:
+                        raise ValueError("Unsupported image type; expected PNG, JPEG, GIF or WebP")
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"Image exceeds the {MAX_UPLOAD_BYTES} byte limit")
+                digest.update(chunk)
+                out.write(chunk)
+        if kind is None:
+            raise ValueError("Empty upload")
+        ext, content_type = kind
+        name = f"{digest.hexdigest()}.{ext}"
+        path = os.path.join(IMAGE_DIR, name)
+        created = not os.path.exists(path)
+        if created:
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if _pillow_available() and not os.path.exists(os.path.join(THUMB_DIR, name)):
+        _thumbnailer.submit(make_thumbnail, name)
+    return schemas.ImageUpload(
+        filename=filename,
+        url=image_url(name),
+        thumbnail_url=f"{IMAGE_URL}/thumbs/{name}" if _pillow_available() else None,
+        sha256=digest.hexdigest(),
+        size=size,
+        content_type=content_type,
+        deduplicated=not created,
+    )
+
+
+# --- Thumbnails ---
+
+_thumbnailer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnailer")
+
+
+def _pillow_available() -> bool:
+    try:
+        import PIL  # optional dependency
+    except ImportError:
+        return False
+    return True
+
+
+def make_thumbnail(name: str):
+    """Write a downscaled copy of ``name``, keeping its aspect ratio and format."""
+    from PIL import Image
+
+    os.makedirs(THUMB_DIR, exist_ok=True)
+    target = os.path.join(THUMB_DIR, name)
+    fd, tmp_path = tempfile.mkstemp(dir=THUMB_DIR, prefix=".thumb-")
+    try:
+        with Image.open(os.path.join(IMAGE_DIR, name)) as image, os.fdopen(fd, "wb") as out:
+            fmt = image.format
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            if fmt == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(out, format=fmt, optimize=True)
+        os.replace(tmp_path, target)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    try:
+        with database.SessionLocal() as db:
+            db.merge(models.Thumbnail(name=name, created_at=datetime.utcnow()))
+            db.commit()
+    except Exception:
+        logger.exception("Recording the thumbnail of %s failed", name)